@@ -0,0 +1,201 @@
+from collections import defaultdict
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+from dkstudio import shop_storage
+
+# in memory index of the etsy listings and gumroad products in shop_storage
+
+
+MUG_PRESS_TAG = "cricut mug press svg"
+
+
+class ListingRecord(NamedTuple):
+    listing_id: str
+    title: str
+    skus: Tuple[str, ...]
+    tags: FrozenSet[str]
+
+    @property
+    def is_mug_press(self) -> bool:
+        return MUG_PRESS_TAG in self.tags
+
+    def names(self):
+        """
+        Product folder names that map directly to this listing
+        """
+        for sku in self.skus:
+            yield sku
+            if self.is_mug_press:
+                yield sku + " Mug"
+                yield sku + " Mug Press"
+        yield self.title
+
+
+def listing_record(product: dict) -> ListingRecord:
+    return ListingRecord(
+        listing_id=str(product["listing_id"]),
+        title=product["title"],
+        skus=tuple(product.get("skus") or ()),
+        tags=frozenset(map(lambda x: x.lower(), product.get("tags") or ())),
+    )
+
+
+def gumroad_record(product: dict) -> ListingRecord:
+    return ListingRecord(
+        listing_id=str(product["id"]),
+        title=product["name"],
+        skus=tuple(product.get("skus") or ()),
+        tags=frozenset(map(lambda x: x.lower(), product.get("tags") or ())),
+    )
+
+
+class ProductCatalog:
+    """
+    Listings loaded once from storage with SKU/title/tag/mapped lookups
+
+    Kept current with add/remove as the catalog sync writes pages
+    """
+
+    def __init__(self, to_record: Callable[[dict], ListingRecord] = listing_record):
+        self.to_record = to_record
+        self.listings: Dict[str, ListingRecord] = {}
+        # product folder name -> listing_id
+        self.lookups: Dict[str, str] = {}
+        self.by_sku: Dict[str, str] = {}
+        self.by_title: Dict[str, str] = {}
+        self.by_tag: Dict[str, Set[str]] = defaultdict(set)
+        # listings already associated with a product folder
+        self.mapped: Set[str] = set()
+
+    @classmethod
+    def load(
+        cls,
+        namespace: str = "products",
+        mapped_namespace: str = "etsy-product-dir",
+        to_record: Callable[[dict], ListingRecord] = listing_record,
+    ) -> "ProductCatalog":
+        catalog = cls(to_record)
+        for listing_id, product in shop_storage.select_many(namespace):
+            catalog.add(product)
+        catalog.mapped.update(shop_storage.select_keys(mapped_namespace))
+        return catalog
+
+    @classmethod
+    def load_gumroad(cls) -> "ProductCatalog":
+        return cls.load("gumroad-products", "gumroad-product-dir", gumroad_record)
+
+    def add(self, product: dict) -> ListingRecord:
+        record = self.to_record(product)
+        self.remove(record.listing_id)
+        self.listings[record.listing_id] = record
+        for name in record.names():
+            self.lookups[name] = record.listing_id
+        for sku in record.skus:
+            self.by_sku[sku] = record.listing_id
+        self.by_title[record.title] = record.listing_id
+        for tag in record.tags:
+            self.by_tag[tag].add(record.listing_id)
+        return record
+
+    def remove(self, listing_id: str):
+        record = self.listings.pop(str(listing_id), None)
+        if record is None:
+            return
+        for index, keys in (
+            (self.lookups, record.names()),
+            (self.by_sku, record.skus),
+            (self.by_title, [record.title]),
+        ):
+            for key in keys:
+                # another listing may have claimed the same name since
+                if index.get(key) == record.listing_id:
+                    del index[key]
+        for tag in record.tags:
+            self.by_tag[tag].discard(record.listing_id)
+
+    def mark_mapped(self, listing_id: str):
+        self.mapped.add(str(listing_id))
+
+    def is_mapped(self, listing_id: str) -> bool:
+        return str(listing_id) in self.mapped
+
+    def lookup(self, product_name: str) -> Optional[str]:
+        return self.lookups.get(product_name)
+
+    def get(self, listing_id: str) -> Optional[ListingRecord]:
+        return self.listings.get(str(listing_id))
+
+    def tagged(self, tag: str) -> List[ListingRecord]:
+        return [self.listings[i] for i in self.by_tag.get(tag.lower(), ())]
+
+    def unmapped(self) -> List[ListingRecord]:
+        return [r for i, r in self.listings.items() if i not in self.mapped]
+
+    def __contains__(self, listing_id) -> bool:
+        return str(listing_id) in self.listings
+
+    def __len__(self) -> int:
+        return len(self.listings)
+
+
+def persist_changed(
+    listings: list,
+    catalog: ProductCatalog = None,
+    namespace: str = "products",
+    key: str = "listing_id",
+) -> list:
+    """
+    Persist the listings that differ from storage, returns the changed ones
+    """
+    ids = [str(p[key]) for p in listings]
+    stored = dict(shop_storage.select_many(namespace, ids))
+    changed = [p for i, p in zip(ids, listings) if stored.get(i) != p]
+    shop_storage.persist_many(namespace, [(str(p[key]), p) for p in changed])
+    if catalog is not None:
+        for p in changed:
+            catalog.add(p)
+    return changed
+
+
+class SkuIndex:
+    """
+    The listing carrying a product on each store, joined by SKU or name
+    """
+
+    def __init__(self, catalogs: Dict[str, ProductCatalog]):
+        self.catalogs = catalogs
+
+    @classmethod
+    def load(cls) -> "SkuIndex":
+        return cls(
+            {"etsy": ProductCatalog.load(), "gumroad": ProductCatalog.load_gumroad()}
+        )
+
+    def by_sku(self, sku: str) -> Dict[str, str]:
+        return {
+            store: catalog.by_sku[sku]
+            for store, catalog in self.catalogs.items()
+            if sku in catalog.by_sku
+        }
+
+    def resolve(
+        self, product_name: str, known: Dict[str, str] = None
+    ) -> Dict[str, str]:
+        """
+        Listing ids by store for a product folder name
+
+        known listings (ie the etsy_listing_id of a mapped folder) lend their
+        SKUs to find the product on the other stores
+        """
+        found = dict(known or {})
+        for store, catalog in self.catalogs.items():
+            if store not in found:
+                listing_id = catalog.lookup(product_name)
+                if listing_id:
+                    found[store] = listing_id
+        for store, listing_id in list(found.items()):
+            record = self.catalogs[store].get(listing_id)
+            for sku in record.skus if record else ():
+                for other, other_id in self.by_sku(sku).items():
+                    found.setdefault(other, other_id)
+        return found
@@ -0,0 +1,169 @@
+import asyncio
+import os
+from collections import deque
+
+import httpx
+
+from dkstudio.etsy.client import API_URL, EtsyClient, default_client
+from dkstudio.marketplace import (
+    MAX_RETRIES,
+    error_message,
+    retry_delay,
+    should_retry,
+)
+
+# Etsy caps page sizes at 100
+PAGE_LIMIT = 100
+
+
+def default_concurrency() -> int:
+    return int(os.environ.get("ETSY_CONCURRENCY", 4))
+
+
+class AsyncEtsyClient:
+    """
+    asyncio Etsy client sharing the auth, limiter and error handling of the sync client
+
+    Only the sending is its own, httpx requests can't go through the
+    requests session of MarketplaceClient.send
+
+    Create it inside a running event loop
+    """
+
+    def __init__(
+        self,
+        concurrency: int = None,
+        sync_client: EtsyClient = None,
+    ):
+        self.concurrency = concurrency or default_concurrency()
+        self.sync_client = sync_client or default_client()
+        # shares the request budget with the sync client
+        self.limiter = self.sync_client.limiter
+        self.http = httpx.AsyncClient(
+            base_url=API_URL,
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            ),
+            timeout=30,
+        )
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.refresh_lock = asyncio.Lock()
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    async def send(self, path, params: dict, headers: dict):
+        for attempt in range(MAX_RETRIES + 1):
+            async with self.semaphore:
+                wait = self.limiter.reserve()
+                if wait:
+                    await asyncio.sleep(wait)
+                try:
+                    response = await self.http.get(path, params=params, headers=headers)
+                except httpx.TransportError as e:
+                    # connection failures and timeouts, a GET is safe to repeat
+                    if attempt == MAX_RETRIES:
+                        raise
+                    error, response = e, None
+            if response is None:
+                delay = retry_delay({}, attempt)
+                print(f"GET {path} failed ({error!r}), retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            self.limiter.update_from_headers(response.headers)
+            if not should_retry("GET", response.status_code) or attempt == MAX_RETRIES:
+                return response
+            delay = retry_delay(response.headers, attempt)
+            print(f"GET {path} returned {response.status_code}, retry in {delay:.1f}s")
+            if response.status_code == 429:
+                self.limiter.pause(delay)
+            await asyncio.sleep(delay)
+
+    async def refresh_token(self, stale_headers: dict):
+        async with self.refresh_lock:
+            # the sync client skips the refresh if another caller already did it
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                None, self.sync_client.refresh_token, stale_headers
+            )
+
+    async def headers(self) -> dict:
+        # loading or refreshing the token is a blocking request, keep it off the loop
+        headers = self.sync_client.cached_headers()
+        if headers is None:
+            loop = asyncio.get_running_loop()
+            headers = await loop.run_in_executor(None, self.sync_client.headers)
+        return headers
+
+    async def get(self, path, **params):
+        for attempt in range(2):
+            headers = await self.headers()
+            response = await self.send(path.lstrip("/"), params, headers)
+            if response.is_success:
+                return response.json()
+            message = error_message(response)
+            if attempt or not self.sync_client.is_expired(response, message):
+                break
+            await self.refresh_token(headers)
+        print("GET", path, response.status_code)
+        print(message)
+        raise self.sync_client.error(response, message)
+
+    async def paginate(self, path, limit: int = PAGE_LIMIT, **params):
+        """
+        Fetch the first page, then the remaining offsets concurrently, yielding pages in order
+        """
+        message = await self.get(path, limit=limit, **params)
+        yield message
+        count = message["count"]
+        step = len(message["results"])
+        if not step:
+            return
+        offsets = iter(range(step, count, step))
+        # keep a bounded window of requests in flight ahead of the consumer
+        window = deque()
+
+        def fill():
+            while len(window) < self.concurrency * 2:
+                offset = next(offsets, None)
+                if offset is None:
+                    return
+                window.append(
+                    asyncio.ensure_future(
+                        self.get(path, limit=limit, offset=offset, **params)
+                    )
+                )
+
+        fill()
+        try:
+            while window:
+                message = await window.popleft()
+                fill()
+                yield message
+        finally:
+            for task in window:
+                task.cancel()
+
+
+def paginate_concurrently(path, concurrency: int = None, **params):
+    """
+    Iterate the pages of an Etsy collection fetched by AsyncEtsyClient
+    """
+    loop = asyncio.new_event_loop()
+
+    async def create_client():
+        return AsyncEtsyClient(concurrency)
+
+    client = loop.run_until_complete(create_client())
+    pages = client.paginate(path, **params)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(pages.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(pages.aclose())
+        loop.run_until_complete(client.aclose())
+        loop.close()
@@ -1,39 +1,50 @@
 import json
 import os
 import secrets
-from authlib.integrations.starlette_client import OAuth
-from authlib.oauth2.rfc7636 import create_s256_code_challenge
 import requests
-from starlette.applications import Starlette
-from starlette.middleware.sessions import SessionMiddleware
-from starlette.responses import HTMLResponse, RedirectResponse
-from starlette.config import Config
 
 from dkstudio import shop_storage
+from dkstudio.marketplace import token_expires_at
 
-app = Starlette(debug=True)
-app.add_middleware(
-    SessionMiddleware, secret_key=os.environ.get("SESSION_SECRET", "!secret")
-)
+# starlette and authlib load in create_app, only the authorize command needs them
 
 
-config = Config(".env")
-oauth = OAuth(config)
+def create_app():
+    """
+    Build the oauth login app, uvicorn calls this as a factory
+    """
+    from authlib.integrations.starlette_client import OAuth
+    from starlette.applications import Starlette
+    from starlette.config import Config
+    from starlette.middleware.sessions import SessionMiddleware
+
+    shop_storage.load_env()
+    app = Starlette(debug=True)
+    app.add_middleware(
+        SessionMiddleware, secret_key=os.environ.get("SESSION_SECRET", "!secret")
+    )
 
-oauth.register(
-    name="etsy",
-    client_id=os.environ["ETSY_CLIENT_ID"],
-    client_secret=os.environ["ETSY_CLIENT_SECRET"],
-    access_token_url="https://api.etsy.com/v3/public/oauth/token",
-    access_token_placement="uri",
-    authorize_url="https://www.etsy.com/oauth/connect",
-    api_base_url="https://openapi.etsy.com/v3",
-    client_kwargs={
-        "scope": "listings_r listings_w shops_r shops_w transactions_r email_r",
-    },
-)
+    config = Config(".env")
+    oauth = OAuth(config)
+
+    oauth.register(
+        name="etsy",
+        client_id=os.environ["ETSY_CLIENT_ID"],
+        client_secret=os.environ["ETSY_CLIENT_SECRET"],
+        access_token_url="https://api.etsy.com/v3/public/oauth/token",
+        access_token_placement="uri",
+        authorize_url="https://www.etsy.com/oauth/connect",
+        api_base_url="https://openapi.etsy.com/v3",
+        client_kwargs={
+            "scope": "listings_r listings_w shops_r shops_w transactions_r email_r",
+        },
+    )
 
-etsy = oauth.create_client("etsy")
+    app.state.etsy = oauth.create_client("etsy")
+    app.add_route("/login/etsy", login_via_etsy)
+    app.add_route("/auth/etsy", authorize_etsy)
+    app.add_route("/ready", ready)
+    return app
 
 
 def get_code_verifier():
@@ -41,13 +52,15 @@ def get_code_verifier():
 
 
 def get_code_challenge():
+    from authlib.oauth2.rfc7636 import create_s256_code_challenge
+
     code_verifier = get_code_verifier()
     code_challenge = create_s256_code_challenge(code_verifier)
     return code_challenge
 
 
-@app.route("/login/etsy")
 async def login_via_etsy(request):
+    etsy = request.app.state.etsy
     redirect_uri = request.url_for("authorize_etsy")
     code_challenge = get_code_challenge()
     return await etsy.authorize_redirect(
@@ -58,8 +71,9 @@ async def login_via_etsy(request):
     )
 
 
-@app.route("/auth/etsy")
 async def authorize_etsy(request):
+    from starlette.responses import RedirectResponse
+
     # fetch our API token
     code_verifier = get_code_verifier()
     redirect_uri = request.url_for("authorize_etsy")
@@ -109,13 +123,15 @@ async def authorize_etsy(request):
             "ETSY_ACCESS_TOKEN": access_token,
             "ETSY_REFRESH_TOKEN": refresh_token,
             "ETSY_USER_ID": user_id,
+            "ETSY_TOKEN_EXPIRES_AT": token_expires_at(token),
         }
     )
     return RedirectResponse(request.url_for("ready"))
 
 
-@app.route("/ready")
 async def ready(request):
+    from starlette.responses import HTMLResponse
+
     return HTMLResponse("ready")
 
 
@@ -129,8 +145,15 @@ def main():
     log.addHandler(logging.StreamHandler(sys.stdout))
     log.setLevel(logging.DEBUG)
 
+    shop_storage.load_env()
     host = os.environ.get("ETSY_AUTH_HOST", "localhost")
     port = int(os.environ.get("ETSY_AUTH_PORT", 8000))
     webbrowser.open(f"http://{host}:{port}/login/etsy")
 
-    uvicorn.run("dkstudio.etsy.authorize:app", host=host, port=port, reload=True)
+    uvicorn.run(
+        "dkstudio.etsy.authorize:create_app",
+        factory=True,
+        host=host,
+        port=port,
+        reload=True,
+    )
@@ -1,148 +1,120 @@
 import os
-import requests
-
+from functools import lru_cache
 
 from dkstudio import shop_storage
+from dkstudio.marketplace import (
+    MarketplaceClient,
+    RateLimiter,
+    offset_pages,
+    token_expires_at,
+)
 
+API_URL = "https://openapi.etsy.com/v3/"
+TOKEN_URL = "https://api.etsy.com/v3/public/oauth/token"
+EXPIRED_TOKEN = {
+    "error": "invalid_token",
+    "error_description": "access token is expired",
+}
 
-def refresh_token():
-    refresh_token = shop_storage.get("ETSY_REFRESH_TOKEN")
-    # TODO async
-    response = requests.post(
-        "https://api.etsy.com/v3/public/oauth/token",
-        {
-            "grant_type": "refresh_token",
-            "client_id": os.environ["ETSY_CLIENT_ID"],
-            "refresh_token": refresh_token,
-        },
+
+@lru_cache(1)
+def default_limiter() -> RateLimiter:
+    return RateLimiter(
+        float(os.environ.get("ETSY_RATE_LIMIT", 10)),
+        int(os.environ.get("ETSY_DAILY_LIMIT", 10000)),
     )
-    if not response.ok:
-        m = response.json()
-        raise RuntimeError(m.get("error"), m.get("error_description"))
-    token = response.json()
-    print(token)
-    access_token = token.get("access_token")
-    refresh_token = token.get("refresh_token")
-    user_id = access_token.split(".", 1)[0]
-    shop_storage.update(
-        {
-            "ETSY_ACCESS_TOKEN": access_token,
-            "ETSY_REFRESH_TOKEN": refresh_token,
-            "ETSY_USER_ID": user_id,
+
+
+def budget() -> dict:
+    """
+    Current request budget shared by every Etsy client in this process
+    """
+    return default_limiter().usage()
+
+
+class EtsyClient(MarketplaceClient):
+    """
+    Etsy API adapter of the shared marketplace transport
+    """
+
+    api_url = API_URL
+
+    def default_limiter(self) -> RateLimiter:
+        return default_limiter()
+
+    def auth_headers(self) -> dict:
+        access_token = shop_storage.get("ETSY_ACCESS_TOKEN")
+        assert access_token, 'Run "poetry run authorize-etsy"'
+        return {
+            "x-api-key": os.environ["ETSY_CLIENT_ID"],
+            "Authorization": f"Bearer {access_token}",
         }
-    )
 
+    def stored_expiry(self):
+        return shop_storage.get("ETSY_TOKEN_EXPIRES_AT")
+
+    def fetch_token(self):
+        refresh_token = shop_storage.get("ETSY_REFRESH_TOKEN")
+        response = self.session.post(
+            TOKEN_URL,
+            {
+                "grant_type": "refresh_token",
+                "client_id": os.environ["ETSY_CLIENT_ID"],
+                "refresh_token": refresh_token,
+            },
+        )
+        if not response.ok:
+            m = response.json()
+            raise RuntimeError(m.get("error"), m.get("error_description"))
+        token = response.json()
+        print(token)
+        access_token = token.get("access_token")
+        refresh_token = token.get("refresh_token")
+        user_id = access_token.split(".", 1)[0]
+        shop_storage.update(
+            {
+                "ETSY_ACCESS_TOKEN": access_token,
+                "ETSY_REFRESH_TOKEN": refresh_token,
+                "ETSY_USER_ID": user_id,
+                "ETSY_TOKEN_EXPIRES_AT": token_expires_at(token),
+            }
+        )
+
+    def is_expired(self, response, message) -> bool:
+        return message == EXPIRED_TOKEN
 
-def paginate(path):
-    message = get(path)
-    count = message["count"]
-    yield message
-    index = len(message["results"])
-    while index < count:
-        message = get(path, offset=index)
-        yield message
-        index += len(message["results"])
+    def paginate(self, path, **params):
+        return offset_pages(self.get, path, **params)
+
+
+@lru_cache(1)
+def default_client() -> EtsyClient:
+    return EtsyClient()
+
+
+def refresh_token():
+    default_client().refresh_token()
+
+
+def paginate(path, **params):
+    return default_client().paginate(path, **params)
 
 
 def get(path, **params):
-    access_token = shop_storage.get("ETSY_ACCESS_TOKEN")
-    assert access_token, 'Run "poetry run authorize-etsy"'
-    api_key = os.environ["ETSY_CLIENT_ID"]
-    url = f"https://openapi.etsy.com/v3/{path}"
-    response = requests.get(
-        url,
-        params=params,
-        headers={"x-api-key": api_key, "Authorization": f"Bearer {access_token}"},
-    )
-    message = response.json()
-    if not response.ok:
-        if message == {
-            "error": "invalid_token",
-            "error_description": "access token is expired",
-        }:
-            refresh_token()
-            return get(path, **params)
-        else:
-            # Run "poetry run authorize-etsy"
-            raise RuntimeError(message.get("error"), message.get("error_description"))
-    return message
-
-
-def post(path, data=None, json=None, files=None, **params):
-    access_token = shop_storage.get("ETSY_ACCESS_TOKEN")
-    assert access_token, 'Run "poetry run authorize-etsy"'
-    api_key = os.environ["ETSY_CLIENT_ID"]
-    url = f"https://openapi.etsy.com/v3/{path}"
-    response = requests.post(
-        url,
-        data=data,
-        json=json,
-        files=files,
-        params=params,
-        headers={"x-api-key": api_key, "Authorization": f"Bearer {access_token}"},
+    return default_client().get(path, **params)
+
+
+def post(path, data=None, json=None, files=None, headers=None, **params):
+    return default_client().post(
+        path, data=data, json=json, files=files, headers=headers, **params
     )
-    message = response.json()
-    if not response.ok:
-        if message == {
-            "error": "invalid_token",
-            "error_description": "access token is expired",
-        }:
-            refresh_token()
-            return post(path, data, files, **params)
-        else:
-            # Run "poetry run authorize-etsy"
-            print(response.status_code)
-            print(message)
-            raise RuntimeError(message.get("error"), message.get("error_description"))
-    return message
-
-
-def put(path, data=None, json=None, files=None, **params):
-    access_token = shop_storage.get("ETSY_ACCESS_TOKEN")
-    assert access_token, 'Run "poetry run authorize-etsy"'
-    api_key = os.environ["ETSY_CLIENT_ID"]
-    url = f"https://openapi.etsy.com/v3/{path}"
-    response = requests.post(
-        url,
-        data=data,
-        json=json,
-        files=files,
-        params=params,
-        headers={"x-api-key": api_key, "Authorization": f"Bearer {access_token}"},
+
+
+def put(path, data=None, json=None, files=None, headers=None, **params):
+    return default_client().put(
+        path, data=data, json=json, files=files, headers=headers, **params
     )
-    message = response.json()
-    if not response.ok:
-        if message == {
-            "error": "invalid_token",
-            "error_description": "access token is expired",
-        }:
-            refresh_token()
-            return put(path, data, files, **params)
-        else:
-            # Run "poetry run authorize-etsy"
-            raise RuntimeError(message.get("error"), message.get("error_description"))
-    return message
 
 
 def delete(path, **params):
-    access_token = shop_storage.get("ETSY_ACCESS_TOKEN")
-    assert access_token, 'Run "poetry run authorize-etsy"'
-    api_key = os.environ["ETSY_CLIENT_ID"]
-    url = f"https://openapi.etsy.com/v3/{path}"
-    response = requests.delete(
-        url,
-        params=params,
-        headers={"x-api-key": api_key, "Authorization": f"Bearer {access_token}"},
-    )
-    if not response.ok:
-        message = response.json()
-        if message == {
-            "error": "invalid_token",
-            "error_description": "access token is expired",
-        }:
-            refresh_token()
-            return delete(path, **params)
-        else:
-            # Run "poetry run authorize-etsy"
-            raise RuntimeError(message.get("error"), message.get("error_description"))
-    return None
+    return default_client().delete(path, **params)
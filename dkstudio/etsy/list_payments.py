@@ -1,27 +1,121 @@
+import os
+import time
+
 from dkstudio.etsy import client
+from dkstudio.etsy.async_client import PAGE_LIMIT, paginate_concurrently
 from dkstudio import shop_storage
 
+# config key holding the ingest checkpoint of each shop
+CHECKPOINT_KEY = "ETSY_RECEIPT_CHECKPOINT"
+
 
 def list_receipts(shop_id):
-    return client.paginate(f"/application/shops/{shop_id}/receipts")
+    return paginate_concurrently(f"/application/shops/{shop_id}/receipts")
+
+
+def get_checkpoint(shop_id) -> dict:
+    return (shop_storage.get(CHECKPOINT_KEY) or {}).get(str(shop_id), {})
+
+
+def set_checkpoint(shop_id, checkpoint: dict):
+    with shop_storage.batch():
+        checkpoints = dict(shop_storage.get(CHECKPOINT_KEY) or {})
+        checkpoints[str(shop_id)] = checkpoint
+        shop_storage.set(CHECKPOINT_KEY, checkpoints)
+
+
+def persist_receipts(receipts: list):
+    shop_storage.persist_many("receipts", [(str(r["receipt_id"]), r) for r in receipts])
+
+
+def modified_at(receipt: dict) -> int:
+    return receipt.get("updated_timestamp") or 0
+
+
+def ingest_receipts(shop_id, batch_size: int = 500, full: bool = False):
+    """
+    Store receipts modified since the last run, yielding each receipt
+
+    Pages are keyed on the last updated_timestamp seen instead of an offset,
+    a receipt modified mid-run moves ahead of the cursor rather than shifting
+    the receipts behind it. The cursor is checkpointed after every batch so a
+    killed run resumes where it stopped.
+    """
+    checkpoint = {} if full else get_checkpoint(shop_id)
+    # checkpoints from before keyset paging only kept a high_water
+    cursor = checkpoint.get("min_last_modified", checkpoint.get("high_water", 0))
+    # receipts already stored at the cursor, pages overlap on ties
+    at_cursor = set(checkpoint.get("at_cursor", ()))
+    offset = 0
+    batch = []
+
+    def flush():
+        persist_receipts(batch)
+        batch.clear()
+        set_checkpoint(
+            shop_id, {"min_last_modified": cursor, "at_cursor": sorted(at_cursor)}
+        )
+
+    while True:
+        params = {"limit": PAGE_LIMIT, "sort_on": "updated", "sort_order": "asc"}
+        if cursor:
+            params["min_last_modified"] = cursor
+        page = client.get(
+            f"/application/shops/{shop_id}/receipts", offset=offset, **params
+        )
+        results = page["results"]
+        fresh = [
+            r
+            for r in results
+            if modified_at(r) != cursor or str(r["receipt_id"]) not in at_cursor
+        ]
+        for r in fresh:
+            if modified_at(r) > cursor:
+                cursor = modified_at(r)
+                at_cursor = set()
+            at_cursor.add(str(r["receipt_id"]))
+        batch.extend(fresh)
+        if len(batch) >= batch_size:
+            flush()
+        yield from fresh
+        if len(results) < PAGE_LIMIT:
+            break
+        # a page of nothing but stored ties only moves on by offset
+        offset = 0 if fresh else offset + len(results)
+    flush()
 
 
 def main():
+    import argparse
     from pprint import pprint
-    import sys
-    import time
-
-    shop_id = sys.argv[1]
-
-    start = time.time()
-    for page in list_receipts(shop_id):
-        pprint(page)
-        
-        for receipt in page['results']:
-            shop_storage.persist('receipts', str(receipt['receipt_id']), receipt)
-        # read 1 page every 5 seconds
-        gap = time.time() - start
-        tts = 5 - gap
-        if tts > 0:
-            time.sleep(tts)
-        start = time.time()
+
+    shop_storage.load_env()
+    parser = argparse.ArgumentParser(description="Ingest etsy receipts into storage")
+    parser.add_argument("shop_id", nargs="?", default=os.environ.get("ETSY_SHOP_ID"))
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ignore the checkpoint and fetch every receipt",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        help="keep running, ingesting again every INTERVAL seconds",
+    )
+    parser.add_argument("--verbose", action="store_true", help="print every receipt")
+    args = parser.parse_args()
+    if not args.shop_id:
+        parser.error("no shop id given")
+
+    full = args.full
+    while True:
+        count = 0
+        for receipt in ingest_receipts(args.shop_id, full=full):
+            count += 1
+            if args.verbose:
+                pprint(receipt)
+        print(f"ingested {count} receipt(s), budget: {client.budget()}")
+        if not args.interval:
+            break
+        full = False
+        time.sleep(args.interval)
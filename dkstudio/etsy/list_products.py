@@ -1,24 +1,128 @@
+import os
+import time
+
 from dkstudio.etsy import client
+from dkstudio.etsy.async_client import PAGE_LIMIT, paginate_concurrently
 from dkstudio import shop_storage
+from dkstudio.catalog import ProductCatalog, persist_changed
+
+# config key holding the sync high-water mark of each shop
+SYNC_STATE_KEY = "ETSY_CATALOG_SYNC"
+# the listings endpoint only returns active listings unless asked for a state
+LISTING_STATES = ("active", "inactive", "sold_out", "draft", "expired")
+
+
+def full_sync_interval() -> float:
+    # seconds between full reconciliations that catch deleted listings
+    return float(os.environ.get("ETSY_FULL_SYNC_DAYS", 7)) * 24 * 60 * 60
+
+
+def list_products(shop_id, state: str = "active"):
+    return paginate_concurrently(f"/application/shops/{shop_id}/listings", state=state)
+
+
+def list_recently_updated_products(shop_id, state: str = "active"):
+    return client.paginate(
+        f"/application/shops/{shop_id}/listings",
+        limit=PAGE_LIMIT,
+        state=state,
+        sort_on="updated",
+        sort_order="desc",
+    )
+
+
+def modified_at(listing: dict) -> int:
+    # the field sort_on=updated orders by, so the incremental cursor can't skip
+    return listing.get("updated_timestamp") or 0
+
 
+def get_sync_state(shop_id) -> dict:
+    return (shop_storage.get(SYNC_STATE_KEY) or {}).get(str(shop_id), {})
 
-def list_products(shop_id):
-    return client.paginate(f"/application/shops/{shop_id}/listings")
 
+def set_sync_state(shop_id, state: dict):
+    with shop_storage.batch():
+        states = dict(shop_storage.get(SYNC_STATE_KEY) or {})
+        states[str(shop_id)] = state
+        shop_storage.set(SYNC_STATE_KEY, states)
 
-def populate_product_catalog(shop_id):
-    for i, page in enumerate(list_products(shop_id)):
-        for p in page["results"]:
-            shop_storage.persist("products", str(p["listing_id"]), p)
-            yield p
+
+def needs_full_sync(state: dict) -> bool:
+    if "high_water" not in state:
+        return True
+    return time.time() - state.get("last_full_sync", 0) >= full_sync_interval()
+
+
+def populate_product_catalog(shop_id, catalog: ProductCatalog = None, full=None):
+    """
+    Sync listings into storage, yielding each listing examined
+
+    Incremental unless full is set or the last full sync is too old
+    """
+    state = get_sync_state(shop_id)
+    if full is None:
+        full = needs_full_sync(state)
+    if full:
+        yield from full_sync(shop_id, catalog)
+    else:
+        yield from incremental_sync(shop_id, state, catalog)
+
+
+def full_sync(shop_id, catalog: ProductCatalog = None):
+    high_water = 0
+    seen = set()
+    for state in LISTING_STATES:
+        for page in list_products(shop_id, state):
+            listings = page["results"]
+            persist_changed(listings, catalog)
+            for p in listings:
+                seen.add(str(p["listing_id"]))
+                high_water = max(high_water, modified_at(p))
+                yield p
+    # any listing of this shop we did not see in any state has been removed
+    stored = {
+        listing_id
+        for listing_id, p in shop_storage.select_many("products")
+        if str(p.get("shop_id")) == str(shop_id)
+    }
+    for listing_id in stored - seen:
+        print("removing listing", listing_id)
+        shop_storage.delete("products", listing_id)
+        if catalog is not None:
+            catalog.remove(listing_id)
+    set_sync_state(shop_id, {"high_water": high_water, "last_full_sync": time.time()})
+
+
+def incremental_sync(shop_id, state: dict, catalog: ProductCatalog = None):
+    high_water = state["high_water"]
+    new_high_water = high_water
+    for listing_state in LISTING_STATES:
+        for page in list_recently_updated_products(shop_id, listing_state):
+            listings = page["results"]
+            # newest first, everything older than the mark is already stored
+            fresh = [p for p in listings if modified_at(p) >= high_water]
+            persist_changed(fresh, catalog)
+            for p in fresh:
+                new_high_water = max(new_high_water, modified_at(p))
+                yield p
+            if len(fresh) < len(listings):
+                break
+    set_sync_state(shop_id, dict(state, high_water=new_high_water))
 
 
 def main():
-    from pprint import pprint
-    import sys
-
-    for i, page in enumerate(list_products(sys.argv[1])):
-        pprint(page)
-        for p in page["results"]:
-            shop_storage.persist("products", str(p["listing_id"]), p)
-        print("page:", i)
+    import argparse
+
+    shop_storage.load_env()
+    parser = argparse.ArgumentParser(description="Sync the etsy product catalog")
+    parser.add_argument("shop_id", nargs="?", default=os.environ.get("ETSY_SHOP_ID"))
+    parser.add_argument(
+        "--full", action="store_true", default=None, help="reconcile every listing"
+    )
+    args = parser.parse_args()
+    if not args.shop_id:
+        parser.error("no shop id given")
+
+    for i, p in enumerate(populate_product_catalog(args.shop_id, full=args.full)):
+        print(i, p["listing_id"], p["title"])
+    print("budget:", client.budget())
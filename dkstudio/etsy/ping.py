@@ -1,6 +1,8 @@
 import os
 import requests
 
+from dkstudio import shop_storage
+
 
 def ping():
     response = requests.get(
@@ -17,4 +19,5 @@ def ping():
 def main():
     from pprint import pprint
 
+    shop_storage.load_env()
     pprint(ping())
@@ -0,0 +1,34 @@
+import os
+
+# functions for walking the files that go into a product package
+
+# files the OS sprinkles into folders that should never ship to a customer
+SYSTEM_FILES = {"Thumbs.db", "desktop.ini", "Icon\r", "__MACOSX"}
+
+
+def is_hidden(name: str) -> bool:
+    return name.startswith(".") or name in SYSTEM_FILES
+
+
+def iter_package_files(source_path: str):
+    """
+    Walk a product folder once, yielding (arcname, path, is_dir) in a stable order
+    """
+    root_name = os.path.basename(os.path.normpath(source_path))
+    stack = [(source_path, root_name)]
+    while stack:
+        dir_path, arc_dir = stack.pop()
+        yield arc_dir + "/", dir_path, True
+        with os.scandir(dir_path) as it:
+            entries = sorted(
+                (entry for entry in it if not is_hidden(entry.name)),
+                key=lambda entry: entry.name,
+            )
+        subdirs = []
+        for entry in entries:
+            arcname = arc_dir + "/" + entry.name
+            if entry.is_dir():
+                subdirs.append((entry.path, arcname))
+            elif entry.is_file():
+                yield arcname, entry.path, False
+        stack.extend(reversed(subdirs))
@@ -1,43 +1,54 @@
 import json
 import os
 import secrets
-from authlib.integrations.starlette_client import OAuth
-from authlib.oauth2.rfc7636 import create_s256_code_challenge
 import requests
-from starlette.applications import Starlette
-from starlette.middleware.sessions import SessionMiddleware
-from starlette.responses import HTMLResponse, RedirectResponse
-from starlette.config import Config
 
 from dkstudio import shop_storage
+from dkstudio.marketplace import token_expires_at
 
-app = Starlette(debug=True)
-app.add_middleware(
-    SessionMiddleware, secret_key=os.environ.get("SESSION_SECRET", "!secret")
-)
+# starlette and authlib load in create_app, only the authorize command needs them
 
 
-config = Config(".env")
-oauth = OAuth(config)
+def create_app():
+    """
+    Build the oauth login app, uvicorn calls this as a factory
+    """
+    from authlib.integrations.starlette_client import OAuth
+    from starlette.applications import Starlette
+    from starlette.config import Config
+    from starlette.middleware.sessions import SessionMiddleware
+
+    shop_storage.load_env()
+    app = Starlette(debug=True)
+    app.add_middleware(
+        SessionMiddleware, secret_key=os.environ.get("SESSION_SECRET", "!secret")
+    )
 
-oauth.register(
-    name="gumroad",
-    client_id=os.environ["GUMROAD_CLIENT_ID"],
-    client_secret=os.environ["GUMROAD_CLIENT_SECRET"],
-    access_token_url="https://api.gumroad.com/oauth/token",
-    access_token_placement="uri",
-    authorize_url="https://gumroad.com/oauth/authorize",
-    api_base_url="https://api.gumroad.com/v2",
-    client_kwargs={
-        "scope": "view_profile edit_products view_sales",
-    },
-)
+    config = Config(".env")
+    oauth = OAuth(config)
 
-gumroad = oauth.create_client("gumroad")
+    oauth.register(
+        name="gumroad",
+        client_id=os.environ["GUMROAD_CLIENT_ID"],
+        client_secret=os.environ["GUMROAD_CLIENT_SECRET"],
+        access_token_url="https://api.gumroad.com/oauth/token",
+        access_token_placement="uri",
+        authorize_url="https://gumroad.com/oauth/authorize",
+        api_base_url="https://api.gumroad.com/v2",
+        client_kwargs={
+            "scope": "view_profile edit_products view_sales",
+        },
+    )
+
+    app.state.gumroad = oauth.create_client("gumroad")
+    app.add_route("/login/gumroad", login_via_gumroad)
+    app.add_route("/auth/gumroad", authorize_gumroad)
+    app.add_route("/ready", ready)
+    return app
 
 
-@app.route("/login/gumroad")
 async def login_via_gumroad(request):
+    gumroad = request.app.state.gumroad
     redirect_uri = request.url_for("authorize_gumroad")
     return await gumroad.authorize_redirect(
         request,
@@ -45,8 +56,10 @@ async def login_via_gumroad(request):
     )
 
 
-@app.route("/auth/gumroad")
 async def authorize_gumroad(request):
+    from starlette.responses import RedirectResponse
+
+    gumroad = request.app.state.gumroad
     # fetch our API token
     redirect_uri = request.url_for("authorize_gumroad")
     authCode = request.query_params["code"]
@@ -94,13 +107,15 @@ async def authorize_gumroad(request):
             "GUMROAD_ACCESS_TOKEN": access_token,
             "GUMROAD_REFRESH_TOKEN": refresh_token,
             "GUMROAD_USER_ID": user_id,
+            "GUMROAD_TOKEN_EXPIRES_AT": token_expires_at(token),
         }
     )
     return RedirectResponse(request.url_for("ready"))
 
 
-@app.route("/ready")
 async def ready(request):
+    from starlette.responses import HTMLResponse
+
     return HTMLResponse("ready")
 
 
@@ -114,8 +129,15 @@ def main():
     log.addHandler(logging.StreamHandler(sys.stdout))
     log.setLevel(logging.DEBUG)
 
+    shop_storage.load_env()
     host = os.environ.get("GUMROAD_AUTH_HOST", "localhost")
     port = int(os.environ.get("GUMROAD_AUTH_PORT", 8000))
     webbrowser.open(f"http://{host}:{port}/login/gumroad")
 
-    uvicorn.run("dkstudio.gumroad.authorize:app", host=host, port=port, reload=True)
+    uvicorn.run(
+        "dkstudio.gumroad.authorize:create_app",
+        factory=True,
+        host=host,
+        port=port,
+        reload=True,
+    )
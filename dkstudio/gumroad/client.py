@@ -1,55 +1,115 @@
 import os
-import requests
-
+from functools import lru_cache
 
 from dkstudio import shop_storage
+from dkstudio.marketplace import (
+    ApiError,
+    MarketplaceClient,
+    RateLimiter,
+    page_key_pages,
+    token_expires_at,
+)
 
+API_URL = "https://api.gumroad.com/v2/"
+TOKEN_URL = "https://api.gumroad.com/oauth/token"
 
-def refresh_token():
-    refresh_token = shop_storage.get("ETSY_REFRESH_TOKEN")
-    # TODO async
-    response = requests.post(
-        "https://api.etsy.com/v3/public/oauth/token",
-        {
-            "grant_type": "refresh_token",
-            "client_id": os.environ["ETSY_CLIENT_ID"],
-            "refresh_token": refresh_token,
-        },
+
+@lru_cache(1)
+def default_limiter() -> RateLimiter:
+    # gumroad does not publish its limits, stay polite
+    return RateLimiter(
+        float(os.environ.get("GUMROAD_RATE_LIMIT", 5)),
+        int(os.environ.get("GUMROAD_DAILY_LIMIT", 100000)),
     )
-    if not response.ok:
-        m = response.json()
-        raise RuntimeError(m.get("error"), m.get("error_description"))
-    token = response.json()
-    print(token)
-    access_token = token.get("access_token")
-    refresh_token = token.get("refresh_token")
-    user_id = access_token.split(".", 1)[0]
-    shop_storage.update(
-        {
-            "ETSY_ACCESS_TOKEN": access_token,
-            "ETSY_REFRESH_TOKEN": refresh_token,
-            "ETSY_USER_ID": user_id,
-        }
+
+
+class GumroadClient(MarketplaceClient):
+    """
+    Gumroad API adapter of the shared marketplace transport
+    """
+
+    api_url = API_URL
+
+    def default_limiter(self) -> RateLimiter:
+        return default_limiter()
+
+    def auth_headers(self) -> dict:
+        access_token = shop_storage.get("GUMROAD_ACCESS_TOKEN")
+        assert access_token, 'Run "poetry run authorize-gumroad"'
+        return {"Authorization": f"Bearer {access_token}"}
+
+    def stored_expiry(self):
+        return shop_storage.get("GUMROAD_TOKEN_EXPIRES_AT")
+
+    def fetch_token(self):
+        refresh_token = shop_storage.get("GUMROAD_REFRESH_TOKEN")
+        assert refresh_token, 'Run "poetry run authorize-gumroad"'
+        response = self.session.post(
+            TOKEN_URL,
+            {
+                "grant_type": "refresh_token",
+                "client_id": os.environ["GUMROAD_CLIENT_ID"],
+                "client_secret": os.environ["GUMROAD_CLIENT_SECRET"],
+                "refresh_token": refresh_token,
+            },
+        )
+        if not response.ok:
+            m = response.json()
+            raise RuntimeError(m.get("error"), m.get("error_description"))
+        token = response.json()
+        shop_storage.update(
+            {
+                "GUMROAD_ACCESS_TOKEN": token.get("access_token"),
+                "GUMROAD_REFRESH_TOKEN": token.get("refresh_token", refresh_token),
+                "GUMROAD_TOKEN_EXPIRES_AT": token_expires_at(token),
+            }
+        )
+
+    def is_expired(self, response, message) -> bool:
+        return response.status_code == 401 and bool(
+            shop_storage.get("GUMROAD_REFRESH_TOKEN")
+        )
+
+    def error(self, response, message) -> Exception:
+        # gumroad errors look like {"success": false, "message": "..."}
+        return ApiError(
+            message.get("message") or message.get("error"),
+            response.status_code,
+            status=response.status_code,
+        )
+
+    def paginate(self, path, **params):
+        return page_key_pages(self.get, path, **params)
+
+
+@lru_cache(1)
+def default_client() -> GumroadClient:
+    return GumroadClient()
+
+
+def refresh_token():
+    default_client().refresh_token()
+
+
+def paginate(path, **params):
+    return default_client().paginate(path, **params)
+
+
+def get(path, **params):
+    return default_client().get(path, **params)
+
+
+def post(path, data=None, json=None, files=None, headers=None, **params):
+    return default_client().post(
+        path, data=data, json=json, files=files, headers=headers, **params
     )
 
 
-def get(path):
-    access_token = shop_storage.get("ETSY_ACCESS_TOKEN")
-    assert access_token, 'Run "poetry run authorize-etsy"'
-    api_key = os.environ["ETSY_CLIENT_ID"]
-    url = f"https://openapi.etsy.com/v3/{path}"
-    response = requests.get(
-        url, headers={"x-api-key": api_key, "Authorization": f"Bearer {access_token}"}
+def put(path, data=None, json=None, files=None, headers=None, **params):
+    return default_client().put(
+        path, data=data, json=json, files=files, headers=headers, **params
     )
-    message = response.json()
-    if not response.ok:
-        if message == {
-            "error": "invalid_token",
-            "error_description": "access token is expired",
-        }:
-            refresh_token()
-            return get(path)
-        else:
-            # Run "poetry run authorize-etsy"
-            raise RuntimeError(message.get("error"), message.get("error_description"))
-    return message
+
+
+def delete(path, **params):
+    return default_client().delete(path, **params)
@@ -0,0 +1,95 @@
+from dkstudio import shop_storage
+from dkstudio.catalog import ProductCatalog, SkuIndex, persist_changed
+from dkstudio.gumroad import client
+from dkstudio.workspace import find_product_dirs, get_project_name_from_project_dir
+
+NAMESPACE = "gumroad-products"
+
+
+def gumroad_skus(product: dict) -> list:
+    """
+    Codes that identify a gumroad product on the other stores
+
+    Gumroad has no sku field of its own, the custom permalink stands in for
+    one along with any sku set on a variant option
+    """
+    skus = []
+    if product.get("custom_permalink"):
+        skus.append(product["custom_permalink"])
+    for variant in product.get("variants") or []:
+        for option in variant.get("options") or []:
+            if option.get("sku"):
+                skus.append(option["sku"])
+    return skus
+
+
+def list_products():
+    # gumroad returns every product in one response
+    return client.get("products")["products"]
+
+
+def populate_gumroad_catalog(catalog: ProductCatalog = None):
+    """
+    Sync gumroad products into storage, yielding each product examined
+    """
+    products = list_products()
+    for product in products:
+        product["skus"] = gumroad_skus(product)
+    persist_changed(products, catalog, namespace=NAMESPACE, key="id")
+    yield from products
+    seen = {str(p["id"]) for p in products}
+    for product_id in set(shop_storage.select_keys(NAMESPACE)) - seen:
+        print("removing gumroad product", product_id)
+        shop_storage.delete(NAMESPACE, product_id)
+        if catalog is not None:
+            catalog.remove(product_id)
+
+
+def associate_product_dirs(workspace_dir: str, skus: SkuIndex = None) -> int:
+    """
+    Record the gumroad product of every product folder in a workspace
+
+    Returns how many folders were newly mapped
+    """
+    skus = skus or SkuIndex.load()
+    mapped = 0
+    for product_folder in find_product_dirs(workspace_dir):
+        config = shop_storage.read_file_metadata(product_folder, {})
+        if "gumroad_product_id" in config:
+            continue
+        known = {}
+        if "etsy_listing_id" in config:
+            known["etsy"] = str(config["etsy_listing_id"])
+        product_name = config.get(
+            "product_name", get_project_name_from_project_dir(product_folder)
+        )
+        product_id = skus.resolve(product_name, known).get("gumroad")
+        if not product_id:
+            continue
+        config["gumroad_product_id"] = product_id
+        config.setdefault("product_name", product_name)
+        shop_storage.write_file_metadata(product_folder, config)
+        shop_storage.persist("gumroad-product-dir", product_id, product_folder)
+        skus.catalogs["gumroad"].mark_mapped(product_id)
+        mapped += 1
+    return mapped
+
+
+def main():
+    import argparse
+
+    shop_storage.load_env()
+    parser = argparse.ArgumentParser(description="Sync the gumroad product catalog")
+    parser.add_argument(
+        "--workspace",
+        default=shop_storage.get("workspace_path"),
+        help="map the product folders of this workspace to gumroad products, "
+        "defaults to the last used workspace",
+    )
+    args = parser.parse_args()
+
+    for i, p in enumerate(populate_gumroad_catalog()):
+        print(i, p["id"], p["name"])
+    if args.workspace:
+        print("mapped", associate_product_dirs(args.workspace), "product folders")
+    print("budget:", client.default_limiter().usage())
@@ -0,0 +1,80 @@
+import time
+
+from dkstudio import shop_storage
+from dkstudio.gumroad import client
+
+NAMESPACE = "gumroad-sales"
+# config key holding the sales ingest checkpoint
+CHECKPOINT_KEY = "GUMROAD_SALES_CHECKPOINT"
+
+
+def persist_sales(sales: list):
+    shop_storage.persist_many(NAMESPACE, [(str(s["id"]), s) for s in sales])
+
+
+def ingest_sales(full: bool = False):
+    """
+    Store sales made since the last run, yielding each sale
+
+    The next page key is checkpointed after every page so a killed run
+    resumes where it stopped.
+    """
+    checkpoint = {} if full else shop_storage.get(CHECKPOINT_KEY) or {}
+    if "page_key" not in checkpoint:
+        # gumroad filters by day, the overlap is rewritten idempotently
+        checkpoint = {"after": checkpoint.get("high_water"), "latest": None}
+    else:
+        print("resuming sales from page", checkpoint["page_key"])
+    params = {}
+    if checkpoint["after"]:
+        params["after"] = checkpoint["after"]
+    page_key = checkpoint.get("page_key")
+    latest = checkpoint["latest"]
+    while True:
+        page_params = dict(params, page_key=page_key) if page_key else params
+        page = client.get("sales", **page_params)
+        sales = page["sales"]
+        persist_sales(sales)
+        for sale in sales:
+            latest = max(latest or "", sale["created_at"][:10])
+        yield from sales
+        page_key = page.get("next_page_key")
+        if not page_key:
+            break
+        shop_storage.set(
+            CHECKPOINT_KEY, dict(checkpoint, page_key=page_key, latest=latest)
+        )
+    shop_storage.set(CHECKPOINT_KEY, {"high_water": latest or checkpoint["after"]})
+
+
+def main():
+    import argparse
+    from pprint import pprint
+
+    shop_storage.load_env()
+    parser = argparse.ArgumentParser(description="Ingest gumroad sales into storage")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ignore the checkpoint and fetch every sale",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        help="keep running, ingesting again every INTERVAL seconds",
+    )
+    parser.add_argument("--verbose", action="store_true", help="print every sale")
+    args = parser.parse_args()
+
+    full = args.full
+    while True:
+        count = 0
+        for sale in ingest_sales(full=full):
+            count += 1
+            if args.verbose:
+                pprint(sale)
+        print(f"ingested {count} sale(s)")
+        if not args.interval:
+            break
+        full = False
+        time.sleep(args.interval)
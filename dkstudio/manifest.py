@@ -0,0 +1,88 @@
+import hashlib
+import os
+
+from dkstudio import shop_storage
+from dkstudio.files import iter_package_files
+
+# functions for tracking what goes into a product package
+
+MANIFEST_SUFFIX = ".dkps-manifest.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def relative_name(arcname: str) -> str:
+    # drop the product folder name, the manifest is relative to it
+    return arcname.split("/", 1)[1]
+
+
+def file_entry(st: os.stat_result, sha256: str) -> dict:
+    return {"size": st.st_size, "mtime": st.st_mtime, "sha256": sha256}
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_manifest(source_path: str, previous: dict = None) -> dict:
+    """
+    List every packaged file with its size, mtime and hash
+
+    Files whose size and mtime match the previous manifest keep their old hash
+    """
+    previous = previous or {}
+    files = {}
+    for arcname, path, is_dir in iter_package_files(source_path):
+        if is_dir:
+            continue
+        name = relative_name(arcname)
+        st = os.stat(path)
+        old = previous.get(name)
+        if old and old["size"] == st.st_size and old["mtime"] == st.st_mtime:
+            files[name] = old
+        else:
+            files[name] = file_entry(st, hash_file(path))
+    return files
+
+
+def contents(files: dict) -> dict:
+    return {name: (f["size"], f["sha256"]) for name, f in files.items()}
+
+
+def read_manifest(source_path: str) -> dict:
+    return shop_storage.read_file_metadata(source_path, {}, suffix=MANIFEST_SUFFIX)
+
+
+def write_manifest(source_path: str, zip_path: str, files: dict):
+    zip_stat = os.stat(zip_path)
+    shop_storage.write_file_metadata(
+        source_path,
+        {
+            "files": files,
+            "zip": {"size": zip_stat.st_size, "mtime": zip_stat.st_mtime},
+        },
+        suffix=MANIFEST_SUFFIX,
+    )
+
+
+def is_package_stale(source_path: str, zip_path: str) -> bool:
+    """
+    Check a product zip against the manifest recorded when it was packaged
+    """
+    stored = read_manifest(source_path)
+    if not stored or not os.path.isfile(zip_path):
+        return True
+    zip_stat = os.stat(zip_path)
+    if stored["zip"] != {"size": zip_stat.st_size, "mtime": zip_stat.st_mtime}:
+        # zip was replaced outside of the packager
+        return True
+    files = build_manifest(source_path, stored["files"])
+    if contents(files) != contents(stored["files"]):
+        return True
+    if files != stored["files"]:
+        # touched but unchanged, remember the new mtimes to skip rehashing
+        write_manifest(source_path, zip_path, files)
+    return False
@@ -0,0 +1,427 @@
+import random
+from abc import ABC, abstractmethod
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# request path shared by the marketplace api clients
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# methods safe to send again after the server may have acted on them
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+# seconds before expiry that an access token is replaced
+REFRESH_MARGIN = 60
+
+
+class RateLimiter:
+    """
+    Token buckets for a marketplace's per second and per day request budgets
+
+    Budgets adapt to the x-limit-*/x-remaining-* headers of each response
+    """
+
+    def __init__(self, per_second: float, per_day: int):
+        self.lock = threading.Lock()
+        self.per_second = per_second
+        self.per_day = per_day
+        self.tokens = self.per_second
+        self.updated = time.monotonic()
+        self.day_started = time.monotonic()
+        self.remaining_today = self.per_day
+        self.used = 0
+        self.paused_until = 0.0
+
+    def reserve(self) -> float:
+        """
+        Take a request slot, returns how many seconds to wait before sending
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now - self.day_started >= 24 * 60 * 60:
+                self.day_started = now
+                self.remaining_today = self.per_day
+            self.tokens = min(
+                self.per_second, self.tokens + (now - self.updated) * self.per_second
+            )
+            self.updated = now
+            # the bucket goes negative to queue callers behind each other
+            self.tokens -= 1
+            wait = max(0.0, -self.tokens / self.per_second, self.paused_until - now)
+            if self.remaining_today <= 0:
+                wait = max(wait, self.day_started + 24 * 60 * 60 - now)
+            self.remaining_today -= 1
+            self.used += 1
+            return wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    def update_from_headers(self, headers):
+        with self.lock:
+            if "x-limit-per-second" in headers:
+                self.per_second = float(headers["x-limit-per-second"])
+            if "x-limit-per-day" in headers:
+                self.per_day = int(headers["x-limit-per-day"])
+            if "x-remaining-today" in headers:
+                self.remaining_today = int(headers["x-remaining-today"])
+            if headers.get("x-remaining-this-second") == "0":
+                self.tokens = min(self.tokens, 0)
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def usage(self) -> dict:
+        with self.lock:
+            return {
+                "per_second": self.per_second,
+                "per_day": self.per_day,
+                "remaining_today": self.remaining_today,
+                "used": self.used,
+            }
+
+
+class ApiError(RuntimeError):
+    """
+    Error response from a marketplace api, status is its http status
+    """
+
+    def __init__(self, *args, status: int = None):
+        super().__init__(*args)
+        self.status = status
+
+
+def retry_delay(headers, attempt: int) -> float:
+    retry_after = headers.get("retry-after")
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    # exponential backoff with jitter so parallel callers don't retry in step
+    return BACKOFF_BASE * 2**attempt + random.uniform(0, BACKOFF_BASE)
+
+
+def should_retry(method: str, status: int) -> bool:
+    # a 5xx can come after a POST was handled (ie a file attached), don't repeat it
+    if status == 429:
+        return True
+    return status in RETRY_STATUSES and method.upper() in IDEMPOTENT_METHODS
+
+
+def never_sent(error: requests.exceptions.ConnectionError) -> bool:
+    """
+    Whether a connection error happened before any of the request was sent
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def can_resend(method: str, error: Exception) -> bool:
+    """
+    Whether a failed call can be sent again without repeating what the server did
+    """
+    if isinstance(
+        error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    ):
+        return method.upper() in IDEMPOTENT_METHODS or never_sent(error)
+    status = getattr(error, "status", None)
+    return status is not None and should_retry(method, status)
+
+
+def error_message(response) -> dict:
+    """
+    The json body of a failed response, its text when it is not json (ie a proxy's 502 page)
+    """
+    try:
+        message = response.json()
+    except ValueError:
+        return {"error": response.text}
+    return message if isinstance(message, dict) else {"error": message}
+
+
+def rewind_files(files, data=None):
+    # multipart bodies are read on send, rewind them before a retry
+    for value in (files or {}).values():
+        fp = value[1] if isinstance(value, tuple) else value
+        if hasattr(fp, "seek"):
+            fp.seek(0)
+    if hasattr(data, "seek"):
+        data.seek(0)
+
+
+def token_expires_at(token: dict):
+    """
+    Epoch seconds an oauth token response expires at, None if it doesn't say
+    """
+    if token.get("expires_at"):
+        return float(token["expires_at"])
+    if token.get("expires_in"):
+        return time.time() + float(token["expires_in"])
+    return None
+
+
+def offset_pages(get, path, **params):
+    """
+    Pages of a collection reporting a total count, fetched by offset
+    """
+    message = get(path, **params)
+    count = message["count"]
+    yield message
+    index = len(message["results"])
+    while index < count:
+        message = get(path, offset=index, **params)
+        if not message["results"]:
+            break
+        yield message
+        index += len(message["results"])
+
+
+def page_key_pages(get, path, **params):
+    """
+    Pages of a collection where each page names the key of the next one
+    """
+    message = get(path, **params)
+    yield message
+    while message.get("next_page_key"):
+        message = get(path, page_key=message["next_page_key"], **params)
+        yield message
+
+
+class MarketplaceClient(ABC):
+    """
+    Pooled keep-alive session with rate limiting, retries and token refresh
+
+    Adapters set api_url and fill in auth, error handling and pagination.
+    Tokens with a known expiry are refreshed shortly before it on a timer,
+    and only one refresh runs at a time, callers wait for it and reuse it.
+    """
+
+    api_url: str = None
+
+    def __init__(self, pool_size: int = 10, limiter: RateLimiter = None):
+        self.session = requests.Session()
+        self.session.mount(
+            "https://", HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        )
+        self.limiter = limiter or self.default_limiter()
+        self._headers = None
+        self._expires_at = None
+        # the one pending background refresh and the expiry it was set for
+        self._timer = None
+        self._timer_expiry = None
+        self.refresh_lock = threading.Lock()
+
+    @abstractmethod
+    def default_limiter(self) -> RateLimiter: ...
+
+    @abstractmethod
+    def auth_headers(self) -> dict: ...
+
+    def stored_expiry(self):
+        """
+        When the stored access token expires, None if unknown
+        """
+        return None
+
+    @abstractmethod
+    def fetch_token(self):
+        """
+        Trade the stored refresh token for a new access token
+        """
+
+    def is_expired(self, response, message) -> bool:
+        return False
+
+    def error(self, response, message) -> Exception:
+        return ApiError(
+            message.get("error"),
+            message.get("error_description"),
+            status=response.status_code,
+        )
+
+    @abstractmethod
+    def paginate(self, path, **params): ...
+
+    def load_headers(self):
+        # called with refresh_lock held
+        self._headers = self.auth_headers()
+        self._expires_at = self.stored_expiry()
+        self.schedule_refresh()
+
+    def is_expiring(self) -> bool:
+        return (
+            self._expires_at is not None
+            and time.time() >= self._expires_at - REFRESH_MARGIN
+        )
+
+    def cached_headers(self):
+        """
+        The current headers without waiting, None while they need (re)loading
+        """
+        headers = self._headers
+        if headers is None or self.is_expiring() or self.refresh_lock.locked():
+            return None
+        return headers
+
+    def headers(self) -> dict:
+        with self.refresh_lock:
+            if self._headers is None:
+                self.load_headers()
+            headers = self._headers
+            expiring = self.is_expiring()
+        if expiring:
+            self.refresh_token(headers)
+            headers = self._headers
+        return headers
+
+    def refresh_token(self, stale_headers: dict = None):
+        """
+        Fetch a new access token, unless another caller already replaced stale_headers
+        """
+        with self.refresh_lock:
+            if stale_headers is not None and self._headers is not stale_headers:
+                return
+            self.fetch_token()
+            self.load_headers()
+
+    def schedule_refresh(self):
+        """
+        Keep a single timer refreshing the token ahead of its expiry
+        """
+        if (
+            self._timer is not None
+            and self._timer.is_alive()
+            and self._timer_expiry == self._expires_at
+        ):
+            return
+        self.cancel_refresh()
+        if self._expires_at is None:
+            return
+        delay = max(0.0, self._expires_at - REFRESH_MARGIN - time.time())
+        self._timer = threading.Timer(delay, self.background_refresh, [self._headers])
+        self._timer.daemon = True
+        self._timer_expiry = self._expires_at
+        self._timer.start()
+
+    def cancel_refresh(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = None
+        self._timer_expiry = None
+
+    def background_refresh(self, stale_headers: dict):
+        try:
+            self.refresh_token(stale_headers)
+        except Exception as e:
+            # requests will refresh once the token is reported expired
+            print("background token refresh failed:", e)
+
+    def send(
+        self,
+        method: str,
+        url: str,
+        files=None,
+        data=None,
+        headers=None,
+        auth: dict = None,
+        **kwargs,
+    ):
+        """
+        Send within the rate limit, retrying throttled and failed responses
+
+        Server errors are only retried for idempotent methods, a POST is
+        retried on 429 and on connection failures before anything was sent.
+        auth is the auth headers to send, the current ones by default
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.acquire()
+            rewind_files(files, data)
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    files=files,
+                    data=data,
+                    headers={
+                        **(self.headers() if auth is None else auth),
+                        **(headers or {}),
+                    },
+                    **kwargs,
+                )
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as e:
+                if attempt == MAX_RETRIES or not can_resend(method, e):
+                    raise
+                delay = retry_delay({}, attempt)
+                print(f"{method} {url} failed ({e}), retry in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self.limiter.update_from_headers(response.headers)
+            if not should_retry(method, response.status_code) or attempt == MAX_RETRIES:
+                return response
+            delay = retry_delay(response.headers, attempt)
+            print(
+                f"{method} {url} returned {response.status_code}, retry in {delay:.1f}s"
+            )
+            if response.status_code == 429:
+                # hold back every caller sharing the limiter, not just this one
+                self.limiter.pause(delay)
+            time.sleep(delay)
+
+    def request(self, method: str, path: str, files=None, **kwargs):
+        """
+        Send a request, refreshing the access token once if it has expired
+        """
+        url = self.api_url + path.lstrip("/")
+        for attempt in range(2):
+            # the headers sent are the ones a refresh replaces
+            auth = self.headers()
+            response = self.send(method, url, files=files, auth=auth, **kwargs)
+            if response.ok:
+                if method == "DELETE" or not response.content:
+                    return None
+                return response.json()
+            message = error_message(response)
+            if attempt or not self.is_expired(response, message):
+                break
+            self.refresh_token(auth)
+        print(method, url, response.status_code)
+        print(message)
+        raise self.error(response, message)
+
+    def get(self, path, **params):
+        return self.request("GET", path, params=params)
+
+    def post(self, path, data=None, json=None, files=None, headers=None, **params):
+        return self.request(
+            "POST",
+            path,
+            data=data,
+            json=json,
+            files=files,
+            headers=headers,
+            params=params,
+        )
+
+    def put(self, path, data=None, json=None, files=None, headers=None, **params):
+        return self.request(
+            "PUT",
+            path,
+            data=data,
+            json=json,
+            files=files,
+            headers=headers,
+            params=params,
+        )
+
+    def delete(self, path, **params):
+        return self.request("DELETE", path, params=params)
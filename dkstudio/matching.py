@@ -0,0 +1,117 @@
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+from thefuzz import fuzz
+
+from dkstudio.catalog import ListingRecord
+
+# fuzzy matching of product folder names to listing titles
+
+# listings scored with WRatio per folder, picked by shared trigrams
+SHORTLIST_SIZE = 25
+NON_WORD = re.compile(r"[\W_]+")
+
+
+def auto_accept_threshold() -> int:
+    # strict ratio a match has to beat to be associated without asking
+    return int(os.environ.get("MATCH_AUTO_ACCEPT", 95))
+
+
+def normalize(text: str) -> str:
+    return NON_WORD.sub(" ", text.lower()).strip()
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class MatchIndex:
+    """
+    Trigram inverted index over listing titles
+
+    Each name is only scored against the listings sharing the most trigrams
+    with it, instead of against every listing.
+    """
+
+    def __init__(self, records: Iterable[ListingRecord]):
+        self.records: List[ListingRecord] = list(records)
+        self.titles = [normalize(r.title) for r in self.records]
+        self.sizes = []
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        for i, title in enumerate(self.titles):
+            grams = trigrams(title)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(i)
+
+    def shortlist(self, name: str, limit: int = SHORTLIST_SIZE) -> List[int]:
+        grams = trigrams(name)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        # dice coefficient, so long titles don't win on overlap alone
+        return sorted(
+            shared,
+            key=lambda i: 2 * shared[i] / (len(grams) + self.sizes[i]),
+            reverse=True,
+        )[:limit]
+
+    def match(self, name: str, limit: int = 5) -> List[Tuple[ListingRecord, int]]:
+        """
+        Best listings for a product name with their WRatio score, best first
+        """
+        name = normalize(name)
+        scored = [
+            (self.records[i], fuzz.WRatio(name, self.titles[i]))
+            for i in self.shortlist(name)
+        ]
+        scored.sort(key=lambda match: match[1], reverse=True)
+        return scored[:limit]
+
+    def match_all(
+        self, names: Dict[Hashable, str], limit: int = 5
+    ) -> Dict[Hashable, List[Tuple[ListingRecord, int]]]:
+        """
+        Match every name, keyed like names (ie by product folder)
+        """
+        return {key: self.match(name, limit) for key, name in names.items()}
+
+
+def accept_matches(
+    matches: Dict[Hashable, List[Tuple[ListingRecord, int]]],
+    names: Dict[Hashable, str],
+    threshold: int = None,
+) -> Dict[Hashable, ListingRecord]:
+    """
+    Pick confident one-to-one matches, best scores first
+
+    WRatio scores a name contained in a longer title at 95 ("cat mug" and
+    "cat mug press"), so the best match must also beat the threshold on a
+    strict ratio of the whole strings. A name whose top two listings tie is
+    left for a person to decide.
+    """
+    if threshold is None:
+        threshold = auto_accept_threshold()
+    pairs = []
+    for key, candidates in matches.items():
+        if not candidates:
+            continue
+        if len(candidates) > 1 and candidates[1][1] == candidates[0][1]:
+            continue
+        record = candidates[0][0]
+        score = fuzz.ratio(normalize(names[key]), normalize(record.title))
+        if score <= threshold:
+            continue
+        pairs.append((score, key, record))
+    pairs.sort(key=lambda pair: pair[0], reverse=True)
+    accepted = {}
+    taken = set()
+    for score, key, record in pairs:
+        if record.listing_id in taken:
+            continue
+        taken.add(record.listing_id)
+        accepted[key] = record
+    return accepted
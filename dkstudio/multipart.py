@@ -0,0 +1,94 @@
+import os
+import secrets
+from typing import Dict
+
+# multipart/form-data bodies that stream their file from disk
+
+
+class MultipartFileBody:
+    """
+    A multipart/form-data body with one file field, read from disk on demand
+
+    Exposes read/seek/__len__ so requests sends it with a Content-Length
+    without loading the file into memory, and can rewind it for a retry.
+    """
+
+    def __init__(
+        self,
+        fields: Dict[str, str],
+        file_field: str,
+        path: str,
+        content_type: str = "application/octet-stream",
+        filename: str = None,
+    ):
+        self.boundary = secrets.token_hex(16)
+        self.path = path
+        filename = filename or os.path.basename(path)
+        head = b"".join(
+            self.part_header(f'name="{name}"') + str(value).encode() + b"\r\n"
+            for name, value in fields.items()
+        )
+        head += self.part_header(
+            f'name="{file_field}"; filename="{filename}"', content_type
+        )
+        self.head = head
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self.file_size = os.path.getsize(path)
+        self.fp = None
+        self.position = 0
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def part_header(self, disposition: str, content_type: str = None) -> bytes:
+        header = (
+            f"--{self.boundary}\r\nContent-Disposition: form-data; {disposition}\r\n"
+        )
+        if content_type:
+            header += f"Content-Type: {content_type}\r\n"
+        return (header + "\r\n").encode()
+
+    def __len__(self) -> int:
+        return len(self.head) + self.file_size + len(self.tail)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET):
+        # only rewinding is needed to resend the body
+        assert offset == 0 and whence == os.SEEK_SET, "can only rewind"
+        self.position = 0
+        if self.fp:
+            self.fp.seek(0)
+
+    def tell(self) -> int:
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = len(self) - self.position
+        chunks = []
+        while size > 0 and self.position < len(self):
+            chunk = self.read_chunk(size)
+            chunks.append(chunk)
+            size -= len(chunk)
+            self.position += len(chunk)
+        return b"".join(chunks)
+
+    def read_chunk(self, size: int) -> bytes:
+        head_end = len(self.head)
+        file_end = head_end + self.file_size
+        if self.position < head_end:
+            return self.head[self.position : self.position + size]
+        if self.position < file_end:
+            if self.fp is None:
+                self.fp = open(self.path, "rb")
+            chunk = self.fp.read(min(size, file_end - self.position))
+            if not chunk:
+                raise IOError(f"{self.path} shrank while uploading")
+            return chunk
+        offset = self.position - file_end
+        return self.tail[offset : offset + size]
+
+    def close(self):
+        if self.fp:
+            self.fp.close()
+            self.fp = None
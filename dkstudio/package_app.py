@@ -0,0 +1,97 @@
+import os
+from tkinter import Button, Tk
+from tkinter.filedialog import askdirectory
+from tkinter import messagebox
+
+from dkstudio import shop_storage
+from dkstudio.package_products import package_product_dir, package_products_in_pool
+from dkstudio.ux import askworkspace, iterate_with_dialog, run_on_main
+from dkstudio.workspace import find_product_dirs
+
+# the product packager app, kept apart so the packaging commands don't load tkinter
+
+
+class PackageApp(Tk):
+    def __init__(self):
+        super().__init__()
+        self.title("[DKPS]Product Packager")
+        self.package_folder_btn = Button(
+            self,
+            text="Select Project Folder",
+            command=self.click_package_folder,
+            bg="blue",
+            fg="black",
+            highlightbackground="#3E4149",
+        )
+        self.package_workspace_btn = Button(
+            self,
+            text="Select Workspace Folder",
+            command=self.click_package_workspace,
+            bg="blue",
+            fg="black",
+            highlightbackground="#3E4149",
+        )
+        self.package_folder_btn.grid(row=0, column=0, padx=5, pady=5)
+        self.package_workspace_btn.grid(row=1, column=0, padx=5, pady=5)
+
+    def click_package_workspace(self):
+        self.package_workspace_btn["state"] = "disabled"
+        try:
+            indir = askworkspace()
+            if indir:
+                all_paths = find_product_dirs(indir)
+                count = len(all_paths)
+                confirm = messagebox.askokcancel(
+                    "Projects found", f"Found {count} projects"
+                )
+                if not confirm:
+                    return
+                iterate_with_dialog(
+                    self,
+                    package_products_in_pool(all_paths),
+                    count,
+                )
+                messagebox.showinfo("information", "Packaged %s product(s)" % count)
+        finally:
+            self.package_workspace_btn["state"] = "normal"
+
+    def click_package_folder(self):
+        self.package_folder_btn["state"] = "disabled"
+        try:
+            indir = askdirectory(
+                initialdir=shop_storage.get("workspace_path", os.getcwd()),
+                mustexist=True,
+            )
+            if indir:
+                all_paths = find_product_dirs(indir)
+                count = len(all_paths)
+                if count != 1:
+                    messagebox.showerror("error", "Could not find product folder")
+                    return
+
+                iterate_with_dialog(
+                    self, map(self.package_product_with_message, all_paths), count
+                )
+        finally:
+            self.package_folder_btn["state"] = "normal"
+
+    def package_product(self, apath):
+        if not os.path.isdir(apath):
+            run_on_main(
+                messagebox.showerror,
+                "invalid path",
+                "Path is not a directory %s" % apath,
+            )
+            return
+        return package_product_dir(apath)
+
+    def package_product_with_message(self, apath):
+        filename = self.package_product(apath)
+        run_on_main(messagebox.showinfo, "information", "Packaged %s" % filename)
+        return filename
+
+
+def main():
+    shop_storage.load_env()
+    app = PackageApp()
+    app.mainloop()
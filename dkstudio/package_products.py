@@ -1,134 +1,161 @@
 #!/usr/bin/env python3
 
-import glob
+import hashlib
 import os
-import subprocess
+import stat
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from dkstudio import shop_storage
+from dkstudio.files import iter_package_files
+from dkstudio.manifest import (
+    file_entry,
+    is_package_stale,
+    relative_name,
+    write_manifest,
+)
+from dkstudio.workspace import find_product_dirs
 
 # functions for packaging up products
 
-COMMAND = "zip -r {destination} {source} -X"
+# already compressed formats are stored, everything else is deflated
+COMPRESSION_BY_EXTENSION = {
+    ".png": zipfile.ZIP_STORED,
+    ".jpg": zipfile.ZIP_STORED,
+    ".jpeg": zipfile.ZIP_STORED,
+    ".zip": zipfile.ZIP_STORED,
+    ".svg": zipfile.ZIP_DEFLATED,
+    ".dxf": zipfile.ZIP_DEFLATED,
+    ".pdf": zipfile.ZIP_DEFLATED,
+}
+DEFAULT_COMPRESSION = zipfile.ZIP_DEFLATED
+CHUNK_SIZE = 1024 * 1024
+# fixed timestamp so the same files always produce the same bytes
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def compression_for(path: str) -> int:
+    ext = os.path.splitext(path)[1].lower()
+    return COMPRESSION_BY_EXTENSION.get(ext, DEFAULT_COMPRESSION)
+
+
+def write_package(source_path: str, zip_file: zipfile.ZipFile) -> dict:
+    """
+    Stream a product folder into a zipfile, returns the manifest of what was written
+    """
+    files = {}
+    for arcname, path, is_dir in iter_package_files(source_path):
+        info = zipfile.ZipInfo(arcname, date_time=ZIP_DATE_TIME)
+        if is_dir:
+            info.external_attr = (stat.S_IFDIR | 0o755) << 16 | 0x10
+            zip_file.writestr(info, b"")
+            continue
+        info.external_attr = (stat.S_IFREG | 0o644) << 16
+        info.compress_type = compression_for(path)
+        st = os.stat(path)
+        # a known size lets zipfile pick zip64 headers only when needed
+        info.file_size = st.st_size
+        digest = hashlib.sha256()
+        with open(path, "rb") as src, zip_file.open(info, "w") as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                dst.write(chunk)
+        files[relative_name(arcname)] = file_entry(st, digest.hexdigest())
+    return files
 
 
 def package_product(cwd, source, destination):
     """
     Zip up a product folder without hidden/system files
     """
-    cmd = COMMAND.format(destination=destination, source=source)
-    more_hidden_files = glob.glob(os.path.join(cwd, source, "**/.*"), recursive=True)
-    if more_hidden_files:
-        more_hidden_files = [path[len(cwd) :] for path in more_hidden_files]
-        exclude_options = " -x ".join(more_hidden_files)
-        cmd = cmd + " -x " + exclude_options
-    print(cmd)
-    return subprocess.call(cmd, cwd=cwd, shell=True)
-
-
-def find_product_dirs(indir):
-    if indir.endswith("_FILES"):
-        all_paths = [indir]
-    else:
-        search = "*_FILES"
-        for i in range(2):
-            all_paths = glob.glob(os.path.join(indir, search))
-            if len(all_paths):
-                break
-            else:
-                search = "*/" + search
-    return all_paths
-
-
-# UI routines
-
-from tkinter import Button, Tk
-
-from tkinter.filedialog import askdirectory
-from tkinter import messagebox
-
-from dkstudio.ux import iterate_with_dialog
-
-
-class PackageApp(Tk):
-    def __init__(self):
-        super().__init__()
-        self.title("[DKPS]Product Packager")
-        self.package_folder_btn = Button(
-            self,
-            text="Select Project Folder",
-            command=self.click_package_folder,
-            bg="blue",
-            fg="black",
-            highlightbackground="#3E4149",
-        )
-        self.package_workspace_btn = Button(
-            self,
-            text="Select Workspace Folder",
-            command=self.click_package_workspace,
-            bg="blue",
-            fg="black",
-            highlightbackground="#3E4149",
-        )
-        self.package_folder_btn.grid(row=0, column=0, padx=5, pady=5)
-        self.package_workspace_btn.grid(row=1, column=0, padx=5, pady=5)
-
-    def click_package_workspace(self):
-        self.package_workspace_btn["state"] = "disabled"
-        try:
-            indir = askdirectory(
-                initialdir=shop_storage.get("workspace_path", os.getcwd()),
-                mustexist=True,
-            )
-            if indir:
-                all_paths = find_product_dirs(indir)
-                count = len(all_paths)
-                confirm = messagebox.askokcancel(
-                    "Projects found", f"Found {count} projects"
-                )
-                if not confirm:
-                    return
-                iterate_with_dialog(self, map(self.package_product, all_paths), count)
-                messagebox.showinfo("information", "Packaged %s product(s)" % count)
-                shop_storage.set("workspace_path", indir)
-        finally:
-            self.package_workspace_btn["state"] = "normal"
+    source_path = os.path.join(cwd, source)
+    destination = os.path.join(cwd, destination)
+    print("packaging", source_path, "->", destination)
+    # write next to the destination and swap in so a failed run keeps the old zip
+    tmp_path = destination + ".tmp"
+    try:
+        with zipfile.ZipFile(tmp_path, "w") as zip_file:
+            files = write_package(source_path, zip_file)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    write_manifest(source_path, destination, files)
+    return destination
+
+
+def package_product_if_changed(cwd, source, destination) -> bool:
+    """
+    Package a product unless its manifest shows the zip is current
+    """
+    source_path = os.path.join(cwd, source)
+    if not is_package_stale(source_path, os.path.join(cwd, destination)):
+        print("unchanged", source_path)
+        return False
+    package_product(cwd, source, destination)
+    return True
 
-    def click_package_folder(self):
-        self.package_folder_btn["state"] = "disabled"
+
+def package_product_dir(apath):
+    """
+    Zip up a *_FILES folder next to itself, returns the zip filename
+    """
+    cwd, product_dir = os.path.split(apath)
+    product_name = product_dir[: -len("_FILES")]
+    filename = product_name + ".zip"
+    package_product_if_changed(cwd, product_dir, filename)
+    return filename
+
+
+def default_workers() -> int:
+    return int(os.environ.get("PACKAGE_WORKERS", 0)) or os.cpu_count() or 1
+
+
+def package_products_in_pool(product_dirs, workers: int = None):
+    """
+    Package product folders over a process pool, yielding zip filenames in completion order
+    """
+    workers = workers or default_workers()
+    if workers == 1:
+        yield from map(package_product_dir, product_dirs)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(package_product_dir, apath) for apath in product_dirs
+        ]
         try:
-            indir = askdirectory(
-                initialdir=shop_storage.get("workspace_path", os.getcwd()),
-                mustexist=True,
-            )
-            if indir:
-                all_paths = find_product_dirs(indir)
-                count = len(all_paths)
-                if count != 1:
-                    messagebox.showerror("error", "Could not find product folder")
-                    return
-
-                iterate_with_dialog(
-                    self, map(self.package_product_with_message, all_paths), count
-                )
+            for future in as_completed(futures):
+                yield future.result()
         finally:
-            self.package_folder_btn["state"] = "normal"
-
-    def package_product(self, apath):
-        if not os.path.isdir(apath):
-            messagebox.showerror("invalid path", "Path is not a directory %s" % apath)
-            return
-        cwd, product_dir = os.path.split(apath)
-        product_name = product_dir[: -len("_FILES")]
-        filename = product_name + ".zip"
-        package_product(cwd, product_dir, filename)
-        return filename
-
-    def package_product_with_message(self, apath):
-        filename = self.package_product(apath)
-        messagebox.showinfo("information", "Packaged %s" % filename)
-        return filename
-
-
-def main():
-    app = PackageApp()
-    app.mainloop()
+            for future in futures:
+                future.cancel()
+
+
+def package_workspace_main():
+    import argparse
+
+    shop_storage.load_env()
+    parser = argparse.ArgumentParser(description="Package every product in a workspace")
+    parser.add_argument(
+        "workspace",
+        nargs="?",
+        default=shop_storage.get("workspace_path"),
+        help="workspace or product folder, defaults to the last used workspace",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=default_workers(),
+        help="number of packaging processes (env PACKAGE_WORKERS)",
+    )
+    args = parser.parse_args()
+    if not args.workspace:
+        parser.error("no workspace given")
+    all_paths = find_product_dirs(args.workspace)
+    count = len(all_paths)
+    print(f"Found {count} projects")
+    for i, filename in enumerate(
+        package_products_in_pool(all_paths, workers=args.workers), 1
+    ):
+        print(f"[{i}/{count}] {filename}")
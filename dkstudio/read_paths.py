@@ -1,6 +1,7 @@
 import re
 import os
-
+from functools import lru_cache
+from typing import Iterable
 
 FILE_FORMATS = [
     r"(?P<format>(SVG|PNG|DXF))_(?P<variation>[A-Z_]+)_(?P<design>[\w_]+)_(?P<size>\d+(oz|OZ))\.(?P<extension>\w+)",
@@ -23,32 +24,100 @@ OUTPUT_FOLDER_STRUCTURE = {
 }
 
 
-def read_path_into_struct(apath):
+def prefix_groups(pattern: str, prefix: str) -> str:
+    return pattern.replace("(?P<", f"(?P<{prefix}")
+
+
+def scoped_flags(pattern: str) -> str:
+    # a leading (?i) only applies to the whole pattern, scope it to this one
+    if pattern.startswith("(?i)"):
+        return f"(?i:{pattern[len('(?i)'):]})"
+    return pattern
+
+
+class PathClassifier:
     """
-    Given a path, return attributes
+    Reads attributes out of product file paths with patterns compiled once
+
+    Every signifier is an optional lookahead of a single pattern so one match
+    sets them all. The filename formats are one alternation whose named groups
+    are prefixed by format index, the first format to match wins as before.
     """
-    parts = apath.split(os.path.sep)
-    info = {}
-    for part_index, apart in enumerate(parts):
-        if part_index == len(parts) - 1:
-            # extract info from filename
-            ext = apart.split(".")[-1]
-            if info["is_design"] and not info["is_bonus"]:
-                info["format"] = ext.upper()
-                for format in FILE_FORMATS:
-                    m = re.match(format, info["filename"])
-                    if m:
-                        info.update(m.groupdict())
-                        break
-        elif len(info):
-            # is a subfolder
-            if re.match(MUG_SIZE, apart):
-                info["size"] = apart
-            elif "varation" in info:
-                # additional variation
-                pass
+
+    def __init__(
+        self,
+        signifiers: dict = SIGNIFIERS,
+        file_formats: list = FILE_FORMATS,
+        mug_size: str = MUG_SIZE,
+    ):
+        self.signifiers = re.compile(
+            "".join(
+                f"(?=(?P<{name}>{scoped_flags(pattern)})?)"
+                for name, pattern in signifiers.items()
+            )
+        )
+        self.file_formats = re.compile(
+            "|".join(
+                f"(?P<f{i}>{prefix_groups(pattern, f'f{i}_')})"
+                for i, pattern in enumerate(file_formats)
+            )
+        )
+        # the named groups of each format as (prefixed name, name)
+        self.format_groups = {
+            f"f{i}": [(f"f{i}_{name}", name) for name in re.compile(pattern).groupindex]
+            for i, pattern in enumerate(file_formats)
+        }
+        self.mug_size = re.compile(mug_size)
+        self.read_folders = lru_cache(maxsize=None)(self.read_folders)
+
+    def read_folders(self, dirpath: str) -> dict:
+        """
+        Attributes from the folders of a path, memoized per directory
+        """
+        parts = dirpath.split(os.path.sep)
+        info = {"design_folder_name": parts[0]}
+        info["design"] = info["design_folder_name"][: -len("_FILES")]
+        for folder in parts[1:]:
+            if self.mug_size.match(folder):
+                info["size"] = folder
             else:
-                info["variation"] = apart
-        elif apart.endswith("_FILES"):
-            info["design"] = info["design_folder_name"] = apart[: -len("_FILES")]
-    return info
+                info["variation"] = folder
+        return info
+
+    def read_filename(self, filename: str) -> dict:
+        m = self.file_formats.match(filename)
+        if not m:
+            return {}
+        # the group wrapping the matched format closes last
+        return {name: m.group(group) for group, name in self.format_groups[m.lastgroup]}
+
+    def classify(self, apath: str) -> dict:
+        m = self.signifiers.match(apath)
+        info = {name: value is not None for name, value in m.groupdict().items()}
+        dirpath, _, info["filename"] = apath.rpartition(os.path.sep)
+        if not dirpath:
+            # a bare filename is its own design folder
+            dirpath = info["filename"]
+        info.update(self.read_folders(dirpath))
+        if info["is_design"] and not info["is_bonus"]:
+            info["format"] = apath.split(".")[-1].upper()
+            info.update(self.read_filename(info["filename"]))
+        return info
+
+    def classify_many(self, paths: Iterable[str]):
+        """
+        Classify a batch of paths, yielding (path, info)
+        """
+        classify = self.classify
+        for apath in paths:
+            yield apath, classify(apath)
+
+
+classifier = PathClassifier()
+
+
+def read_path_into_struct(apath):
+    """
+    Given a path relative to the workspace, return attributes
+    """
+    return classifier.classify(apath)
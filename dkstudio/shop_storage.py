@@ -3,12 +3,13 @@ from functools import lru_cache
 import os
 import json
 import shutil
-from typing import Any
+import stat
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterable, Tuple
 
-from dotenv import load_dotenv
-
-
-load_dotenv()
+from dkstudio.storage_backends import JSONDirectoryBackend, SQLiteBackend
 
 
 class NOT_SET:
@@ -23,21 +24,56 @@ def root_dir() -> str:
     return split(src_dir())[0]
 
 
+@lru_cache(1)
+def load_env():
+    """
+    Read .env into the environment, entry points call this before reading settings
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
 def storage_dir() -> str:
+    load_env()
     home = root_dir()
     return os.environ.get("SHOP_STORAGE_DIR", join(home, "dkstudio-toolbox-storage"))
 
 
+def storage_db_path() -> str:
+    load_env()
+    home = root_dir()
+    return os.environ.get(
+        "SHOP_STORAGE_DB", join(home, "dkstudio-toolbox-storage.sqlite3")
+    )
+
+
 def storage_path() -> str:
+    load_env()
     home = root_dir()
     return os.environ.get("SHOP_STORAGE_PATH", join(home, "dkstudio-config.json"))
 
 
+# guards the config dict and the batching state below
+_lock = threading.RLock()
+_batch_depth = 0
+# serialized config as last read from / written to disk
+_on_disk = None
+
+
+def serialize(data: dict) -> str:
+    return json.dumps(data, indent=2)
+
+
 @lru_cache(1)
 def read() -> dict:
+    global _on_disk
     path = storage_path()
     if exists(path):
-        return json.load(open(storage_path(), "r"))
+        data = json.load(open(path, "r"))
+        _on_disk = serialize(data)
+        return data
+    _on_disk = None
     return {}
 
 
@@ -46,8 +82,56 @@ def refresh():
 
 
 def write():
-    current = read()
-    json.dump(current, open(storage_path(), "w"), indent=2)
+    """
+    Save the config, deferred to the end of the outermost batch()
+    """
+    with _lock:
+        if not _batch_depth:
+            flush()
+
+
+def flush():
+    global _on_disk
+    with _lock:
+        contents = serialize(read())
+        if contents == _on_disk:
+            return
+        path = storage_path()
+        # write a sibling temp file and rename so a crash never leaves half a config
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=".dkstudio-config.", dir=split(abspath(path))[0]
+        )
+        try:
+            with os.fdopen(fd, "w") as fp:
+                fp.write(contents)
+            if exists(path):
+                # mkstemp creates the file 0600, keep the config's own mode
+                os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        _on_disk = contents
+
+
+@contextmanager
+def batch():
+    """
+    Coalesce every set/update inside the block into a single write
+
+    The lock is only held to count batches and to flush, not across the block,
+    so other threads keep reading and writing (their writes are deferred too)
+    """
+    global _batch_depth
+    with _lock:
+        _batch_depth += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _batch_depth -= 1
+            if not _batch_depth:
+                flush()
 
 
 def has(key: str):
@@ -63,48 +147,85 @@ def get(key: str, default=NOT_SET):
 
 
 def set(key: str, value):
-    read()[key] = value
-    write()
+    with _lock:
+        read()[key] = value
+        write()
 
 
 def update(params: dict):
-    read().update(params)
-    write()
+    with _lock:
+        read().update(params)
+        write()
+
+
+# secondary indexes maintained for select_by_index
+INDEXES = {
+    "products": {
+        "title": lambda p: [p.get("title")],
+        "sku": lambda p: p.get("skus"),
+        "tag": lambda p: [t.lower() for t in p.get("tags") or []],
+    },
+    "gumroad-products": {
+        "title": lambda p: [p.get("name")],
+        "sku": lambda p: p.get("skus"),
+    },
+    "gumroad-sales": {
+        "product": lambda p: [p.get("product_id")],
+    },
+}
+
+
+@lru_cache(1)
+def backend():
+    """
+    Record storage, sqlite once it has been migrated (or SHOP_STORAGE_BACKEND)
+    """
+    load_env()
+    kind = os.environ.get("SHOP_STORAGE_BACKEND")
+    if kind is None:
+        kind = "sqlite" if exists(storage_db_path()) else "json"
+    if kind == "sqlite":
+        return SQLiteBackend(storage_db_path(), INDEXES)
+    if kind == "json":
+        return JSONDirectoryBackend(storage_dir(), INDEXES)
+    raise ValueError(f"Unknown SHOP_STORAGE_BACKEND: {kind}")
 
 
 def persist(namespace: str, id: str, obj):
-    dest = os.path.join(storage_dir(), namespace, f"{id}.json")
-    dest_dir = os.path.split(dest)[0]
-    os.makedirs(dest_dir, exist_ok=True)
-    json.dump(obj, open(dest, "w"), indent=2)
+    backend().persist(namespace, id, obj)
+
+
+def persist_many(namespace: str, items: Iterable[Tuple[str, Any]]):
+    backend().persist_many(namespace, items)
+
+
+def delete(namespace: str, id: str):
+    backend().delete(namespace, id)
 
 
 def select_keys(namespace: str):
-    dest_dir = os.path.join(storage_dir(), namespace)
-    if not os.path.exists(dest_dir):
-        return []
-    return list(
-        map(
-            lambda x: x[: -len(".json")],
-            filter(lambda x: x.endswith(".json"), os.listdir(dest_dir)),
-        )
-    )
+    return backend().select_keys(namespace)
 
 
 def select(namespace: str, id: str):
-    dest = os.path.join(storage_dir(), namespace, f"{id}.json")
-    if not os.path.exists(dest):
-        return None
-    return json.load(open(dest, "r"))
+    return backend().select(namespace, id)
+
+
+def select_many(namespace: str, ids: Iterable[str] = None):
+    return backend().select_many(namespace, ids)
+
+
+def select_by_index(namespace: str, index: str, value: str):
+    return backend().select_by_index(namespace, index, value)
 
 
-def write_file_metadata(path: str, data: Any):
-    cp = path + ".dkps.json"
+def write_file_metadata(path: str, data: Any, suffix: str = ".dkps.json"):
+    cp = path + suffix
     json.dump(data, open(cp, "w"), indent=2)
 
 
-def read_file_metadata(path: str, default=None) -> Any:
-    cp = path + ".dkps.json"
+def read_file_metadata(path: str, default=None, suffix: str = ".dkps.json") -> Any:
+    cp = path + suffix
     if not os.path.exists(cp):
         return default
     return json.load(open(cp, "r"))
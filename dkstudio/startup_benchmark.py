@@ -0,0 +1,141 @@
+import os
+import re
+import subprocess
+import sys
+from statistics import median
+from typing import Dict, List, Tuple
+
+# import time of every poetry script, so a stray top level import shows up
+
+# modules that are slow to load and only some commands need
+HEAVY_MODULES = {"tkinter", "thefuzz", "PIL", "starlette", "authlib", "uvicorn"}
+# heavy modules a command may load at import
+ALLOWED_HEAVY = {
+    "package-products": {"tkinter"},
+    "upload-products": {"tkinter"},
+}
+SCRIPT_LINE = re.compile(r'^([\w-]+)\s*=\s*"([\w.]+):(\w+)"')
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+
+
+def default_budget() -> float:
+    # milliseconds an entry point module may take to import
+    return float(os.environ.get("STARTUP_BUDGET_MS", 300))
+
+
+def pyproject_path() -> str:
+    return os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pyproject.toml"
+    )
+
+
+def read_scripts(path: str) -> Dict[str, Tuple[str, str]]:
+    """
+    {script name: (module, function)} from [tool.poetry.scripts]
+    """
+    scripts = {}
+    in_section = False
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("["):
+                in_section = line == "[tool.poetry.scripts]"
+                continue
+            match = in_section and SCRIPT_LINE.match(line)
+            if match:
+                scripts[match.group(1)] = (match.group(2), match.group(3))
+    return scripts
+
+
+def time_import(module: str, function: str) -> Tuple[float, set]:
+    """
+    Import an entry point in a fresh interpreter, returns milliseconds and the
+    top level packages it loaded
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"import {module}; {module}.{function}",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(f"importing {module} failed", result.stderr.strip())
+    total = 0
+    loaded = set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        loaded.add(match.group(4).split(".")[0])
+        if match.group(4) == module:
+            total = int(match.group(2))
+    return total / 1000, loaded
+
+
+def benchmark(scripts: Dict[str, Tuple[str, str]], repeat: int = 3) -> List[dict]:
+    results = []
+    for name, (module, function) in scripts.items():
+        try:
+            runs = [time_import(module, function) for i in range(repeat)]
+        except RuntimeError as e:
+            results.append({"script": name, "module": module, "error": str(e)})
+            continue
+        heavy = set.union(*(loaded for ms, loaded in runs)) & HEAVY_MODULES
+        results.append(
+            {
+                "script": name,
+                "module": module,
+                "ms": median(ms for ms, loaded in runs),
+                "unexpected": sorted(heavy - ALLOWED_HEAVY.get(name, set())),
+            }
+        )
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Time the import of every command's module against a budget"
+    )
+    parser.add_argument("scripts", nargs="*", help="only these commands")
+    parser.add_argument("--pyproject", default=pyproject_path())
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=default_budget(),
+        help="milliseconds per command (env STARTUP_BUDGET_MS)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per command")
+    args = parser.parse_args()
+
+    scripts = read_scripts(args.pyproject)
+    if args.scripts:
+        unknown = set(args.scripts) - set(scripts)
+        if unknown:
+            parser.error(f"unknown commands: {', '.join(sorted(unknown))}")
+        scripts = {name: scripts[name] for name in args.scripts}
+
+    failed = 0
+    for result in benchmark(scripts, args.repeat):
+        if "error" in result:
+            failed += 1
+            print(f"FAIL {result['script']}: {result['error']}")
+            continue
+        problems = []
+        if result["ms"] > args.budget:
+            problems.append(f"over the {args.budget:.0f}ms budget")
+        if result["unexpected"]:
+            problems.append(f"loads {', '.join(result['unexpected'])}")
+        failed += bool(problems)
+        print(
+            f"{'FAIL' if problems else 'ok  '} {result['script']}: "
+            f"{result['ms']:.0f}ms {'; '.join(problems)}".rstrip()
+        )
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,245 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, Tuple
+
+# record storage backends for shop_storage.persist/select
+
+# namespace -> index name -> function returning the values to index a record by
+IndexSpec = Dict[str, Dict[str, Callable[[dict], Iterable[str]]]]
+
+
+def index_values(indexes: IndexSpec, namespace: str, obj) -> Iterable[Tuple[str, str]]:
+    for name, extract in indexes.get(namespace, {}).items():
+        for value in set(extract(obj) or []):
+            if value is not None:
+                yield name, str(value)
+
+
+class JSONDirectoryBackend:
+    """
+    One json file per record under <storage_dir>/<namespace>/<id>.json
+    """
+
+    def __init__(self, path: str, indexes: IndexSpec = None):
+        self.path = path
+        self.indexes = indexes or {}
+
+    def record_path(self, namespace: str, id: str) -> str:
+        return os.path.join(self.path, namespace, f"{id}.json")
+
+    def persist(self, namespace: str, id: str, obj):
+        dest = self.record_path(namespace, id)
+        dest_dir = os.path.split(dest)[0]
+        os.makedirs(dest_dir, exist_ok=True)
+        json.dump(obj, open(dest, "w"), indent=2)
+
+    def persist_many(self, namespace: str, items: Iterable[Tuple[str, object]]):
+        for id, obj in items:
+            self.persist(namespace, id, obj)
+
+    def delete(self, namespace: str, id: str):
+        dest = self.record_path(namespace, id)
+        if os.path.exists(dest):
+            os.remove(dest)
+
+    def select_keys(self, namespace: str):
+        dest_dir = os.path.join(self.path, namespace)
+        if not os.path.exists(dest_dir):
+            return []
+        return list(
+            map(
+                lambda x: x[: -len(".json")],
+                filter(lambda x: x.endswith(".json"), os.listdir(dest_dir)),
+            )
+        )
+
+    def select(self, namespace: str, id: str):
+        dest = self.record_path(namespace, id)
+        if not os.path.exists(dest):
+            return None
+        return json.load(open(dest, "r"))
+
+    def select_many(self, namespace: str, ids: Iterable[str] = None):
+        if ids is None:
+            ids = self.select_keys(namespace)
+        for id in ids:
+            obj = self.select(namespace, id)
+            if obj is not None:
+                yield id, obj
+
+    def select_by_index(self, namespace: str, index: str, value: str):
+        # no index on disk, scan every record
+        return [
+            id
+            for id, obj in self.select_many(namespace)
+            if (index, value) in set(index_values(self.indexes, namespace, obj))
+        ]
+
+    def namespaces(self):
+        if not os.path.exists(self.path):
+            return []
+        return sorted(
+            name
+            for name in os.listdir(self.path)
+            if os.path.isdir(os.path.join(self.path, name))
+        )
+
+
+class SQLiteBackend:
+    """
+    All records in a single sqlite file with secondary indexes
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS records (
+        namespace TEXT NOT NULL,
+        id TEXT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (namespace, id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS record_index (
+        namespace TEXT NOT NULL,
+        name TEXT NOT NULL,
+        value TEXT NOT NULL,
+        id TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS record_index_lookup
+        ON record_index (namespace, name, value);
+    CREATE INDEX IF NOT EXISTS record_index_owner
+        ON record_index (namespace, id);
+    """
+
+    def __init__(self, path: str, indexes: IndexSpec = None):
+        self.path = path
+        self.indexes = indexes or {}
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def persist(self, namespace: str, id: str, obj):
+        self.persist_many(namespace, [(id, obj)])
+
+    def persist_many(self, namespace: str, items: Iterable[Tuple[str, object]]):
+        items = [(str(id), obj) for id, obj in items]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO records (namespace, id, data) VALUES (?, ?, ?)",
+                [(namespace, id, json.dumps(obj)) for id, obj in items],
+            )
+            if namespace not in self.indexes:
+                return
+            self.conn.executemany(
+                "DELETE FROM record_index WHERE namespace = ? AND id = ?",
+                [(namespace, id) for id, obj in items],
+            )
+            self.conn.executemany(
+                "INSERT INTO record_index (namespace, name, value, id) VALUES (?, ?, ?, ?)",
+                [
+                    (namespace, name, value, id)
+                    for id, obj in items
+                    for name, value in index_values(self.indexes, namespace, obj)
+                ],
+            )
+
+    def delete(self, namespace: str, id: str):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM records WHERE namespace = ? AND id = ?",
+                (namespace, str(id)),
+            )
+            self.conn.execute(
+                "DELETE FROM record_index WHERE namespace = ? AND id = ?",
+                (namespace, str(id)),
+            )
+
+    def select_keys(self, namespace: str):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id FROM records WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        return [id for (id,) in rows]
+
+    def select(self, namespace: str, id: str):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data FROM records WHERE namespace = ? AND id = ?",
+                (namespace, str(id)),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def select_many(self, namespace: str, ids: Iterable[str] = None):
+        with self.lock:
+            if ids is None:
+                rows = self.conn.execute(
+                    "SELECT id, data FROM records WHERE namespace = ?", (namespace,)
+                ).fetchall()
+            else:
+                rows = []
+                ids = [str(id) for id in ids]
+                # stay under sqlite's bound parameter limit
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start : start + 500]
+                    rows.extend(
+                        self.conn.execute(
+                            "SELECT id, data FROM records WHERE namespace = ? AND id IN (%s)"
+                            % ",".join("?" * len(chunk)),
+                            [namespace, *chunk],
+                        ).fetchall()
+                    )
+        for id, data in rows:
+            yield id, json.loads(data)
+
+    def select_by_index(self, namespace: str, index: str, value: str):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT id FROM record_index WHERE namespace = ? AND name = ? AND value = ?",
+                (namespace, index, str(value)),
+            ).fetchall()
+        return [id for (id,) in rows]
+
+    def namespaces(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT namespace FROM records ORDER BY namespace"
+            ).fetchall()
+        return [namespace for (namespace,) in rows]
+
+
+def migrate(source, destination, batch_size: int = 500):
+    """
+    Copy every record from one backend into another
+    """
+    for namespace in source.namespaces():
+        batch = []
+        count = 0
+        for item in source.select_many(namespace):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                destination.persist_many(namespace, batch)
+                count += len(batch)
+                batch = []
+        destination.persist_many(namespace, batch)
+        count += len(batch)
+        print(f"{namespace}: {count} records")
+
+
+def migrate_main():
+    import argparse
+
+    from dkstudio import shop_storage
+
+    parser = argparse.ArgumentParser(
+        description="Import the json storage directory into the sqlite storage file"
+    )
+    parser.add_argument("--source", default=shop_storage.storage_dir())
+    parser.add_argument("--destination", default=shop_storage.storage_db_path())
+    args = parser.parse_args()
+    migrate(
+        JSONDirectoryBackend(args.source, shop_storage.INDEXES),
+        SQLiteBackend(args.destination, shop_storage.INDEXES),
+    )
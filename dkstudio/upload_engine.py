@@ -0,0 +1,309 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dkstudio import shop_storage
+from dkstudio.etsy import client
+from dkstudio.marketplace import can_resend, retry_delay
+from dkstudio.manifest import hash_file
+from dkstudio.multipart import MultipartFileBody
+
+# functions for uploading product zipfiles to etsy listings
+
+# storage namespace of the persistent upload queue, keyed by job_key
+QUEUE_NAMESPACE = "upload-queue"
+# storage namespace of the last zipfile uploaded to each listing
+UPLOADS_NAMESPACE = "etsy-uploads"
+UPLOADS_NAMESPACES = {"etsy": UPLOADS_NAMESPACE}
+# product folder metadata key holding the listing id on each store, gumroad is
+# left out since it documents no endpoint for replacing a product's file
+DESTINATION_KEYS = {"etsy": "etsy_listing_id"}
+# jobs of one product upload concurrently and share its .dkps.json
+metadata_lock = threading.Lock()
+
+
+def default_workers() -> int:
+    return int(os.environ.get("UPLOAD_WORKERS", 3))
+
+
+def upload_product(shop_id, listing_id, zip_path):
+    """
+    Attach a zipfile to a listing, replacing the previous zipfile
+
+    Every zipfile attached before is removed, so a listing left with two by
+    an upload that failed after the file was attached ends up with one.
+    Returns False if the zipfile is already attached
+    """
+    existing_files_response = client.get(
+        f"/application/shops/{shop_id}/listings/{listing_id}/files"
+    )
+    existing_files = existing_files_response["results"]
+    print("Existing files:")
+    print(existing_files)
+    listing_file_ids = [
+        ef["listing_file_id"]
+        for ef in existing_files
+        if ef.get("filetype") == "application/zip"
+    ]
+    filename = os.path.split(zip_path)[1]
+    print("uploading", zip_path)
+    body = MultipartFileBody({"name": filename}, "file", zip_path, "application/zip")
+    try:
+        upload_response = client.post(
+            f"/application/shops/{shop_id}/listings/{listing_id}/files",
+            data=body,
+            headers={"Content-Type": body.content_type},
+        )
+    except Exception as e:
+        for listing_file_id in listing_file_ids:
+            if (
+                e.args[0]
+                == f"File {listing_file_id} is already attached to this listing."
+            ):
+                return False
+        raise
+    finally:
+        body.close()
+    for listing_file_id in listing_file_ids:
+        print("Removing previous zipfile", listing_file_id)
+        client.delete(
+            f"/application/shops/{shop_id}/listings/{listing_id}/files/{listing_file_id}"
+        )
+    return upload_response
+
+
+def upload_to(store: str, shop_id, listing_id, zip_path):
+    # one branch per store in DESTINATION_KEYS
+    return upload_product(shop_id, listing_id, zip_path)
+
+
+def destinations_for(metadata: dict, stores=None) -> dict:
+    """
+    Listing id by store for the stores (every store by default) a product
+    folder is mapped to
+    """
+    if stores is None:
+        stores = DESTINATION_KEYS
+    return {
+        store: str(metadata[key])
+        for store, key in DESTINATION_KEYS.items()
+        if metadata.get(key) and store in stores
+    }
+
+
+def job_key(job: dict) -> str:
+    # etsy jobs keep the bare listing id queued before other stores existed
+    store = job.get("store", "etsy")
+    if store == "etsy":
+        return job["listing_id"]
+    return f"{store}:{job['listing_id']}"
+
+
+def zip_fingerprint(zip_path: str, previous: dict = None) -> dict:
+    """
+    Size and sha256 of a zipfile, reusing the previous hash if size and mtime match
+    """
+    st = os.stat(zip_path)
+    if previous and (previous["size"], previous["mtime"]) == (st.st_size, st.st_mtime):
+        return previous
+    if previous and previous["size"] != st.st_size:
+        # different size can't be the same bytes, don't bother hashing
+        return {"size": st.st_size, "mtime": st.st_mtime, "sha256": None}
+    return {"size": st.st_size, "mtime": st.st_mtime, "sha256": hash_file(zip_path)}
+
+
+def check_uploaded(listing_id, zip_path: str, store: str = "etsy", known=None):
+    """
+    Check if these exact zipfile bytes were the last upload to a listing,
+    returns (uploaded, fingerprint of the zipfile)
+
+    known is a fingerprint taken earlier (ie carried on a queued job), like the
+    last upload's it saves hashing the zipfile while size and mtime match
+    """
+    uploaded = shop_storage.select(UPLOADS_NAMESPACES[store], str(listing_id))
+    fingerprint = zip_fingerprint(zip_path, known or uploaded)
+    if not uploaded:
+        return False, fingerprint
+    return (fingerprint["size"], fingerprint["sha256"]) == (
+        uploaded["size"],
+        uploaded["sha256"],
+    ), fingerprint
+
+
+def is_uploaded(listing_id, zip_path: str, store: str = "etsy") -> bool:
+    return check_uploaded(listing_id, zip_path, store)[0]
+
+
+def record_uploaded_file(
+    listing_id,
+    zip_path: str,
+    upload_response,
+    store: str = "etsy",
+    fingerprint: dict = None,
+):
+    fingerprint = zip_fingerprint(zip_path, fingerprint)
+    record = {
+        "size": fingerprint["size"],
+        "mtime": fingerprint["mtime"],
+        # a fingerprint only told apart from the last upload by size has no hash
+        "sha256": fingerprint["sha256"] or hash_file(zip_path),
+        "filename": os.path.basename(zip_path),
+    }
+    if upload_response and "listing_file_id" in upload_response:
+        record["listing_file_id"] = upload_response.get("listing_file_id")
+    shop_storage.persist(UPLOADS_NAMESPACES[store], str(listing_id), record)
+
+
+def record_upload(job: dict):
+    """
+    Stamp the product folder metadata with the status of an upload
+
+    last_upload keeps the etsy zipfile time, uploads has every store's status
+    """
+    if not job.get("product_src"):
+        return
+    store = job.get("store", "etsy")
+    with metadata_lock:
+        metadata = shop_storage.read_file_metadata(job["product_src"], {})
+        if job["status"] != "failed" and store == "etsy":
+            metadata["last_upload"] = job["zip_mtime"]
+        uploads = metadata.setdefault("uploads", {})
+        uploads[store] = {
+            "listing_id": job["listing_id"],
+            "status": job["status"],
+            "zip_mtime": job["zip_mtime"],
+            "updated": time.time(),
+        }
+        if job.get("error"):
+            uploads[store]["error"] = job["error"]
+        shop_storage.write_file_metadata(job["product_src"], metadata)
+
+
+class UploadEngine:
+    """
+    Uploads queued product zipfiles concurrently, retrying throttled and unsent uploads
+
+    The queue lives in shop_storage so an interrupted batch resumes on the next run,
+    failed jobs stay in it until retry_failed or a new upload to the same listing
+    """
+
+    def __init__(self, shop_id, workers: int = None, max_attempts: int = 3):
+        self.shop_id = shop_id
+        self.workers = workers or default_workers()
+        self.max_attempts = max_attempts
+
+    def enqueue(
+        self,
+        listing_id,
+        zip_path: str,
+        product_src: str = None,
+        force: bool = False,
+        store: str = "etsy",
+        fingerprint: dict = None,
+    ) -> dict:
+        """
+        Queue an upload, fingerprint is the zipfile's if the caller already took it
+        """
+        job = {
+            "shop_id": str(self.shop_id),
+            "store": store,
+            "listing_id": str(listing_id),
+            "zip_path": zip_path,
+            "product_src": product_src,
+            "zip_mtime": os.path.getmtime(zip_path),
+            "status": "pending",
+            "attempts": 0,
+            "force": force,
+        }
+        if fingerprint:
+            job["fingerprint"] = fingerprint
+        shop_storage.persist(QUEUE_NAMESPACE, job_key(job), job)
+        return job
+
+    def pending(self) -> list:
+        return [
+            job
+            for listing_id, job in shop_storage.select_many(QUEUE_NAMESPACE)
+            if job["status"] == "pending" and job["shop_id"] == str(self.shop_id)
+        ]
+
+    def failed(self) -> list:
+        return [
+            job
+            for listing_id, job in shop_storage.select_many(QUEUE_NAMESPACE)
+            if job["status"] == "failed" and job["shop_id"] == str(self.shop_id)
+        ]
+
+    def retry_failed(self) -> list:
+        """
+        Put failed jobs back in the queue
+        """
+        jobs = self.failed()
+        for job in jobs:
+            job.update(status="pending", attempts=0)
+            job.pop("error", None)
+            shop_storage.persist(QUEUE_NAMESPACE, job_key(job), job)
+        return jobs
+
+    def process(self, job: dict) -> dict:
+        store = job.get("store", "etsy")
+        uploaded = False
+        if not job.get("force"):
+            uploaded, job["fingerprint"] = check_uploaded(
+                job["listing_id"], job["zip_path"], store, job.get("fingerprint")
+            )
+        if uploaded:
+            print("skipping unchanged", job["zip_path"], "on", store)
+            job["status"] = "skipped"
+            record_upload(job)
+            shop_storage.delete(QUEUE_NAMESPACE, job_key(job))
+            return job
+        while True:
+            job["attempts"] += 1
+            try:
+                result = upload_to(
+                    store, self.shop_id, job["listing_id"], job["zip_path"]
+                )
+            except Exception as e:
+                job["error"] = str(e)
+                # a 4xx won't go away, after a 5xx the zip may already be attached
+                if not can_resend("POST", e) or job["attempts"] >= self.max_attempts:
+                    job["status"] = "failed"
+                    shop_storage.persist(QUEUE_NAMESPACE, job_key(job), job)
+                    record_upload(job)
+                    return job
+                shop_storage.persist(QUEUE_NAMESPACE, job_key(job), job)
+                delay = retry_delay({}, job["attempts"])
+                print(
+                    f"upload of {job['zip_path']} failed ({e}), retry in {delay:.1f}s"
+                )
+                time.sleep(delay)
+                continue
+            job["status"] = "uploaded" if result is not False else "already uploaded"
+            job.pop("error", None)
+            record_uploaded_file(
+                job["listing_id"],
+                job["zip_path"],
+                result,
+                store,
+                job.get("fingerprint"),
+            )
+            record_upload(job)
+            shop_storage.delete(QUEUE_NAMESPACE, job_key(job))
+            return job
+
+    def run(self, jobs: list = None):
+        """
+        Upload jobs (every pending job by default), yielding each as it finishes
+        """
+        if jobs is None:
+            jobs = self.pending()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.process, job) for job in jobs]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
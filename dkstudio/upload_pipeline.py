@@ -0,0 +1,349 @@
+import json
+import os
+import sys
+import time
+from typing import Optional
+
+from dkstudio import shop_storage
+from dkstudio.catalog import ProductCatalog
+from dkstudio.manifest import is_package_stale
+from dkstudio.package_products import package_product, package_product_dir
+from dkstudio.upload_engine import (
+    DESTINATION_KEYS,
+    UploadEngine,
+    check_uploaded,
+    destinations_for,
+    job_key,
+)
+from dkstudio.workspace import (
+    find_product_dirs,
+    get_project_name_from_project_dir,
+    scan_workspace,
+)
+
+# the find -> package -> upload pipeline shared by the uploader app and the batch command
+
+
+class EtsyWorkflow:
+    @staticmethod
+    def associate_product_dir_with_listing(
+        product_folder: str, config: dict, catalog: ProductCatalog
+    ):
+        shop_storage.write_file_metadata(product_folder, config)
+        shop_storage.persist(
+            "etsy-product-dir", config["etsy_listing_id"], product_folder
+        )
+        catalog.mark_mapped(config["etsy_listing_id"])
+
+    @staticmethod
+    def get_unmapped_products(catalog: ProductCatalog):
+        return catalog.unmapped()
+
+
+class UploadPolicy:
+    """
+    The decisions the pipeline needs answered, by a person or by flags
+    """
+
+    def warn(self, title: str, message: str):
+        print(f"{title}: {message}")
+
+    def package_missing_zip(self, product_name: str, zip_path: str) -> bool:
+        return False
+
+    def repackage_stale_zip(self, product_name: str) -> Optional[bool]:
+        """
+        True to repackage, False to upload the zip as is, None to skip the product
+        """
+        return None
+
+    def associate(self, product_src: str, catalog: ProductCatalog) -> Optional[str]:
+        """
+        Pick a listing for an unmapped product folder, None to skip it
+        """
+        return None
+
+    def upload_unchanged(self, product_name: str) -> bool:
+        return False
+
+    def confirm_upload(self, product_name: str, destinations: dict) -> bool:
+        return True
+
+
+class UploadPipeline:
+    """
+    Turns product folders into queued uploads, recording what happened to each
+    """
+
+    def __init__(
+        self,
+        shop_id,
+        policy: UploadPolicy,
+        catalog: ProductCatalog = None,
+        uploader: UploadEngine = None,
+        stores: list = None,
+    ):
+        self.shop_id = shop_id
+        self.policy = policy
+        # stores to upload to, every store when not given
+        self.stores = stores
+        # an empty catalog is falsy, it is still the one the app keeps current
+        self.catalog = catalog if catalog is not None else ProductCatalog.load()
+        self.uploader = uploader if uploader is not None else UploadEngine(shop_id)
+        # product outcomes that never reached the uploader
+        self.outcomes = []
+
+    def skip(self, status: str, zip_path: str, product_name: str = None, **extra):
+        self.outcomes.append(
+            dict(status=status, zip_path=zip_path, product_name=product_name, **extra)
+        )
+
+    def find_zip_paths(self, project_dirs: list):
+        for apath in project_dirs:
+            entries = scan_workspace(apath, depth=1)
+            if not entries:
+                self.policy.warn(
+                    "Could not find product file", "Product dir not found in %s" % apath
+                )
+                self.skip("missing product dir", apath)
+                continue
+            product_dir = entries[0].product_dir
+            zip_file = entries[0].zip_path
+            if entries[0].has_zip:
+                yield zip_file
+                continue
+            product_name = get_project_name_from_project_dir(product_dir)
+            if self.policy.package_missing_zip(product_name, zip_file):
+                package_product_dir(product_dir)
+                yield zip_file
+            else:
+                self.policy.warn(
+                    "Could not find product file", "Zip file not found %s" % zip_file
+                )
+                self.skip("missing zip", zip_file, product_name)
+
+    def lookup_listing(self, product_src: str) -> Optional[dict]:
+        """
+        Product folder metadata with a listing id, associating the folder if needed
+        """
+        metadata = shop_storage.read_file_metadata(product_src)
+        if metadata and "etsy_listing_id" in metadata:
+            return metadata
+        product_name = get_project_name_from_project_dir(product_src)
+        listing_id = self.catalog.lookup(product_name) or self.policy.associate(
+            product_src, self.catalog
+        )
+        if not listing_id:
+            return None
+        metadata = dict(metadata or {}, etsy_listing_id=listing_id)
+        metadata.setdefault("product_name", product_name)
+        EtsyWorkflow.associate_product_dir_with_listing(
+            product_src, metadata, self.catalog
+        )
+        return metadata
+
+    def prepare_upload(self, zip_path: str) -> list:
+        """
+        Decide whether a product zipfile should be uploaded and queue a job
+        for every store the product is mapped to
+        """
+        product_dir, project_filename = os.path.split(zip_path)
+        product_src = os.path.join(
+            product_dir, os.path.splitext(project_filename)[0] + "_FILES"
+        )
+        if not os.path.exists(product_src):
+            self.policy.warn(
+                "warning",
+                "Could not find product directory '%s', skipped product upload"
+                % product_src,
+            )
+            self.skip("missing product dir", zip_path)
+            return []
+        metadata = self.lookup_listing(product_src)
+        if not metadata:
+            self.skip(
+                "unmapped", zip_path, get_project_name_from_project_dir(product_src)
+            )
+            return []
+        product_name = metadata["product_name"]
+        listing_id = metadata["etsy_listing_id"]
+        destinations = destinations_for(metadata, self.stores)
+        for store in self.stores or ():
+            if store not in destinations:
+                self.policy.warn(
+                    "No destination",
+                    f"Product '{product_name}' is not mapped to a {store} listing",
+                )
+                self.skip("no destination", zip_path, product_name, store=store)
+        if not destinations:
+            return []
+
+        if is_package_stale(product_src, zip_path):
+            repackage = self.policy.repackage_stale_zip(product_name)
+            if repackage is None:
+                self.skip("stale", zip_path, product_name, listing_id=listing_id)
+                return []
+            if repackage:
+                package_product(
+                    product_dir, os.path.basename(product_src), project_filename
+                )
+
+        changed = {}
+        fingerprints = {}
+        for store, destination_id in destinations.items():
+            uploaded, fingerprints[store] = check_uploaded(
+                destination_id, zip_path, store
+            )
+            if not uploaded:
+                changed[store] = destination_id
+        force = False
+        if not changed:
+            force = self.policy.upload_unchanged(product_name)
+        elif not self.policy.confirm_upload(product_name, changed):
+            self.skip("declined", zip_path, product_name, listing_id=listing_id)
+            return []
+        # unchanged stores are queued anyway so the uploader skips and counts them
+        return [
+            self.uploader.enqueue(
+                destination_id,
+                zip_path,
+                product_src,
+                force=force,
+                store=store,
+                fingerprint=fingerprints[store],
+            )
+            for store, destination_id in destinations.items()
+        ]
+
+    def queue_products(self, product_dirs: list) -> list:
+        jobs = []
+        for zip_path in self.find_zip_paths(product_dirs):
+            jobs.extend(self.prepare_upload(zip_path))
+        return jobs
+
+
+class BatchPolicy(UploadPolicy):
+    """
+    Non-interactive answers for unattended runs
+    """
+
+    def __init__(self, stale: str = "repackage", unchanged: str = "skip"):
+        self.stale = stale
+        self.unchanged = unchanged
+
+    def package_missing_zip(self, product_name, zip_path):
+        return self.stale == "repackage"
+
+    def repackage_stale_zip(self, product_name):
+        return {"repackage": True, "upload": False, "skip": None}[self.stale]
+
+    def upload_unchanged(self, product_name):
+        return self.unchanged == "upload"
+
+
+def summarize(outcomes: list) -> dict:
+    counts = {}
+    for outcome in outcomes:
+        counts[outcome["status"]] = counts.get(outcome["status"], 0) + 1
+    return counts
+
+
+def main():
+    import argparse
+
+    shop_storage.load_env()
+    parser = argparse.ArgumentParser(
+        description="Package and upload every product in a workspace without prompting"
+    )
+    parser.add_argument(
+        "workspace",
+        nargs="?",
+        default=shop_storage.get("workspace_path"),
+        help="workspace or product folder, defaults to the last used workspace",
+    )
+    parser.add_argument("--shop-id", default=os.environ.get("ETSY_SHOP_ID"))
+    parser.add_argument(
+        "--stale",
+        choices=["repackage", "upload", "skip"],
+        default="repackage",
+        help="what to do with zips older than their product folder",
+    )
+    parser.add_argument(
+        "--up-to-date",
+        choices=["skip", "upload"],
+        default="skip",
+        help="what to do with zips already uploaded to their listing",
+    )
+    parser.add_argument(
+        "--unmapped",
+        choices=["skip", "fail"],
+        default="skip",
+        help="whether product folders without a listing fail the run",
+    )
+    parser.add_argument(
+        "--store",
+        action="append",
+        choices=sorted(DESTINATION_KEYS),
+        help="upload to this store, repeatable, defaults to every store",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="queue the uploads that failed in earlier runs again",
+    )
+    parser.add_argument("--workers", type=int, help="concurrent uploads")
+    parser.add_argument("--report", help="write a json summary here, - for stdout")
+    args = parser.parse_args()
+    if not args.workspace:
+        parser.error("no workspace given")
+    if not args.shop_id:
+        parser.error("no shop id given (--shop-id or ETSY_SHOP_ID)")
+
+    started = time.time()
+    pipeline = UploadPipeline(
+        args.shop_id,
+        BatchPolicy(stale=args.stale, unchanged=args.up_to_date),
+        uploader=UploadEngine(args.shop_id, workers=args.workers),
+        stores=args.store,
+    )
+    if args.retry_failed:
+        print(f"Retrying {len(pipeline.uploader.retry_failed())} failed uploads")
+    product_dirs = find_product_dirs(args.workspace)
+    print(f"Found {len(product_dirs)} products")
+    pipeline.queue_products(product_dirs)
+    finished = []
+    # includes anything left over from an interrupted batch
+    for job in pipeline.uploader.run():
+        print(f"{job['status']} ({job.get('store', 'etsy')}): {job['zip_path']}")
+        finished.append(job)
+    outcomes = pipeline.outcomes + finished
+    counts = summarize(outcomes)
+    # failures left in the queue by earlier runs
+    attempted = {job_key(job) for job in finished}
+    earlier_failures = [
+        job for job in pipeline.uploader.failed() if job_key(job) not in attempted
+    ]
+    report = {
+        "workspace": args.workspace,
+        "started": started,
+        "finished": time.time(),
+        "counts": counts,
+        "products": outcomes,
+        "earlier_failures": earlier_failures,
+    }
+    if args.report == "-":
+        json.dump(report, sys.stdout, indent=2)
+    elif args.report:
+        json.dump(report, open(args.report, "w"), indent=2)
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
+    for job in earlier_failures:
+        print(
+            f"still failed ({job.get('store', 'etsy')}): {job['zip_path']}: {job['error']}"
+        )
+    if earlier_failures:
+        print(f"{len(earlier_failures)} earlier failures, rerun with --retry-failed")
+
+    if counts.get("failed") or counts.get("no destination"):
+        sys.exit(1)
+    if args.unmapped == "fail" and counts.get("unmapped"):
+        sys.exit(2)
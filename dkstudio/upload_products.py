@@ -1,163 +1,68 @@
-import glob
 import os
-from thefuzz import process
-from dkstudio import shop_storage
-from dkstudio.package_products import package_product
-from dkstudio.etsy import client
-from dkstudio.etsy.list_products import populate_product_catalog
-
-# functions for finding an uploading products
-
-
-def find_product_dirs(indir: str, depth: int = 2):
-    # product dir ends with _FILES
-    if indir.endswith("_FILES"):
-        return [indir]
-    search = "*_FILES"
-    # perform depth search
-    for i in range(depth):
-        all_paths = glob.glob(os.path.join(indir, search))
-        if len(all_paths):
-            return all_paths
-        else:
-            search = "*/" + search
-    return None
-
-
-def find_project_dirs(indir: str):
-    # project dir contains an _FILES product folder
-    all_paths = find_product_dirs(indir)
-    if len(all_paths):
-        return [os.path.split(p)[0] for p in all_paths]
-    return all_paths
-
-
-def get_project_name_from_project_dir(project_dir: str):
-    assert project_dir.endswith("_FILES")
-    return os.path.split(project_dir)[1][: -len("_FILES")].replace("_", " ").strip()
-
-
-def read_name_mapping_from_product_catalog():
-    listing_ids = shop_storage.select_keys("products")
-    print("known listing_ids", listing_ids)
-    lookups = {}
-    for listing_id in listing_ids:
-        product = shop_storage.select("products", listing_id)
-        assert product, listing_id
-        tags = set(map(lambda x: x.lower(), product.get("tags")))
-        is_mug_press = "cricut mug press svg" in tags
-        for sku in product.get("skus"):
-            lookups[sku] = listing_id
-            if is_mug_press:
-                lookups[sku + " Mug"] = listing_id
-                lookups[sku + " Mug Press"] = listing_id
-        lookups[product["title"]] = listing_id
-    return lookups
-
-
-def upload_product(shop_id, listing_id, zip_path):
-    existing_files_response = client.get(
-        f"/application/shops/{shop_id}/listings/{listing_id}/files"
-    )
-    existing_files = existing_files_response["results"]
-    print("Existing files:")
-    print(existing_files)
-    listing_file_id = None
-    for ef in existing_files:
-        if ef.get("filetype") == "application/zip":
-            listing_file_id = ef["listing_file_id"]
-    filename = os.path.split(zip_path)[1]
-    print("uploading", zip_path)
-    filep = open(zip_path, "rb")
-    try:
-        upload_response = client.post(
-            f"/application/shops/{shop_id}/listings/{listing_id}/files",
-            data={"name": filename},
-            files={"file": (filename, filep, "application/zip")},
-        )
-    except Exception as e:
-        if listing_file_id:
-            if (
-                e.args[0]
-                == f"File {listing_file_id} is already attached to this listing."
-            ):
-                messagebox.showinfo(
-                    "Zipfile already uploaded", f"{filename} is already uploaded"
-                )
-                return False
-        raise
-    if listing_file_id:
-        print("Removing previous zipfile")
-        client.delete(
-            f"/application/shops/{shop_id}/listings/{listing_id}/files/{listing_file_id}"
-        )
-    return upload_response
-
-
-# UI routines
-
 from tkinter import Button, Tk
-
 from tkinter.filedialog import askdirectory, askopenfilename
 from tkinter import messagebox
 from tkinter.ttk import Style
 
-from dkstudio.ux import iterate_with_dialog, asklist
-
+from dkstudio import shop_storage
+from dkstudio.catalog import ProductCatalog
+from dkstudio.upload_engine import UploadEngine
+from dkstudio.upload_pipeline import (
+    EtsyWorkflow,
+    UploadPipeline,
+    UploadPolicy,
+    get_project_name_from_project_dir,
+)
+from dkstudio.ux import iterate_with_dialog, asklist, askworkspace, run_on_main
+from dkstudio.workspace import find_product_dirs
+
+# the product uploader app, matching and catalog sync load when first used
+
+
+class TkUploadPolicy(UploadPolicy):
+    """
+    Ask the person at the uploader app
+
+    Runs on TaskRunner workers, so dialogs go through run_on_main
+    """
+
+    def __init__(self, app: "PackageApp"):
+        self.app = app
+
+    def warn(self, title, message):
+        run_on_main(messagebox.showwarning, title, message)
+
+    def package_missing_zip(self, product_name, zip_path):
+        return run_on_main(
+            messagebox.askyesno,
+            "Zipfile is stale:",
+            f"Product '{product_name}' has been modified since the zipfile has been created, should we update the zipfile?",
+        )
 
-def find_zip_paths(project_dirs: list[str]):
-    for apath in project_dirs:
-        if apath.endswith("_FILES"):
-            product_dirs = [apath]
-        else:
-            product_dirs = glob.glob(os.path.join(apath, "*_FILES"))
-        if not product_dirs:
-            messagebox.showerror(
-                "Could not find product file", "Product dir not found in %s" % apath
-            )
-            continue
-        product_dir = product_dirs[0]
-        zip_file = os.path.join(apath, product_dir[: -len("_FILES")] + ".zip")
-        if os.path.isfile(zip_file):
-            yield zip_file
-        else:
-            # generate?
-            product_name = get_project_name_from_project_dir(product_dir)
-            zip_response = messagebox.askyesno(
-                "Zipfile is stale:",
-                f"Product '{product_name}' has been modified since the zipfile has been created, should we update the zipfile?",
-            )
-            if zip_response:
-                # update zip
-                package_product(product_dir, product_dir, zip_file)
-                messagebox.showinfo(
-                    "Packaged product", "Zip file created %s" % zip_file
-                )
-            else:
-                messagebox.showerror(
-                    "Could not find product file", "Zip file not found %s" % zip_file
-                )
+    def repackage_stale_zip(self, product_name):
+        return run_on_main(
+            messagebox.askyesnocancel,
+            "Zipfile is stale:",
+            f"Product '{product_name}' has been modified since the zipfile has been created, should we update the zipfile?",
+        )
 
+    def associate(self, product_src, catalog):
+        return run_on_main(self.app.choose_listing, product_src)
 
-class EtsyWorkflow:
-    @staticmethod
-    def associate_product_dir_with_listing(product_folder: str, config: dict):
-        shop_storage.write_file_metadata(product_folder, config)
-        shop_storage.persist(
-            "etsy-product-dir", config["etsy_listing_id"], product_folder
+    def upload_unchanged(self, product_name):
+        return run_on_main(
+            messagebox.askokcancel,
+            "Product is already up to date",
+            f"Product '{product_name}' was already uploaded with this zipfile, continue with upload?",
         )
 
-    @staticmethod
-    def get_unmapped_products():
-        listing_ids = filter(
-            lambda listing_id: shop_storage.select("etsy-product-dir", listing_id)
-            is None,
-            shop_storage.select_keys("products"),
+    def confirm_upload(self, product_name, destinations):
+        found = ", ".join(f"{store}: '{id}'" for store, id in destinations.items())
+        return run_on_main(
+            messagebox.askokcancel,
+            "Product Listing Found",
+            f"Product '{product_name}' found on {found}, continue with upload?",
         )
-        available_listings = [
-            shop_storage.select("products", listing_id) for listing_id in listing_ids
-        ]
-        return available_listings
 
 
 class PackageApp(Tk):
@@ -188,51 +93,124 @@ class PackageApp(Tk):
             command=self.sync_product_catalog,
         )
         self.sync_product_catalog_btn.grid(row=3, column=0, padx=5, pady=5)
-        self.lookups = read_name_mapping_from_product_catalog()
+        self.catalog = ProductCatalog.load()
         self.shop_id = os.environ["ETSY_SHOP_ID"]
+        self.uploader = UploadEngine(self.shop_id)
+        self.pipeline = UploadPipeline(
+            self.shop_id, TkUploadPolicy(self), self.catalog, self.uploader
+        )
+        self.after(0, self.resume_uploads)
+
+    def resume_uploads(self):
+        pending = self.uploader.pending()
+        if pending and messagebox.askyesno(
+            "Interrupted uploads",
+            f"{len(pending)} upload(s) did not finish last time, resume them now?",
+        ):
+            self.run_uploads(pending)
+
+    def run_uploads(self, jobs: list):
+        """
+        Upload queued jobs in the background, then summarize the batch
+        """
+        finished = []
+
+        def describe(job):
+            finished.append(job)
+            store = job.get("store", "etsy")
+            return f"{job['status']} ({store}): {os.path.basename(job['zip_path'])}"
+
+        iterate_with_dialog(self, map(describe, self.uploader.run(jobs)), len(jobs))
+        counts = {}
+        for job in finished:
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        summary = ", ".join(f"{count} {status}" for status, count in counts.items())
+        failures = [job for job in finished if job["status"] == "failed"]
+        if failures:
+            run_on_main(
+                messagebox.showerror,
+                "Uploads failed",
+                summary
+                + "\n"
+                + "\n".join(f"{job['zip_path']}: {job['error']}" for job in failures),
+            )
+        else:
+            run_on_main(messagebox.showinfo, "Done", summary or "Nothing uploaded")
+        return finished
 
     def sync_product_catalog(self):
+        from dkstudio.etsy.list_products import populate_product_catalog
+        from dkstudio.matching import MatchIndex, accept_matches
+
         iterate_with_dialog(
-            self, map(lambda p: p.get("title"), populate_product_catalog(self.shop_id))
+            self,
+            map(
+                lambda p: p.get("title"),
+                populate_product_catalog(self.shop_id, self.catalog),
+            ),
         )
-        self.lookups = read_name_mapping_from_product_catalog()
 
-        workspace_dir = askdirectory(
-            initialdir=shop_storage.get("workspace_path", os.getcwd()),
-            mustexist=True,
-            title="Select Workspace",
-        )
+        workspace_dir = askworkspace(title="Select Workspace")
         product_folders = find_product_dirs(workspace_dir)
         if not product_folders:
             messagebox.showwarning(
                 "No Products Found", "No product folders ending with _FILES found"
             )
             return
-        listing_ids = set(shop_storage.select_keys("products"))
+        listing_ids = set(self.catalog.listings)
         to_resolve = []
         mapped_count = 0
         for product_folder in product_folders:
             config = shop_storage.read_file_metadata(product_folder, {})
             product_name = get_project_name_from_project_dir(product_folder)
             # skip if listing is already mapped
-            if "etsy_listing_id" in config and config["etsy_listing_id"] in listing_ids:
-                listing_ids.remove(config["etsy_listing_id"])
+            if (
+                "etsy_listing_id" in config
+                and str(config["etsy_listing_id"]) in listing_ids
+            ):
+                listing_ids.remove(str(config["etsy_listing_id"]))
                 continue
             if "product_name" not in config:
                 config["product_name"] = product_name
             # auto associate on direct match (ie sku)
-            if product_name in self.lookups:
-                config["etsy_listing_id"] = self.lookups[product_name]
-                EtsyWorkflow.associate_product_dir_with_listing(product_folder, config)
+            listing_id = self.catalog.lookup(product_name)
+            if listing_id:
+                config["etsy_listing_id"] = listing_id
+                EtsyWorkflow.associate_product_dir_with_listing(
+                    product_folder, config, self.catalog
+                )
                 mapped_count += 1
             else:
                 # select on of...
                 to_resolve.append(product_folder)
             shop_storage.write_file_metadata(product_folder, config)
+        # score every unresolved folder in one pass, keep the confident ones
+        names = {
+            product_folder: get_project_name_from_project_dir(product_folder)
+            for product_folder in to_resolve
+        }
+        # keyed by folder, two folders can share a product name
+        matches = MatchIndex(self.catalog.unmapped()).match_all(names)
+        accepted = accept_matches(matches, names)
         for product_folder in to_resolve:
-            if self.prompt_for_product_association(product_folder) is None:
-                break
-            else:
+            record = accepted.get(product_folder)
+            if record is None:
+                continue
+            EtsyWorkflow.associate_product_dir_with_listing(
+                product_folder,
+                {
+                    "product_name": names[product_folder],
+                    "etsy_listing_id": record.listing_id,
+                },
+                self.catalog,
+            )
+            mapped_count += 1
+        for product_folder in to_resolve:
+            if product_folder in accepted:
+                continue
+            if self.prompt_for_product_association(
+                product_folder, matches[product_folder]
+            ):
                 mapped_count += 1
 
         messagebox.showinfo(
@@ -242,11 +220,7 @@ class PackageApp(Tk):
     def select_workspace(self):
         self.select_workspace_btn["state"] = "disabled"
         try:
-            indir = askdirectory(
-                initialdir=shop_storage.get("workspace_path", os.getcwd()),
-                mustexist=True,
-                title="Select Workspace",
-            )
+            indir = askworkspace(title="Select Workspace")
             if indir:
                 all_paths = find_product_dirs(indir)
                 if not all_paths:
@@ -260,10 +234,13 @@ class PackageApp(Tk):
                 )
                 if not confirm:
                     return
-                zip_paths = find_zip_paths(all_paths)
-                iterate_with_dialog(self, map(self.upload_product, zip_paths), count)
-                messagebox.showinfo("Done", "Uploaded %s product(s)" % count)
-                shop_storage.set("workspace_path", indir)
+                iterate_with_dialog(
+                    self,
+                    map(self.queue_upload, self.pipeline.find_zip_paths(all_paths)),
+                    count,
+                )
+                # includes anything left over from an interrupted batch
+                self.run_uploads(self.uploader.pending())
         finally:
             self.select_workspace_btn["state"] = "normal"
 
@@ -288,7 +265,7 @@ class PackageApp(Tk):
                         "Product files not found", "Product files not found"
                     )
                     return
-                zip_paths = find_zip_paths(all_paths)
+                zip_paths = self.pipeline.find_zip_paths(all_paths)
                 iterate_with_dialog(
                     self, map(self.upload_product_with_message, zip_paths), count
                 )
@@ -310,106 +287,70 @@ class PackageApp(Tk):
         finally:
             self.select_zipfile_btn["state"] = "normal"
 
+    def queue_upload(self, zip_path):
+        jobs = self.prepare_upload(zip_path)
+        return f"{'queued' if jobs else 'skipped'}: {os.path.basename(zip_path)}"
+
     def upload_product_with_message(self, zip_path):
-        product_name = self.upload_product(zip_path)
-        if product_name:
-            messagebox.showinfo("Done", "Uploaded %s" % product_name)
-        return product_name
+        jobs = self.prepare_upload(zip_path)
+        if jobs:
+            self.run_uploads(jobs)
+        return jobs
+
+    def prompt_for_product_association(self, product_src: str, matches=None):
+        listing_id = self.choose_listing(product_src, matches)
+        if not listing_id:
+            return False
+        config = {
+            "product_name": get_project_name_from_project_dir(product_src),
+            "etsy_listing_id": listing_id,
+        }
+        EtsyWorkflow.associate_product_dir_with_listing(
+            product_src, config, self.catalog
+        )
+        return listing_id
 
-    def prompt_for_product_association(self, product_src: str):
+    def choose_listing(self, product_src: str, matches=None):
+        """
+        Ask which unmapped listing a product folder belongs to
+
+        matches are the precomputed MatchIndex candidates for the folder
+        """
         product_name = get_project_name_from_project_dir(product_src)
-        available_listings = EtsyWorkflow.get_unmapped_products()
-        config = {"product_name": product_name}
-        options = [av["title"] for av in available_listings]
-        likely_options: list = [
-            label for label, score in process.extract(product_name, options, limit=5)
+        if matches is None:
+            from dkstudio.matching import MatchIndex
+
+            available_listings = EtsyWorkflow.get_unmapped_products(self.catalog)
+            matches = MatchIndex(available_listings).match(product_name)
+        # listings picked for earlier folders are no longer available
+        likely = [
+            record
+            for record, score in matches
+            if not self.catalog.is_mapped(record.listing_id)
         ]
         likely_index = asklist(
             "Please map product",
             f'Which esty product is "{product_name}"?',
-            likely_options,
+            [record.title for record in likely],
         )
-        index = (
-            options.index(likely_options[likely_index])
-            if likely_index is not None
-            else None
+        if likely_index is not None:
+            return likely[likely_index].listing_id
+        messagebox.showwarning(
+            "warning",
+            "Could not find product metadata for '%s', skipped product upload"
+            % product_src,
         )
-        if index is not None:
-            config["etsy_listing_id"] = available_listings[index]["listing_id"]
-            EtsyWorkflow.associate_product_dir_with_listing(product_src, config)
-            return config["etsy_listing_id"]
-        else:
-            messagebox.showwarning(
-                "warning",
-                "Could not find product metadata for '%s', skipped product upload"
-                % product_src,
-            )
-            return False
-
-    def upload_product(self, zip_path):
-        product_dir, project_filename = os.path.split(zip_path)
-        product_src = os.path.join(
-            product_dir, os.path.splitext(project_filename)[0] + "_FILES"
-        )
-        if not os.path.exists(product_src):
-            messagebox.showwarning(
-                "warning",
-                "Could not find product directory '%s', skipped product upload"
-                % product_src,
-            )
-            return
-        metadata = shop_storage.read_file_metadata(product_src)
-        if not metadata or "etsy_listing_id" not in metadata:
-            if not self.prompt_for_product_association(product_src):
-                return
-            metadata = shop_storage.read_file_metadata(product_src)
-        product_name = metadata["product_name"]
-
-        zip_modified_time = os.path.getmtime(zip_path)
-        if zip_modified_time < os.path.getmtime(product_src):
-            zip_response = messagebox.askyesnocancel(
-                "Zipfile is stale:",
-                f"Product '{product_name}' has been modified since the zipfile has been created, should we update the zipfile?",
-            )
-            if zip_response is None:
-                return
-            if zip_response:
-                # update zip
-                package_product(product_dir, product_src, zip_path)
-                zip_modified_time = os.path.getmtime(zip_path)
-
-        last_upload = metadata.get("last_upload")
-        if last_upload is not None and last_upload >= zip_modified_time:
-            confirm = messagebox.askokcancel(
-                "Product is already up to date",
-                f"Product '{product_name}' has an upload timestamp newer than the zipfile, continue with upload?",
-            )
-            if not confirm:
-                return
-
-        listing_id = metadata.get("etsy_listing_id", None)
+        return None
 
-        if not listing_id:
-            messagebox.showwarning(
-                "warning",
-                f"Could not find listing id for product {product_name} '{listing_id}', skipped product upload",
-            )
-            return
-        confirm = messagebox.askokcancel(
-            "Product Listing Found",
-            f"Product '{product_name}' found on etsy: '{listing_id}', continue with upload?",
-        )
-        if not confirm:
-            return
-        self.update()
-        if upload_product(self.shop_id, listing_id, zip_path) is False:
-            return
-        metadata["last_upload"] = zip_modified_time
-        shop_storage.write_file_metadata(product_src, metadata)
-        return product_name
+    def prepare_upload(self, zip_path):
+        """
+        Confirm a product zipfile with the user and queue it for every store
+        """
+        return self.pipeline.prepare_upload(zip_path)
 
 
 def main():
+    shop_storage.load_env()
     app = PackageApp()
     s = Style(app)
     if "aqua" in s.theme_names():
@@ -1,37 +1,191 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
 from tkinter import Button, Listbox, Tk, Toplevel, Label, StringVar, HORIZONTAL
 from tkinter import messagebox
+from tkinter.filedialog import askdirectory
 from tkinter.simpledialog import Dialog
 
 from tkinter.ttk import Combobox, Progressbar
-from typing import Iterable
+from typing import Callable, Iterable
+
+from dkstudio import shop_storage
+
+# milliseconds between checks of the worker's progress queue
+POLL_INTERVAL = 50
+
+# the TaskRunner driving the current worker thread
+_local = threading.local()
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    return f"{minutes}m{seconds:02d}s"
+
+
+class TaskRunner:
+    """
+    Iterate a generator on a worker thread while a dialog shows its progress
+
+    The worker posts to a queue that the Tk main loop polls with after(), so
+    the window stays responsive during network calls and packaging. Tk must
+    only be touched from the main thread, code running in the worker shows
+    dialogs through run_on_main.
+    """
+
+    def __init__(self, root: Tk, iterable: Iterable, maximum: int = None):
+        self.root = root
+        self.iterable = iterable
+        self.maximum = maximum
+        self.messages = queue.Queue()
+        self.cancelled = threading.Event()
+        self.count = 0
+        self.results = []
+        self.error = None
+        self.started = None
+
+        self.top = Toplevel(root)
+        self.top.protocol("WM_DELETE_WINDOW", self.cancel)
+        self.status = Label(self.top, text="processing")
+        self.bar = Progressbar(
+            self.top,
+            orient=HORIZONTAL,
+            length=100,
+            maximum=maximum,
+            mode="indeterminate" if maximum is None else "determinate",
+        )
+        self.rate = Label(self.top, text="")
+        self.cancel_btn = Button(self.top, text="Cancel", command=self.cancel)
+        self.status.grid(row=0)
+        self.bar.grid(row=1)
+        self.rate.grid(row=2)
+        self.cancel_btn.grid(row=3, pady=5)
+
+    def start(self):
+        self.started = time.monotonic()
+        if self.maximum is None:
+            self.bar.start()
+        threading.Thread(target=self.work, daemon=True).start()
+        self.root.after(POLL_INTERVAL, self.poll)
+        return self
+
+    def wait(self) -> list:
+        """
+        Block until the worker finishes while still processing Tk events
+        """
+        self.root.wait_window(self.top)
+        if self.error is not None:
+            messagebox.showerror("Unhandled exception", str(self.error))
+        return self.results
+
+    def cancel(self):
+        self.cancelled.set()
+        self.cancel_btn["state"] = "disabled"
+        self.status["text"] = "cancelling..."
+
+    def work(self):
+        _local.runner = self
+        iterator = iter(self.iterable)
+        try:
+            for item in iterator:
+                self.messages.put(("item", item))
+                if self.cancelled.is_set():
+                    break
+        except Exception as e:
+            self.messages.put(("error", e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+            _local.runner = None
+            self.messages.put(("done", None))
+
+    def post(self, item):
+        """
+        Report progress from the worker without producing a result
+        """
+        self.messages.put(("status", item))
+
+    def call(self, func: Callable, *args, **kwargs):
+        """
+        Run func on the main thread and wait for its result
+        """
+        future = Future()
+        self.messages.put(("call", (future, func, args, kwargs)))
+        return future.result()
+
+    def poll(self):
+        try:
+            while True:
+                kind, payload = self.messages.get_nowait()
+                if kind == "item":
+                    self.count += 1
+                    self.results.append(payload)
+                    self.status["text"] = str(payload)
+                    if self.maximum is not None:
+                        self.bar.step(1)
+                    self.show_rate()
+                elif kind == "status":
+                    self.status["text"] = str(payload)
+                elif kind == "call":
+                    future, func, args, kwargs = payload
+                    try:
+                        future.set_result(func(*args, **kwargs))
+                    except Exception as e:
+                        future.set_exception(e)
+                elif kind == "error":
+                    self.error = payload
+                elif kind == "done":
+                    self.top.destroy()
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(POLL_INTERVAL, self.poll)
+
+    def show_rate(self):
+        elapsed = time.monotonic() - self.started
+        if not elapsed:
+            return
+        rate = self.count / elapsed
+        text = f"{self.count} done, {rate:.2f}/s"
+        if self.maximum:
+            remaining = max(self.maximum - self.count, 0)
+            text += f", {format_duration(remaining / rate)} left"
+        self.rate["text"] = text
+
+
+def run_on_main(func: Callable, *args, **kwargs):
+    """
+    Call func on the Tk main thread, ie to show a dialog from a TaskRunner worker
+    """
+    runner = getattr(_local, "runner", None)
+    if runner is None:
+        return func(*args, **kwargs)
+    return runner.call(func, *args, **kwargs)
 
 
 def iterate_with_dialog(root: Tk, iterable: Iterable, maximum: int = None):
     """
-    Present a dialog that iterates through a generator
+    Present a dialog that iterates through a generator in the background
+
+    Returns the items produced once the generator finishes or is cancelled
     """
-    t = Toplevel(root)
-    status = Label(t, text="processing")
-    bar = Progressbar(
-        t,
-        orient=HORIZONTAL,
-        length=100,
-        maximum=maximum,
-        mode="indeterminate" if maximum is None else "determinate",
-    )
-    status.grid(row=0)
-    bar.grid(row=1)
-    bar.start()
-    root.update()
-    try:
+    runner = getattr(_local, "runner", None)
+    if runner is not None:
+        # already on a worker, report through the dialog that is showing
+        results = []
         for msg in iterable:
-            status["text"] = str(msg)
-            bar.step(1)
-            root.update()
-    except Exception as e:
-        messagebox.showerror("Unhandled exception", str(e))
-    finally:
-        t.destroy()
+            runner.post(msg)
+            results.append(msg)
+            if runner.cancelled.is_set():
+                break
+        return results
+    return TaskRunner(root, iterable, maximum).start().wait()
 
 
 class ListDialog(Dialog):
@@ -69,3 +223,19 @@ def asklist(
 ):
     ld = ListDialog(title, prompt, options, **kw)
     return ld.result
+
+
+def askworkspace(**kw) -> str:
+    """
+    Ask for a workspace folder, starting from and remembering the last one
+    """
+    # the default written on first use and the choice go out in one write
+    with shop_storage.batch():
+        indir = askdirectory(
+            initialdir=shop_storage.get("workspace_path", os.getcwd()),
+            mustexist=True,
+            **kw,
+        )
+        if indir:
+            shop_storage.set("workspace_path", indir)
+    return indir
@@ -0,0 +1,164 @@
+import hashlib
+import os
+from typing import List, NamedTuple, Optional
+
+from dkstudio import shop_storage
+from dkstudio.files import is_hidden
+
+# functions for finding products in a workspace
+
+PRODUCT_SUFFIX = "_FILES"
+# storage namespace of scanned workspaces, keyed by a hash of the workspace path
+INDEX_NAMESPACE = "workspace-index"
+# bumped when the stored entries change shape so older scans are not read
+INDEX_VERSION = 2
+
+
+class ProductEntry(NamedTuple):
+    product_dir: str
+    zip_path: str
+    # None when the zipfile does not exist
+    zip_size: Optional[int]
+    zip_mtime: Optional[float]
+
+    @property
+    def project_dir(self) -> str:
+        return os.path.dirname(self.product_dir)
+
+    @property
+    def has_zip(self) -> bool:
+        return self.zip_size is not None
+
+
+def zip_path_for(product_dir: str) -> str:
+    return product_dir[: -len(PRODUCT_SUFFIX)] + ".zip"
+
+
+def product_entry(product_dir: str, files: dict) -> ProductEntry:
+    """
+    Build an entry from the stats of the zipfiles next to a product folder
+    """
+    zip_path = zip_path_for(product_dir)
+    zip_stat = files.get(os.path.basename(zip_path))
+    return ProductEntry(
+        product_dir, zip_path, zip_stat and zip_stat[0], zip_stat and zip_stat[1]
+    )
+
+
+def stat_entry(product_dir: str) -> ProductEntry:
+    zip_path = zip_path_for(product_dir)
+    try:
+        st = os.stat(zip_path)
+    except FileNotFoundError:
+        return ProductEntry(product_dir, zip_path, None, None)
+    return ProductEntry(product_dir, zip_path, st.st_size, st.st_mtime)
+
+
+def scan_dir(path: str):
+    """
+    List a directory once, returns (subdirectories, {filename: (size, mtime)})
+    """
+    subdirs = []
+    files = {}
+    with os.scandir(path) as it:
+        for entry in it:
+            if is_hidden(entry.name):
+                continue
+            if entry.is_dir():
+                subdirs.append(entry.path)
+            elif entry.name.endswith(".zip"):
+                st = entry.stat()
+                files[entry.name] = (st.st_size, st.st_mtime)
+    return sorted(subdirs), files
+
+
+def dir_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def scan(indir: str, depth: int = 2):
+    """
+    Walk a workspace breadth first, stopping at the first level holding products
+
+    Returns the product entries and the mtime of every directory listed
+    """
+    dir_mtimes = {}
+    level = [indir]
+    for i in range(depth):
+        entries = []
+        next_level = []
+        for path in level:
+            dir_mtimes[path] = dir_mtime(path)
+            if dir_mtimes[path] is None:
+                continue
+            subdirs, files = scan_dir(path)
+            for subdir in subdirs:
+                if subdir.endswith(PRODUCT_SUFFIX):
+                    entries.append(product_entry(subdir, files))
+                else:
+                    next_level.append(subdir)
+        if entries:
+            return entries, dir_mtimes
+        level = next_level
+    return [], dir_mtimes
+
+
+def scan_workspace(indir: str, depth: int = 2) -> List[ProductEntry]:
+    """
+    Index the products of a workspace, reusing the last scan if no directory changed
+
+    A directory's mtime only moves when entries are added, removed or renamed,
+    so a cache hit costs one stat per directory instead of a listing. Zipfile
+    stats are refreshed since rewriting a zip in place leaves its folder alone.
+    Paths are absolute whichever way the workspace was spelled.
+    """
+    path = os.path.abspath(indir)
+    if path.endswith(PRODUCT_SUFFIX):
+        return [stat_entry(path)]
+    key = hashlib.sha1(f"{INDEX_VERSION}:{path}:{depth}".encode()).hexdigest()
+    cached = shop_storage.select(INDEX_NAMESPACE, key)
+    if cached and all(
+        dir_mtime(dirname) == mtime for dirname, mtime in cached["dir_mtimes"].items()
+    ):
+        return [refresh_zip_stat(ProductEntry(*entry)) for entry in cached["entries"]]
+    entries, dir_mtimes = scan(path, depth)
+    shop_storage.persist(
+        INDEX_NAMESPACE,
+        key,
+        {
+            "path": path,
+            "dir_mtimes": dir_mtimes,
+            "entries": [list(entry) for entry in entries],
+        },
+    )
+    return entries
+
+
+def refresh_zip_stat(entry: ProductEntry) -> ProductEntry:
+    if not entry.has_zip:
+        return entry
+    try:
+        st = os.stat(entry.zip_path)
+    except FileNotFoundError:
+        return entry._replace(zip_size=None, zip_mtime=None)
+    return entry._replace(zip_size=st.st_size, zip_mtime=st.st_mtime)
+
+
+def get_project_name_from_project_dir(project_dir: str):
+    assert project_dir.endswith(PRODUCT_SUFFIX)
+    return (
+        os.path.split(project_dir)[1][: -len(PRODUCT_SUFFIX)].replace("_", " ").strip()
+    )
+
+
+def find_product_dirs(indir: str, depth: int = 2) -> List[str]:
+    # product dir ends with _FILES
+    return [entry.product_dir for entry in scan_workspace(indir, depth)]
+
+
+def find_project_dirs(indir: str) -> List[str]:
+    # project dir contains an _FILES product folder
+    return [entry.project_dir for entry in scan_workspace(indir)]
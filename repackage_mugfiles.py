@@ -1,58 +1,22 @@
 import glob
+import json
 import sys
-import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import os
 import os.path
 import shutil
-from PIL import Image
+
+from dkstudio.manifest import hash_file
+from dkstudio.read_paths import OUTPUT_FOLDER_STRUCTURE, classifier
 
 PNGS_ARE_MIRRORED = True
 KEEP_MIRRORED_IMAGES = False
 DRY_RUN = False
-FILE_FORMATS = [
-    r"(?P<format>(SVG|PNG|DXF))_(?P<variation>[A-Z_]+)_(?P<design>[\w_]+)_(?P<size>\d+(oz|OZ))\.(?P<extension>\w+)",
-    r"(?P<variation>[A-Z_]+)_(?P<design>[\w_]+)_(?P<size>\d+(oz|OZ))\.(?P<extension>\w+)",
-    r"(?P<variation>[A-Z_]+)_(?P<size>\d+(oz|OZ))_(?P<design>[\w_]+)\.(?P<extension>\w+)",
-]
-SIGNIFIERS = {
-    "is_sublimation": r"(?i).*/SUBLIMINATION_.*",
-    "is_bonus": r"(?i).*/BONUS SVG.*",
-    "is_instructions": r".*\.pdf$",
-    "is_design": r".*\.(png|dxf|svg)$",
-    "is_mirrored": r"(?i).*/mirrored.*",
-}
-MUG_SIZE = r"(?i)\d+oz"
-OUTPUT_FOLDER_STRUCTURE = {
-    "design": ["{design_folder_name}", "{size}", "{format}"],
-    "bonus": ["{design_folder_name}", "{variation}"],
-    "sublimation": ["{design_folder_name}", "SUBLIMATION", "{size}", "{variation}"],
-    "instructions": ["{design_folder_name}"],
-}
-
-
-def read_path_into_struct(apath):
-    info = {k: re.match(r, apath) is not None for k, r in SIGNIFIERS.items()}
-    parts = apath.split(os.path.sep)
-    ext = apath.split(".")[-1]
-    info["design_folder_name"], folders, info["filename"] = (
-        parts[0],
-        parts[1:-1],
-        parts[-1],
-    )
-    info["design"] = info["design_folder_name"][: -len("_FILES")]
-    for folder in folders:
-        if re.match(MUG_SIZE, folder):
-            info["size"] = folder
-        else:
-            info["variation"] = folder
-    if info["is_design"] and not info["is_bonus"]:
-        info["format"] = ext.upper()
-        for format in FILE_FORMATS:
-            m = re.match(format, info["filename"])
-            if m:
-                info.update(m.groupdict())
-                break
-    return info
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 0)) or os.cpu_count() or 1
+# images queued per worker, bounds how many decoded images wait in memory
+IMAGES_IN_FLIGHT = 2
+# what each source file was written to, kept in the output folder
+OUTPUT_MANIFEST = ".repackage-manifest.json"
 
 
 def format_destdir(outdir, info, outpaths):
@@ -74,59 +38,173 @@ def write_to(outdir, srcpath, info, outpaths, dry_run=DRY_RUN):
         shutil.copy(srcpath, destdir)
 
 
+def flip_image(srcpath, destdir, keep_mirrored=KEEP_MIRRORED_IMAGES):
+    """
+    Save an unmirrored copy of a mirrored png, runs in a worker process
+    """
+    # only the pool workers need pillow
+    from PIL import Image
+
+    image = Image.open(srcpath)
+    dpi = image.info["dpi"]
+    image = image.transpose(Image.FLIP_LEFT_RIGHT)
+    os.makedirs(destdir, exist_ok=True)
+    filename = os.path.split(srcpath)[-1]
+    # save unmirrored image as vanilla name
+    image.save(os.path.join(destdir, filename), dpi=dpi)
+    if keep_mirrored:
+        # save orginal mirrored image with a MIRRORED prefix
+        mirrored_name = "MIRRORED_" + filename
+        shutil.copyfile(srcpath, os.path.join(destdir, mirrored_name))
+    return srcpath
+
+
+def drain(futures, max_pending):
+    """
+    Wait until at most max_pending futures are running, raising worker errors
+    """
+    while len(futures) > max_pending:
+        done, pending = wait(futures, return_when=FIRST_COMPLETED)
+        futures.clear()
+        futures.update(pending)
+        for future in done:
+            future.result()
+
+
+def structure_for(apath, file_info):
+    """
+    The output folder structure of a file and whether it is flipped
+    """
+    if file_info["is_instructions"]:
+        return OUTPUT_FOLDER_STRUCTURE["instructions"], False
+    elif file_info["is_bonus"]:
+        return OUTPUT_FOLDER_STRUCTURE["bonus"], False
+    elif file_info["is_sublimation"]:
+        return OUTPUT_FOLDER_STRUCTURE["sublimation"], False
+    elif file_info["is_design"]:
+        # mirorred images are flipped in the pool while copies continue
+        flip = PNGS_ARE_MIRRORED and apath.endswith(".png")
+        return OUTPUT_FOLDER_STRUCTURE["design"], flip
+    print("warn", apath)
+    print(file_info)
+    return OUTPUT_FOLDER_STRUCTURE["instructions"], False
+
+
+def output_names(apath, destdir, flip):
+    filename = os.path.split(apath)[-1]
+    names = [os.path.join(destdir, filename)]
+    if flip and KEEP_MIRRORED_IMAGES:
+        names.append(os.path.join(destdir, "MIRRORED_" + filename))
+    return names
+
+
+def read_output_manifest(outdir):
+    path = os.path.join(outdir, OUTPUT_MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_output_manifest(outdir, manifest):
+    path = os.path.join(outdir, OUTPUT_MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def is_unchanged(apath, st, previous, entry):
+    """
+    Check if a source file was already written to the same outputs as it is now
+    """
+    if not previous:
+        return False
+    if (previous["outputs"], previous["flipped"]) != (
+        entry["outputs"],
+        entry["flipped"],
+    ):
+        return False
+    if not all(os.path.exists(name) for name in entry["outputs"]):
+        return False
+    if (previous["size"], previous["mtime"]) == (st.st_size, st.st_mtime):
+        return True
+    # touched but maybe not edited, compare the bytes
+    return previous["size"] == st.st_size and previous["sha256"] == hash_file(apath)
+
+
 def main():
     indir = sys.argv[1]
     outdir = sys.argv[2]
-    all_files = glob.glob(os.path.join(indir, "**/*"), recursive=True)
-    for apath in all_files:
-        if os.path.isfile(apath):
-            file_info = read_path_into_struct(apath[len(indir) :])
-            if file_info["is_instructions"]:
-                write_to(
-                    outdir, apath, file_info, OUTPUT_FOLDER_STRUCTURE["instructions"]
-                )
-            elif file_info["is_bonus"]:
-                write_to(outdir, apath, file_info, OUTPUT_FOLDER_STRUCTURE["bonus"])
-            elif file_info["is_sublimation"]:
-                write_to(
-                    outdir, apath, file_info, OUTPUT_FOLDER_STRUCTURE["sublimation"]
-                )
-            elif file_info["is_design"]:
-                if PNGS_ARE_MIRRORED and apath.endswith(".png"):
-                    # image is mirorred
-                    image = Image.open(apath)
-                    dpi = image.info["dpi"]
-                    image = image.transpose(Image.FLIP_LEFT_RIGHT)
-                    destdir = format_destdir(
-                        outdir, file_info, OUTPUT_FOLDER_STRUCTURE["design"]
-                    )
-                    if not DRY_RUN:
-                        os.makedirs(destdir, exist_ok=True)
-                        filename = os.path.split(apath)[-1]
-                        # save unmirrored image as vanilla name
-                        image.save(os.path.join(destdir, filename), dpi=dpi)
-                        if KEEP_MIRRORED_IMAGES:
-                            # save orginal mirrored image with a MIRRORED prefix
-                            mirrored_name = "MIRRORED_" + filename
-                            shutil.copyfile(apath, os.path.join(destdir, mirrored_name))
-                else:
-                    write_to(
-                        outdir, apath, file_info, OUTPUT_FOLDER_STRUCTURE["design"]
-                    )
-            else:
-                print("warn", apath)
-                write_to(
-                    outdir, apath, file_info, OUTPUT_FOLDER_STRUCTURE["instructions"]
-                )
+    all_files = [
+        apath
+        for apath in glob.glob(os.path.join(indir, "**/*"), recursive=True)
+        if os.path.isfile(apath)
+    ]
+    classified = classifier.classify_many(apath[len(indir) :] for apath in all_files)
+    previous_manifest = read_output_manifest(outdir)
+    manifest = {}
+    # design folders with an output written or removed this run
+    changed = set()
+    flipping = set()
+    # workers are shut down even if a file fails
+    with ProcessPoolExecutor(max_workers=IMAGE_WORKERS) as executor:
+        for apath, (relpath, file_info) in zip(all_files, classified):
+            outpaths, flip = structure_for(apath, file_info)
+            try:
+                destdir = format_destdir(outdir, file_info, outpaths)
+            except:
+                print(apath)
                 print(file_info)
+                raise
+            st = os.stat(apath)
+            previous = previous_manifest.get(relpath)
+            entry = {
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+                "design_folder_name": file_info["design_folder_name"],
+                "outputs": output_names(apath, destdir, flip),
+                "flipped": flip,
+            }
+            if is_unchanged(apath, st, previous, entry):
+                manifest[relpath] = dict(entry, sha256=previous["sha256"])
+                continue
+            entry["sha256"] = hash_file(apath)
+            manifest[relpath] = entry
+            changed.add(file_info["design_folder_name"])
+            if flip:
+                print(apath, "-> (flipped)", destdir)
+                if not DRY_RUN:
+                    drain(flipping, IMAGE_WORKERS * IMAGES_IN_FLIGHT - 1)
+                    flipping.add(executor.submit(flip_image, apath, destdir))
+            else:
+                write_to(outdir, apath, file_info, outpaths)
+        # every image has to be written before its folder is zipped
+        drain(flipping, 0)
+    # outputs still written by some source, two sources can share an output
+    expected = {name for entry in manifest.values() for name in entry["outputs"]}
+    for relpath, previous in previous_manifest.items():
+        # the source is gone or now goes elsewhere, so are its old outputs
+        for name in previous["outputs"]:
+            if name in expected:
+                continue
+            changed.add(previous["design_folder_name"])
+            print("remove:", name)
+            if not DRY_RUN and os.path.exists(name):
+                os.remove(name)
     for dir_name in glob.glob(os.path.join(outdir, "*")):
         if os.path.isdir(dir_name):
             file_name = dir_name
             if file_name.endswith("_FILES"):
                 file_name = file_name[: -len("_FILES")]
+            if os.path.basename(dir_name) not in changed and os.path.exists(
+                file_name + ".zip"
+            ):
+                continue
             print("zip up:", file_name)
             if not DRY_RUN:
                 shutil.make_archive(file_name, "zip", dir_name)
+    if not DRY_RUN:
+        write_output_manifest(outdir, manifest)
 
 
 if __name__ == "__main__":
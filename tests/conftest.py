@@ -0,0 +1,18 @@
+import pytest
+
+from dkstudio import shop_storage
+
+
+@pytest.fixture(autouse=True)
+def storage(tmp_path, monkeypatch):
+    """
+    Point shop_storage at a fresh json store for every test
+    """
+    monkeypatch.setenv("SHOP_STORAGE_BACKEND", "json")
+    monkeypatch.setenv("SHOP_STORAGE_DIR", str(tmp_path / "storage"))
+    monkeypatch.setenv("SHOP_STORAGE_PATH", str(tmp_path / "config.json"))
+    shop_storage.backend.cache_clear()
+    shop_storage.refresh()
+    yield tmp_path
+    shop_storage.backend.cache_clear()
+    shop_storage.refresh()
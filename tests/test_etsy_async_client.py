@@ -0,0 +1,88 @@
+import asyncio
+
+import httpx
+import pytest
+
+from dkstudio import marketplace
+from dkstudio.etsy import async_client
+from dkstudio.etsy.async_client import AsyncEtsyClient
+from dkstudio.etsy.client import API_URL, EtsyClient
+from dkstudio.marketplace import ApiError, RateLimiter
+
+
+class FakeEtsyClient(EtsyClient):
+    def default_limiter(self):
+        return RateLimiter(per_second=1000, per_day=10**6)
+
+    def auth_headers(self):
+        return {"Authorization": "Bearer token"}
+
+
+@pytest.fixture(autouse=True)
+def no_delay(monkeypatch):
+    monkeypatch.setattr(async_client, "retry_delay", lambda headers, attempt: 0)
+    monkeypatch.setattr(marketplace, "retry_delay", lambda headers, attempt: 0)
+
+
+def run(handler, coroutine):
+    """
+    Run coroutine(client) against an AsyncEtsyClient whose requests go to handler
+    """
+
+    async def main():
+        client = AsyncEtsyClient(concurrency=2, sync_client=FakeEtsyClient())
+        await client.http.aclose()
+        client.http = httpx.AsyncClient(
+            transport=httpx.MockTransport(handler), base_url=API_URL
+        )
+        try:
+            return await coroutine(client)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(main())
+
+
+def test_transport_errors_are_retried():
+    attempts = []
+
+    def handler(request):
+        attempts.append(request.url.path)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        if len(attempts) == 2:
+            raise httpx.ReadTimeout("slow", request=request)
+        return httpx.Response(200, json={"ok": True})
+
+    assert run(handler, lambda client: client.get("/things")) == {"ok": True}
+    assert len(attempts) == 3
+
+
+def test_transport_error_is_raised_after_the_last_retry():
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    with pytest.raises(httpx.ConnectError):
+        run(handler, lambda client: client.get("/things"))
+
+
+def test_error_page_that_is_not_json_raises_api_error():
+    def handler(request):
+        return httpx.Response(502, text="<html>Bad Gateway</html>")
+
+    with pytest.raises(ApiError) as error:
+        run(handler, lambda client: client.get("/things"))
+    assert error.value.status == 502
+    assert "Bad Gateway" in error.value.args[0]
+
+
+def test_pages_are_yielded_in_order():
+    def handler(request):
+        offset = int(request.url.params.get("offset", 0))
+        results = list(range(offset, min(offset + 2, 7)))
+        return httpx.Response(200, json={"count": 7, "results": results})
+
+    async def pages(client):
+        return [page["results"] async for page in client.paginate("/things", limit=2)]
+
+    assert run(handler, pages) == [[0, 1], [2, 3], [4, 5], [6]]
@@ -0,0 +1,101 @@
+import pytest
+
+from dkstudio import shop_storage
+from dkstudio.etsy import list_payments
+
+
+class FakeReceipts:
+    """
+    The receipts endpoint over an in-memory shop, sorted by update time
+    """
+
+    def __init__(self, receipts):
+        self.receipts = {r["receipt_id"]: r for r in receipts}
+        self.requests = []
+        # called with the request number before each page is served
+        self.before_page = lambda n: None
+
+    def modify(self, receipt_id, updated_timestamp):
+        self.receipts[receipt_id] = dict(
+            self.receipts[receipt_id], updated_timestamp=updated_timestamp
+        )
+
+    def get(self, path, offset=0, limit=25, min_last_modified=0, **params):
+        self.before_page(len(self.requests))
+        self.requests.append(dict(offset=offset, min_last_modified=min_last_modified))
+        matching = sorted(
+            (
+                r
+                for r in self.receipts.values()
+                if r["updated_timestamp"] >= min_last_modified
+            ),
+            key=lambda r: (r["updated_timestamp"], r["receipt_id"]),
+        )
+        return {"count": len(matching), "results": matching[offset : offset + limit]}
+
+
+def receipts(*timestamps):
+    return [
+        {"receipt_id": i, "updated_timestamp": ts} for i, ts in enumerate(timestamps, 1)
+    ]
+
+
+@pytest.fixture
+def shop(monkeypatch):
+    api = FakeReceipts(receipts(10, 10, 20, 20, 30, 40, 50))
+    monkeypatch.setattr(list_payments, "client", api)
+    monkeypatch.setattr(list_payments, "PAGE_LIMIT", 3)
+    return api
+
+
+def ingested(shop_id=5, **kwargs):
+    return [r["receipt_id"] for r in list_payments.ingest_receipts(shop_id, **kwargs)]
+
+
+def test_every_receipt_is_stored_once(shop):
+    assert ingested() == [1, 2, 3, 4, 5, 6, 7]
+    assert sorted(shop_storage.select_keys("receipts"), key=int) == [
+        str(i) for i in range(1, 8)
+    ]
+    assert list_payments.get_checkpoint(5) == {
+        "min_last_modified": 50,
+        "at_cursor": ["7"],
+    }
+
+
+def test_next_run_only_reads_newer_receipts(shop):
+    ingested()
+    shop.requests.clear()
+    shop.modify(3, 60)
+    shop.receipts[8] = {"receipt_id": 8, "updated_timestamp": 55}
+    assert ingested() == [8, 3]
+    assert shop.requests[0]["min_last_modified"] == 50
+
+
+def test_receipt_modified_mid_run_skips_nothing(shop):
+    # an already read receipt moves to the end while later pages are read
+    shop.before_page = lambda n: n == 2 and shop.modify(1, 35)
+    assert ingested() == [1, 2, 3, 4, 5, 1, 6, 7]
+    assert shop_storage.select("receipts", "1")["updated_timestamp"] == 35
+
+
+def test_ties_larger_than_a_page(shop):
+    shop.receipts = {r["receipt_id"]: r for r in receipts(10, 10, 10, 10, 10, 20)}
+    assert ingested() == [1, 2, 3, 4, 5, 6]
+
+
+def test_killed_run_resumes_from_its_checkpoint(shop):
+    run = list_payments.ingest_receipts(5, batch_size=2)
+    assert [next(run)["receipt_id"] for _ in range(4)] == [1, 2, 3, 4]
+    run.close()
+    shop.requests.clear()
+    # 5 was stored with the batch before the run was killed
+    assert ingested(batch_size=2) == [6, 7]
+    assert shop.requests[0]["min_last_modified"] == 30
+    assert shop_storage.select("receipts", "5")
+
+
+def test_old_checkpoints_are_read(shop):
+    list_payments.set_checkpoint(5, {"high_water": 25})
+    assert ingested() == [5, 6, 7]
+    assert ingested(full=True) == [1, 2, 3, 4, 5, 6, 7]
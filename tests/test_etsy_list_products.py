@@ -0,0 +1,64 @@
+import pytest
+
+from dkstudio import shop_storage
+from dkstudio.etsy import list_products as lp
+
+
+@pytest.fixture
+def shop(monkeypatch):
+    listings = {
+        "active": [
+            {"listing_id": 1, "shop_id": 5, "title": "Cat Mug", "updated_timestamp": 10}
+        ],
+        "draft": [
+            {"listing_id": 2, "shop_id": 5, "title": "Dog Mug", "updated_timestamp": 20}
+        ],
+    }
+    pages = []
+
+    def recently_updated(shop_id, state):
+        newest_first = sorted(
+            listings.get(state, []), key=lambda p: -p["updated_timestamp"]
+        )
+        pages.append(state)
+        return [{"results": newest_first}]
+
+    monkeypatch.setattr(
+        lp,
+        "list_products",
+        lambda shop_id, state: [{"results": listings.get(state, [])}],
+    )
+    monkeypatch.setattr(lp, "list_recently_updated_products", recently_updated)
+    listings["pages"] = pages
+    return listings
+
+
+def synced(shop_id, full):
+    return [p["listing_id"] for p in lp.populate_product_catalog(shop_id, full=full)]
+
+
+def test_full_sync_removes_listings_of_that_shop_only(shop):
+    shop_storage.persist("products", "3", {"listing_id": 3, "shop_id": 5})
+    shop_storage.persist("products", "9", {"listing_id": 9, "shop_id": 6})
+    assert synced(5, full=True) == [1, 2]
+    assert sorted(shop_storage.select_keys("products")) == ["1", "2", "9"]
+    assert lp.get_sync_state(5)["high_water"] == 20
+
+
+def test_incremental_sync_fetches_from_the_cursor(shop):
+    synced(5, full=True)
+    shop["draft"].append(
+        {"listing_id": 4, "shop_id": 5, "title": "Owl Mug", "updated_timestamp": 30}
+    )
+    # listings updated at the mark are seen again, older ones are not
+    assert synced(5, full=False) == [4, 2]
+    assert lp.get_sync_state(5)["high_water"] == 30
+    assert shop_storage.select("products", "4")["title"] == "Owl Mug"
+    assert shop["pages"] == list(lp.LISTING_STATES)
+
+
+def test_first_sync_is_full(shop):
+    shop_storage.persist("products", "3", {"listing_id": 3, "shop_id": 5})
+    assert synced(5, full=None) == [1, 2]
+    assert shop_storage.select("products", "3") is None
+    assert shop["pages"] == []
@@ -0,0 +1,69 @@
+import pytest
+
+from dkstudio import shop_storage
+from dkstudio.catalog import ProductCatalog, SkuIndex
+from dkstudio.gumroad import list_products as lp
+
+
+@pytest.fixture
+def store(monkeypatch):
+    products = [
+        {"id": "g1", "name": "Cat Mug", "custom_permalink": "CAT1"},
+        {
+            "id": "g2",
+            "name": "Dog Mug Bundle",
+            "variants": [{"options": [{"name": "11oz", "sku": "DOG1"}, {}]}],
+        },
+    ]
+    monkeypatch.setattr(lp, "list_products", lambda: [dict(p) for p in products])
+    return products
+
+
+def test_skus_come_from_the_permalink_and_variant_options(store):
+    assert lp.gumroad_skus(store[0]) == ["CAT1"]
+    assert lp.gumroad_skus(store[1]) == ["DOG1"]
+    assert lp.gumroad_skus({"id": "g3", "variants": None}) == []
+
+
+def test_sync_stores_products_and_drops_removed_ones(store):
+    shop_storage.persist(lp.NAMESPACE, "g9", {"id": "g9", "name": "Gone"})
+    catalog = ProductCatalog.load_gumroad()
+    assert [p["id"] for p in lp.populate_gumroad_catalog(catalog)] == ["g1", "g2"]
+    assert sorted(shop_storage.select_keys(lp.NAMESPACE)) == ["g1", "g2"]
+    assert shop_storage.select(lp.NAMESPACE, "g2")["skus"] == ["DOG1"]
+    assert catalog.by_sku == {"CAT1": "g1", "DOG1": "g2"}
+    assert "g9" not in catalog
+
+
+@pytest.fixture
+def workspace(tmp_path, store):
+    list(lp.populate_gumroad_catalog())
+    shop_storage.persist(
+        "products", "7", {"listing_id": 7, "title": "Doggo", "skus": ["DOG1"]}
+    )
+    for name in ["Cat_Mug_FILES", "Dog_FILES", "Owl_FILES"]:
+        (tmp_path / "ws" / name).mkdir(parents=True)
+    shop_storage.write_file_metadata(
+        str(tmp_path / "ws" / "Dog_FILES"), {"etsy_listing_id": 7}
+    )
+    return tmp_path / "ws"
+
+
+def test_folders_are_mapped_by_name_and_by_etsy_sku(workspace):
+    skus = SkuIndex.load()
+    assert lp.associate_product_dirs(str(workspace), skus) == 2
+    cat = shop_storage.read_file_metadata(str(workspace / "Cat_Mug_FILES"))
+    assert cat == {"gumroad_product_id": "g1", "product_name": "Cat Mug"}
+    dog = shop_storage.read_file_metadata(str(workspace / "Dog_FILES"))
+    assert dog["gumroad_product_id"] == "g2"
+    assert dog["etsy_listing_id"] == 7
+    assert shop_storage.read_file_metadata(str(workspace / "Owl_FILES")) is None
+    assert shop_storage.select("gumroad-product-dir", "g1") == str(
+        workspace / "Cat_Mug_FILES"
+    )
+    assert skus.catalogs["gumroad"].is_mapped("g2")
+
+
+def test_mapped_folders_are_left_alone(workspace):
+    assert lp.associate_product_dirs(str(workspace)) == 2
+    assert lp.associate_product_dirs(str(workspace)) == 0
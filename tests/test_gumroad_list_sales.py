@@ -0,0 +1,64 @@
+import pytest
+
+from dkstudio import shop_storage
+from dkstudio.gumroad import list_sales
+
+
+class FakeSales:
+    """
+    The sales endpoint over in-memory pages of two sales
+    """
+
+    def __init__(self, sales):
+        self.sales = sales
+        self.requests = []
+
+    def get(self, path, after=None, page_key=None):
+        self.requests.append(dict(after=after, page_key=page_key))
+        sales = [s for s in self.sales if not after or s["created_at"][:10] >= after]
+        start = int(page_key or 0)
+        page = {"sales": sales[start : start + 2]}
+        if start + 2 < len(sales):
+            page["next_page_key"] = str(start + 2)
+        return page
+
+
+def sale(id, day):
+    return {"id": id, "created_at": f"2024-01-{day:02d}T10:00:00Z"}
+
+
+@pytest.fixture
+def sales(monkeypatch):
+    api = FakeSales([sale("a", 1), sale("b", 2), sale("c", 2), sale("d", 3)])
+    monkeypatch.setattr(list_sales, "client", api)
+    return api
+
+
+def ingested(**kwargs):
+    return [s["id"] for s in list_sales.ingest_sales(**kwargs)]
+
+
+def test_every_page_is_stored(sales):
+    assert ingested() == ["a", "b", "c", "d"]
+    assert sorted(shop_storage.select_keys(list_sales.NAMESPACE)) == list("abcd")
+    assert shop_storage.get(list_sales.CHECKPOINT_KEY) == {"high_water": "2024-01-03"}
+
+
+def test_next_run_starts_at_the_last_day(sales):
+    ingested()
+    sales.requests.clear()
+    sales.sales.append(sale("e", 4))
+    # the last day is read again, rewriting d is harmless
+    assert ingested() == ["d", "e"]
+    assert sales.requests[0] == {"after": "2024-01-03", "page_key": None}
+    assert ingested(full=True) == ["a", "b", "c", "d", "e"]
+
+
+def test_killed_run_resumes_from_its_page(sales):
+    run = list_sales.ingest_sales()
+    assert [next(run)["id"] for _ in range(3)] == ["a", "b", "c"]
+    run.close()
+    sales.requests.clear()
+    assert ingested() == ["c", "d"]
+    assert sales.requests[0]["page_key"] == "2"
+    assert shop_storage.get(list_sales.CHECKPOINT_KEY) == {"high_water": "2024-01-03"}
@@ -0,0 +1,59 @@
+import os
+
+from dkstudio.manifest import is_package_stale, read_manifest
+from dkstudio.package_products import package_product
+
+
+def packaged(tmp_path):
+    product = tmp_path / "Dog_FILES"
+    product.mkdir()
+    (product / "design.svg").write_text("<svg/>")
+    (product / "instructions.pdf").write_bytes(b"%PDF")
+    zip_path = package_product(str(tmp_path), "Dog_FILES", "Dog.zip")
+    return str(product), zip_path
+
+
+def test_fresh_package_is_not_stale(tmp_path):
+    product, zip_path = packaged(tmp_path)
+    assert not is_package_stale(product, zip_path)
+
+
+def test_missing_zip_or_manifest_is_stale(tmp_path):
+    product, zip_path = packaged(tmp_path)
+    assert is_package_stale(product, zip_path + ".missing")
+    os.remove(product + ".dkps-manifest.json")
+    assert is_package_stale(product, zip_path)
+
+
+def test_touched_file_is_not_stale_and_mtime_is_remembered(tmp_path):
+    product, zip_path = packaged(tmp_path)
+    os.utime(os.path.join(product, "design.svg"), (12345, 12345))
+    assert not is_package_stale(product, zip_path)
+    assert read_manifest(product)["files"]["design.svg"]["mtime"] == 12345
+
+
+def test_edited_file_is_stale(tmp_path):
+    product, zip_path = packaged(tmp_path)
+    with open(os.path.join(product, "design.svg"), "w") as f:
+        f.write("<svg>edited</svg>")
+    assert is_package_stale(product, zip_path)
+
+
+def test_added_file_is_stale(tmp_path):
+    product, zip_path = packaged(tmp_path)
+    with open(os.path.join(product, "extra.png"), "wb") as f:
+        f.write(b"png")
+    assert is_package_stale(product, zip_path)
+
+
+def test_removed_file_is_stale(tmp_path):
+    product, zip_path = packaged(tmp_path)
+    os.remove(os.path.join(product, "instructions.pdf"))
+    assert is_package_stale(product, zip_path)
+
+
+def test_zip_replaced_outside_the_packager_is_stale(tmp_path):
+    product, zip_path = packaged(tmp_path)
+    with open(zip_path, "ab") as f:
+        f.write(b"more")
+    assert is_package_stale(product, zip_path)
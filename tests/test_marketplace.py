@@ -0,0 +1,195 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from dkstudio import marketplace
+from dkstudio.marketplace import (
+    ApiError,
+    MarketplaceClient,
+    RateLimiter,
+    can_resend,
+    should_retry,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(marketplace.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_rate_limiter_spaces_requests(clock):
+    limiter = RateLimiter(per_second=2, per_day=100)
+    assert [limiter.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+    clock[0] += 2
+    assert limiter.reserve() == 0
+
+
+def test_rate_limiter_waits_out_the_day(clock):
+    limiter = RateLimiter(per_second=100, per_day=2)
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 0
+    clock[0] += 60
+    assert limiter.reserve() == pytest.approx(24 * 60 * 60 - 60)
+    clock[0] += 24 * 60 * 60
+    assert limiter.reserve() == 0
+
+
+def test_rate_limiter_follows_headers(clock):
+    limiter = RateLimiter(per_second=10, per_day=100)
+    limiter.update_from_headers(
+        {"x-limit-per-second": "1", "x-remaining-this-second": "0"}
+    )
+    assert limiter.reserve() == 1.0
+    limiter.pause(5)
+    assert limiter.reserve() == 5
+
+
+def test_retry_classification():
+    assert should_retry("POST", 429)
+    assert should_retry("GET", 502)
+    assert should_retry("PUT", 503)
+    assert not should_retry("POST", 502)
+    assert not should_retry("GET", 404)
+
+    assert can_resend("GET", requests.exceptions.ConnectionError())
+    assert can_resend("GET", requests.exceptions.ReadTimeout())
+    assert can_resend("GET", ApiError("down", status=500))
+    assert can_resend("POST", requests.exceptions.ConnectTimeout())
+    assert can_resend("POST", ApiError("busy", status=429))
+    # the server may have handled these already
+    assert not can_resend("POST", requests.exceptions.ConnectionError())
+    assert not can_resend("POST", requests.exceptions.ReadTimeout())
+    assert not can_resend("POST", ApiError("down", status=500))
+    assert not can_resend("GET", ApiError("bad request", status=400))
+    assert not can_resend("GET", ValueError("bug"))
+
+
+class Response:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.headers = {}
+        self.content = b"{}"
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return self.body
+
+
+class FakeClient(MarketplaceClient):
+    api_url = "https://api.example.com/"
+
+    def __init__(self):
+        super().__init__()
+        self.token = 0
+        self.fetches = 0
+        self.sent = []
+
+    def default_limiter(self):
+        return RateLimiter(per_second=1000, per_day=10**6)
+
+    def auth_headers(self):
+        return {"authorization": f"Bearer {self.token}"}
+
+    def fetch_token(self):
+        self.fetches += 1
+        time.sleep(0.05)
+        self.token += 1
+
+    def is_expired(self, response, message):
+        return message.get("error") == "expired"
+
+    def paginate(self, path, **params):
+        yield self.get(path, **params)
+
+
+def test_concurrent_refreshes_fetch_once():
+    client = FakeClient()
+    stale = client.headers()
+    threads = [
+        threading.Thread(target=client.refresh_token, args=(stale,)) for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert client.fetches == 1
+    assert client.headers() == {"authorization": "Bearer 1"}
+
+
+def test_expired_request_retries_with_the_new_token():
+    client = FakeClient()
+
+    def request(method, url, headers=None, **kwargs):
+        client.sent.append(headers["authorization"])
+        if headers["authorization"] == "Bearer 0":
+            return Response(401, {"error": "expired"})
+        return Response(200, {"ok": True})
+
+    client.session.request = request
+    assert client.get("things") == {"ok": True}
+    assert client.sent == ["Bearer 0", "Bearer 1"]
+    assert client.fetches == 1
+
+
+def test_request_reuses_a_refresh_done_meanwhile():
+    client = FakeClient()
+
+    def request(method, url, headers=None, **kwargs):
+        client.sent.append(headers["authorization"])
+        if headers["authorization"] == "Bearer 0":
+            # another caller refreshes while this request is in flight
+            client.refresh_token()
+            return Response(401, {"error": "expired"})
+        return Response(200, {"ok": True})
+
+    client.session.request = request
+    assert client.get("things") == {"ok": True}
+    assert client.sent == ["Bearer 0", "Bearer 1"]
+    assert client.fetches == 1
+
+
+def test_expiring_token_is_refreshed_before_sending(monkeypatch):
+    client = FakeClient()
+    # the first token is inside the refresh margin, the new one is not
+    monkeypatch.setattr(
+        client,
+        "stored_expiry",
+        lambda: time.time() + (10 if not client.token else 3600),
+    )
+    headers = client.headers()
+    assert client.fetches == 1
+    assert headers == {"authorization": "Bearer 1"}
+    client.cancel_refresh()
+
+
+class HtmlResponse(Response):
+    text = "<html>Bad Gateway</html>"
+
+    def json(self):
+        raise ValueError("not json")
+
+
+def test_error_page_that_is_not_json_raises_api_error():
+    client = FakeClient()
+    client.session.request = lambda method, url, **kwargs: HtmlResponse(404, None)
+    with pytest.raises(ApiError) as error:
+        client.get("things")
+    assert error.value.status == 404
+    assert error.value.args[0] == HtmlResponse.text
+
+
+def test_client_must_implement_adapter_hooks():
+    class Partial(MarketplaceClient):
+        def default_limiter(self):
+            return RateLimiter(1, 1)
+
+    with pytest.raises(TypeError):
+        Partial()
@@ -0,0 +1,65 @@
+from thefuzz import fuzz
+
+from dkstudio.catalog import ListingRecord
+from dkstudio.matching import MatchIndex, accept_matches, normalize
+
+RECORDS = [
+    ListingRecord(1, "Funny Cat Mug Press", [], []),
+    ListingRecord(2, "Dog Mom Tumbler", [], []),
+    ListingRecord(3, "Owl Teacher Sublimation Design", [], []),
+    ListingRecord(4, "Retro Sunset Mug Wrap", [], []),
+]
+
+
+def test_best_match_first():
+    index = MatchIndex(RECORDS)
+    matches = index.match("Owl_Teacher_Sublimation")
+    assert matches[0][0].listing_id == 3
+    assert [score for record, score in matches] == sorted(
+        (score for record, score in matches), reverse=True
+    )
+
+
+def test_shortlist_scores_like_every_title():
+    index = MatchIndex(RECORDS)
+    for name in ["Dog Mom", "retro sunset", "Funny Cat Mug"]:
+        best = max(
+            RECORDS, key=lambda r: fuzz.WRatio(normalize(name), normalize(r.title))
+        )
+        assert index.match(name, limit=1)[0][0] == best
+
+
+def test_match_all_is_keyed_like_its_names():
+    names = {"/work/Dog_FILES": "Dog Mom Tumbler", "/work/Owl_FILES": "Owl Teacher"}
+    matches = MatchIndex(RECORDS).match_all(names)
+    assert set(matches) == set(names)
+    assert matches["/work/Owl_FILES"][0][0].listing_id == 3
+
+
+def test_accepts_only_near_exact_matches():
+    names = {"cat": "funny cat mug", "dog": "Dog_Mom_Tumbler"}
+    matches = MatchIndex(RECORDS).match_all(names)
+    # a name contained in a longer title scores high on WRatio but is not accepted
+    assert matches["cat"][0][1] >= 90
+    accepted = accept_matches(matches, names)
+    assert {key: r.listing_id for key, r in accepted.items()} == {"dog": 2}
+    assert set(accept_matches(matches, names, threshold=50)) == {"cat", "dog"}
+
+
+def test_threshold_comes_from_the_environment(monkeypatch):
+    names = {"cat": "funny cat mug"}
+    matches = MatchIndex(RECORDS).match_all(names)
+    monkeypatch.setenv("MATCH_AUTO_ACCEPT", "50")
+    assert set(accept_matches(matches, names)) == {"cat"}
+
+
+def test_one_listing_per_folder():
+    names = {"/a/Dog_FILES": "Dog Mom Tumbler", "/b/Dog_FILES": "Dog Mom Tumbler"}
+    accepted = accept_matches(MatchIndex(RECORDS).match_all(names), names)
+    assert len(accepted) == 1
+
+
+def test_ties_are_left_for_a_person():
+    records = RECORDS + [ListingRecord(5, "Dog Mom Tumbler", [], [])]
+    names = {"dog": "Dog Mom Tumbler"}
+    assert accept_matches(MatchIndex(records).match_all(names), names) == {}
@@ -0,0 +1,63 @@
+import hashlib
+import os
+import sys
+import zipfile
+
+from dkstudio.manifest import is_package_stale
+from dkstudio.package_products import package_product, package_workspace_main
+
+
+def make_product(root):
+    product = root / "Cat_Mug_FILES"
+    (product / "11oz").mkdir(parents=True)
+    (product / "11oz" / "FRONT_Cat_11oz.png").write_bytes(b"\x89PNG front")
+    (product / "11oz" / "FRONT_Cat_11oz.svg").write_text("<svg/>")
+    (product / "instructions.pdf").write_bytes(b"%PDF instructions")
+    (product / ".DS_Store").write_bytes(b"junk")
+    (product / "Thumbs.db").write_bytes(b"junk")
+    return product
+
+
+def digest(path):
+    return hashlib.sha256(open(path, "rb").read()).hexdigest()
+
+
+def test_same_files_make_the_same_zip(tmp_path):
+    make_product(tmp_path)
+    zip_path = package_product(str(tmp_path), "Cat_Mug_FILES", "Cat_Mug.zip")
+    first = digest(zip_path)
+    # new mtimes alone must not change the bytes
+    for dirpath, dirnames, filenames in os.walk(tmp_path / "Cat_Mug_FILES"):
+        for name in filenames:
+            os.utime(os.path.join(dirpath, name), (1, 1))
+    package_product(str(tmp_path), "Cat_Mug_FILES", "Cat_Mug.zip")
+    assert digest(zip_path) == first
+
+
+def test_zip_skips_hidden_and_system_files(tmp_path):
+    make_product(tmp_path)
+    zip_path = package_product(str(tmp_path), "Cat_Mug_FILES", "Cat_Mug.zip")
+    with zipfile.ZipFile(zip_path) as zf:
+        names = zf.namelist()
+        assert "Cat_Mug_FILES/instructions.pdf" in names
+        assert "Cat_Mug_FILES/11oz/FRONT_Cat_11oz.png" in names
+        assert not any(".DS_Store" in n or "Thumbs.db" in n for n in names)
+        assert (
+            zf.getinfo("Cat_Mug_FILES/11oz/FRONT_Cat_11oz.png").compress_type
+            == zipfile.ZIP_STORED
+        )
+        assert zf.read("Cat_Mug_FILES/instructions.pdf") == b"%PDF instructions"
+
+
+def test_package_workspace_from_a_relative_path(tmp_path, monkeypatch):
+    make_product(tmp_path / "ws" / "proj")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["package-workspace", "ws", "--workers", "2"])
+    package_workspace_main()
+    zip_path = tmp_path / "ws" / "proj" / "Cat_Mug.zip"
+    assert zip_path.exists()
+    assert not is_package_stale("ws/proj/Cat_Mug_FILES", "ws/proj/Cat_Mug.zip")
+    # a second run finds the zip current and leaves it alone
+    mtime = zip_path.stat().st_mtime_ns
+    package_workspace_main()
+    assert zip_path.stat().st_mtime_ns == mtime
@@ -0,0 +1,76 @@
+import itertools
+import os
+import re
+
+import pytest
+
+from dkstudio.read_paths import (
+    FILE_FORMATS,
+    MUG_SIZE,
+    SIGNIFIERS,
+    PathClassifier,
+    read_path_into_struct,
+)
+
+
+def per_pattern_read_path(apath):
+    # read_path_into_struct as it was before PathClassifier
+    info = {k: re.match(r, apath) is not None for k, r in SIGNIFIERS.items()}
+    parts = apath.split(os.path.sep)
+    ext = apath.split(".")[-1]
+    info["design_folder_name"], folders, info["filename"] = (
+        parts[0],
+        parts[1:-1],
+        parts[-1],
+    )
+    info["design"] = info["design_folder_name"][: -len("_FILES")]
+    for folder in folders:
+        if re.match(MUG_SIZE, folder):
+            info["size"] = folder
+        else:
+            info["variation"] = folder
+    if info["is_design"] and not info["is_bonus"]:
+        info["format"] = ext.upper()
+        for format in FILE_FORMATS:
+            m = re.match(format, info["filename"])
+            if m:
+                info.update(m.groupdict())
+                break
+    return info
+
+
+DESIGNS = ["Cat_FILES", "Dog_Mug_FILES"]
+FOLDERS = [
+    "",
+    "11oz/",
+    "15OZ/",
+    "SUBLIMINATION_PNG/",
+    "BONUS SVG/",
+    "Mirrored/",
+    "11oz/SUBLIMINATION_X/",
+]
+FILENAMES = [
+    "SVG_FRONT_Cat_Face_11oz.svg",
+    "FRONT_Cat_11OZ.png",
+    "BACK_15oz_Dog.dxf",
+    "instructions.pdf",
+    "readme.txt",
+    "weird.png",
+    "PNG_A_B_12oz.PNG",
+]
+PATHS = [
+    f"{design}/{folder}{filename}"
+    for design, folder, filename in itertools.product(DESIGNS, FOLDERS, FILENAMES)
+] + ["loose.png"]
+
+
+@pytest.mark.parametrize("apath", PATHS)
+def test_matches_per_pattern_reading(apath):
+    assert read_path_into_struct(apath) == per_pattern_read_path(apath)
+
+
+def test_classify_many_keeps_paths():
+    classifier = PathClassifier()
+    assert [(p, per_pattern_read_path(p)) for p in PATHS] == list(
+        classifier.classify_many(PATHS)
+    )
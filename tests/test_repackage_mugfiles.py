@@ -0,0 +1,145 @@
+import os
+import shutil
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import repackage_mugfiles
+
+
+@pytest.fixture
+def design(tmp_path):
+    src = tmp_path / "src"
+    (src / "Cat_FILES" / "11oz").mkdir(parents=True)
+    image = Image.new("RGB", (2, 1))
+    image.putpixel((0, 0), (255, 0, 0))
+    image.save(src / "Cat_FILES" / "11oz" / "PNG_FRONT_Cat_11oz.png", dpi=(300, 300))
+    (src / "Cat_FILES" / "11oz" / "SVG_FRONT_Cat_11oz.svg").write_text("<svg/>")
+    (src / "Cat_FILES" / "instructions.pdf").write_bytes(b"pdf")
+    return src
+
+
+def repackage(monkeypatch, src, out):
+    monkeypatch.setattr(repackage_mugfiles, "IMAGE_WORKERS", 2)
+    monkeypatch.setattr(sys, "argv", ["repackage", str(src) + os.sep, str(out)])
+    repackage_mugfiles.main()
+
+
+def test_flipped_image_keeps_its_dpi(design, tmp_path):
+    srcpath = design / "Cat_FILES" / "11oz" / "PNG_FRONT_Cat_11oz.png"
+    repackage_mugfiles.flip_image(str(srcpath), str(tmp_path / "out"))
+    flipped = Image.open(tmp_path / "out" / "PNG_FRONT_Cat_11oz.png")
+    assert flipped.getpixel((1, 0)) == (255, 0, 0)
+    # png keeps dots per meter, 300 dpi comes back a hair under
+    assert flipped.info["dpi"] == pytest.approx((300, 300), rel=1e-3)
+    assert not (tmp_path / "out" / "MIRRORED_PNG_FRONT_Cat_11oz.png").exists()
+
+
+def test_flipped_image_can_keep_the_mirrored_one(design, tmp_path):
+    srcpath = design / "Cat_FILES" / "11oz" / "PNG_FRONT_Cat_11oz.png"
+    repackage_mugfiles.flip_image(
+        str(srcpath), str(tmp_path / "out"), keep_mirrored=True
+    )
+    mirrored = tmp_path / "out" / "MIRRORED_PNG_FRONT_Cat_11oz.png"
+    assert mirrored.read_bytes() == srcpath.read_bytes()
+
+
+def test_pngs_are_flipped_in_the_pool_and_the_rest_copied(
+    design, tmp_path, monkeypatch
+):
+    out = tmp_path / "out"
+    repackage(monkeypatch, design, out)
+    flipped = Image.open(out / "Cat_FILES" / "11oz" / "PNG" / "PNG_FRONT_Cat_11oz.png")
+    assert flipped.getpixel((1, 0)) == (255, 0, 0)
+    assert (out / "Cat_FILES" / "11oz" / "SVG" / "SVG_FRONT_Cat_11oz.svg").exists()
+    assert (out / "Cat_FILES" / "instructions.pdf").read_bytes() == b"pdf"
+    assert (out / "Cat.zip").exists()
+
+
+def test_a_failed_flip_is_raised(design, tmp_path, monkeypatch):
+    png = design / "Cat_FILES" / "11oz" / "PNG_FRONT_Cat_11oz.png"
+    png.write_bytes(b"not a png")
+    with pytest.raises(Exception):
+        repackage(monkeypatch, design, tmp_path / "out")
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    """
+    Record the files copied, flipped and zipped, flipping on threads to see the calls
+    """
+    written = []
+    write_to = repackage_mugfiles.write_to
+    flip_image = repackage_mugfiles.flip_image
+    make_archive = shutil.make_archive
+    monkeypatch.setattr(repackage_mugfiles, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(
+        repackage_mugfiles,
+        "write_to",
+        lambda outdir, srcpath, *a: written.append(os.path.basename(srcpath))
+        or write_to(outdir, srcpath, *a),
+    )
+    monkeypatch.setattr(
+        repackage_mugfiles,
+        "flip_image",
+        lambda srcpath, destdir: written.append(os.path.basename(srcpath))
+        or flip_image(srcpath, destdir),
+    )
+    monkeypatch.setattr(
+        repackage_mugfiles.shutil,
+        "make_archive",
+        lambda name, *a: written.append(os.path.basename(name) + ".zip")
+        or make_archive(name, *a),
+    )
+    return written
+
+
+def test_unchanged_sources_are_not_written_again(design, tmp_path, monkeypatch, writes):
+    out = tmp_path / "out"
+    repackage(monkeypatch, design, out)
+    assert sorted(writes) == [
+        "Cat.zip",
+        "PNG_FRONT_Cat_11oz.png",
+        "SVG_FRONT_Cat_11oz.svg",
+        "instructions.pdf",
+    ]
+    writes.clear()
+    # touched but the same bytes
+    os.utime(design / "Cat_FILES" / "instructions.pdf", (0, 0))
+    repackage(monkeypatch, design, out)
+    assert writes == []
+
+
+def test_only_changed_designs_are_zipped_again(design, tmp_path, monkeypatch, writes):
+    (design / "Dog_FILES").mkdir()
+    (design / "Dog_FILES" / "instructions.pdf").write_bytes(b"dog")
+    out = tmp_path / "out"
+    repackage(monkeypatch, design, out)
+    writes.clear()
+    (design / "Dog_FILES" / "instructions.pdf").write_bytes(b"new dog")
+    repackage(monkeypatch, design, out)
+    assert writes == ["instructions.pdf", "Dog.zip"]
+
+
+def test_removed_sources_lose_their_outputs(design, tmp_path, monkeypatch, writes):
+    out = tmp_path / "out"
+    repackage(monkeypatch, design, out)
+    writes.clear()
+    (design / "Cat_FILES" / "11oz" / "SVG_FRONT_Cat_11oz.svg").unlink()
+    repackage(monkeypatch, design, out)
+    assert writes == ["Cat.zip"]
+    assert not (out / "Cat_FILES" / "11oz" / "SVG" / "SVG_FRONT_Cat_11oz.svg").exists()
+    with zipfile.ZipFile(out / "Cat.zip") as zf:
+        assert not any(name.endswith(".svg") for name in zf.namelist())
+
+
+def test_deleted_output_is_written_again(design, tmp_path, monkeypatch, writes):
+    out = tmp_path / "out"
+    repackage(monkeypatch, design, out)
+    writes.clear()
+    (out / "Cat_FILES" / "instructions.pdf").unlink()
+    repackage(monkeypatch, design, out)
+    assert writes == ["instructions.pdf", "Cat.zip"]
@@ -0,0 +1,84 @@
+import json
+import os
+import stat
+import threading
+
+from dkstudio import shop_storage
+
+
+def on_disk(storage):
+    path = storage / "config.json"
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def test_batch_coalesces_writes(storage, monkeypatch):
+    writes = []
+    replace = os.replace
+    monkeypatch.setattr(
+        shop_storage.os, "replace", lambda *a: writes.append(a) or replace(*a)
+    )
+    with shop_storage.batch():
+        shop_storage.set("a", 1)
+        shop_storage.update({"b": 2, "c": 3})
+        with shop_storage.batch():
+            shop_storage.set("d", 4)
+        assert on_disk(storage) == {}
+    assert len(writes) == 1
+    assert on_disk(storage) == {"a": 1, "b": 2, "c": 3, "d": 4}
+
+
+def test_unchanged_config_is_not_rewritten(storage, monkeypatch):
+    shop_storage.set("a", 1)
+    writes = []
+    monkeypatch.setattr(shop_storage.os, "replace", lambda *a: writes.append(a))
+    shop_storage.set("a", 1)
+    assert writes == []
+
+
+def test_concurrent_sets_are_all_kept(storage):
+    def worker(n):
+        for i in range(25):
+            shop_storage.set(f"key-{n}-{i}", i)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(on_disk(storage)) == 8 * 25
+
+
+def test_other_threads_are_not_blocked_by_a_batch(storage):
+    done = threading.Event()
+    with shop_storage.batch():
+        thread = threading.Thread(
+            target=lambda: (shop_storage.set("other", 1), done.set())
+        )
+        thread.start()
+        assert done.wait(5)
+        shop_storage.set("mine", 2)
+    thread.join()
+    assert on_disk(storage) == {"other": 1, "mine": 2}
+
+
+def test_config_keeps_its_mode(storage):
+    shop_storage.set("a", 1)
+    os.chmod(storage / "config.json", 0o644)
+    shop_storage.set("a", 2)
+    assert stat.S_IMODE(os.stat(storage / "config.json").st_mode) == 0o644
+
+
+def test_workspace_pick_is_written_once(storage, monkeypatch):
+    from dkstudio import ux
+
+    writes = []
+    replace = os.replace
+    monkeypatch.setattr(
+        shop_storage.os, "replace", lambda *a: writes.append(a) or replace(*a)
+    )
+    monkeypatch.setattr(ux, "askdirectory", lambda **kw: str(storage / "ws"))
+    assert ux.askworkspace() == str(storage / "ws")
+    assert len(writes) == 1
+    assert on_disk(storage) == {"workspace_path": str(storage / "ws")}
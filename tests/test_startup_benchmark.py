@@ -0,0 +1,23 @@
+import pytest
+
+from dkstudio.startup_benchmark import benchmark, pyproject_path, read_scripts
+
+SCRIPTS = read_scripts(pyproject_path())
+
+
+def test_every_script_is_read():
+    assert SCRIPTS["package-workspace"] == (
+        "dkstudio.package_products",
+        "package_workspace_main",
+    )
+    assert len(SCRIPTS) >= 10
+
+
+@pytest.mark.parametrize("name", sorted(SCRIPTS))
+def test_script_loads_no_unexpected_heavy_modules(name):
+    # the millisecond budget depends on the machine, startup-benchmark checks it
+    [result] = benchmark({name: SCRIPTS[name]}, repeat=1)
+    if "ModuleNotFoundError" in result.get("error", ""):
+        pytest.skip(f"{name} needs a dependency that is not installed")
+    assert "error" not in result, result["error"]
+    assert result["unexpected"] == []
@@ -0,0 +1,44 @@
+from dkstudio.shop_storage import INDEXES
+from dkstudio.storage_backends import JSONDirectoryBackend, SQLiteBackend, migrate
+
+RECORDS = {
+    "products": [
+        ("1", {"listing_id": 1, "title": "Cat Mug", "skus": ["CAT"], "tags": ["Cats"]}),
+        ("2", {"listing_id": 2, "title": "Dog Mug", "skus": [], "tags": []}),
+    ],
+    "etsy-product-dir": [("1", "/work/Cat_Mug_FILES")],
+}
+
+
+def contents(backend):
+    return {
+        namespace: sorted(backend.select_many(namespace))
+        for namespace in backend.namespaces()
+    }
+
+
+def test_json_to_sqlite_and_back(tmp_path):
+    source = JSONDirectoryBackend(str(tmp_path / "json"), INDEXES)
+    for namespace, items in RECORDS.items():
+        source.persist_many(namespace, items)
+
+    sqlite = SQLiteBackend(str(tmp_path / "store.sqlite3"), INDEXES)
+    migrate(source, sqlite, batch_size=1)
+    assert contents(sqlite) == contents(source)
+    assert sqlite.select_by_index("products", "sku", "CAT") == ["1"]
+    assert sqlite.select_by_index("products", "tag", "cats") == ["1"]
+
+    back = JSONDirectoryBackend(str(tmp_path / "json-again"), INDEXES)
+    migrate(sqlite, back)
+    assert contents(back) == contents(source)
+    assert back.select_by_index("products", "title", "Dog Mug") == ["2"]
+
+
+def test_migrate_overwrites_existing_records(tmp_path):
+    source = JSONDirectoryBackend(str(tmp_path / "json"), INDEXES)
+    source.persist("products", "1", {"title": "New Title", "skus": ["NEW"]})
+    destination = SQLiteBackend(str(tmp_path / "store.sqlite3"), INDEXES)
+    destination.persist("products", "1", {"title": "Old Title", "skus": ["OLD"]})
+    migrate(source, destination)
+    assert destination.select("products", "1")["title"] == "New Title"
+    assert destination.select_by_index("products", "sku", "OLD") == []
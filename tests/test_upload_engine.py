@@ -0,0 +1,158 @@
+import os
+
+import pytest
+import requests
+
+from dkstudio import shop_storage, upload_engine
+from dkstudio.marketplace import ApiError
+from dkstudio.upload_engine import UploadEngine, is_uploaded, record_uploaded_file
+
+
+@pytest.fixture
+def zip_path(tmp_path):
+    path = tmp_path / "Cat_Mug.zip"
+    path.write_bytes(b"PK zip bytes")
+    return str(path)
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    """
+    Record upload calls, failing with the errors queued in the returned list
+    """
+    calls = []
+    errors = []
+
+    def upload_product(shop_id, listing_id, zip_path):
+        calls.append(listing_id)
+        if errors:
+            raise errors.pop(0)
+        return {"listing_file_id": 77}
+
+    monkeypatch.setattr(upload_engine, "upload_product", upload_product)
+    monkeypatch.setattr(upload_engine, "retry_delay", lambda headers, attempt: 0)
+    return calls, errors
+
+
+def test_queue_survives_a_new_engine(zip_path):
+    UploadEngine(5).enqueue(123, zip_path)
+    jobs = UploadEngine(5).pending()
+    assert [(j["listing_id"], j["status"]) for j in jobs] == [("123", "pending")]
+    assert UploadEngine(6).pending() == []
+
+
+def test_uploaded_job_leaves_the_queue(zip_path, uploads):
+    calls, errors = uploads
+    engine = UploadEngine(5)
+    engine.enqueue(123, zip_path)
+    [job] = list(engine.run())
+    assert job["status"] == "uploaded"
+    assert calls == ["123"]
+    assert engine.pending() == []
+
+
+def test_unsent_and_throttled_uploads_are_retried(zip_path, uploads):
+    calls, errors = uploads
+    errors.extend([requests.exceptions.ConnectTimeout(), ApiError("busy", status=429)])
+    engine = UploadEngine(5, max_attempts=3)
+    job = engine.process(engine.enqueue(1, zip_path))
+    assert job["status"] == "uploaded"
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize(
+    "error",
+    [ApiError("down", status=503), requests.exceptions.ConnectionError("reset")],
+)
+def test_uploads_the_server_may_have_handled_are_not_retried(zip_path, uploads, error):
+    calls, errors = uploads
+    errors.append(error)
+    engine = UploadEngine(5, max_attempts=3)
+    job = engine.process(engine.enqueue(1, zip_path))
+    assert job["status"] == "failed"
+    assert len(calls) == 1
+
+
+def test_client_errors_fail_at_once_and_stay_queued(zip_path, uploads):
+    calls, errors = uploads
+    errors.append(ApiError("bad listing", status=400))
+    engine = UploadEngine(5, max_attempts=3)
+    job = engine.process(engine.enqueue(1, zip_path))
+    assert job["status"] == "failed"
+    assert len(calls) == 1
+    assert [j["error"] for j in engine.failed()] == ["bad listing"]
+
+    engine.retry_failed()
+    assert [j["listing_id"] for j in engine.pending()] == ["1"]
+    assert [j["status"] for j in engine.run()] == ["uploaded"]
+
+
+def test_gives_up_after_max_attempts(zip_path, uploads):
+    calls, errors = uploads
+    errors.extend([ApiError("busy", status=429)] * 5)
+    engine = UploadEngine(5, max_attempts=2)
+    job = engine.process(engine.enqueue(1, zip_path))
+    assert job["status"] == "failed"
+    assert len(calls) == 2
+
+
+def test_unchanged_zip_is_not_uploaded_again(zip_path, uploads):
+    calls, errors = uploads
+    engine = UploadEngine(5)
+    engine.process(engine.enqueue(1, zip_path))
+    # a repackage with the same bytes only changes the mtime
+    os.utime(zip_path, (1, 1))
+    job = engine.process(engine.enqueue(1, zip_path))
+    assert job["status"] == "skipped"
+    assert calls == ["1"]
+    job = engine.process(engine.enqueue(1, zip_path, force=True))
+    assert job["status"] == "uploaded"
+    assert calls == ["1", "1"]
+
+
+def test_dedupe_compares_contents(zip_path):
+    record_uploaded_file(1, zip_path, {"listing_file_id": 77})
+    assert is_uploaded(1, zip_path)
+    assert not is_uploaded(2, zip_path)
+    assert shop_storage.select("etsy-uploads", "1")["listing_file_id"] == 77
+
+    # same size, different bytes
+    with open(zip_path, "wb") as f:
+        f.write(b"PK zip BYTES")
+    assert not is_uploaded(1, zip_path)
+    with open(zip_path, "wb") as f:
+        f.write(b"PK longer zip bytes")
+    assert not is_uploaded(1, zip_path)
+
+
+class FakeFiles:
+    """
+    The listing files endpoints of one listing
+    """
+
+    def __init__(self, *zip_ids):
+        self.files = [
+            {"listing_file_id": i, "filetype": "application/zip"} for i in zip_ids
+        ]
+        self.deleted = []
+
+    def get(self, path):
+        return {"results": list(self.files)}
+
+    def post(self, path, data=None, headers=None):
+        self.files.append({"listing_file_id": 99, "filetype": "application/zip"})
+        return {"listing_file_id": 99}
+
+    def delete(self, path):
+        file_id = int(path.rsplit("/", 1)[1])
+        self.deleted.append(file_id)
+        self.files = [f for f in self.files if f["listing_file_id"] != file_id]
+
+
+def test_upload_removes_every_earlier_zip(zip_path, monkeypatch):
+    # 12 was attached by an upload that failed after the file was sent
+    files = FakeFiles(11, 12)
+    monkeypatch.setattr(upload_engine, "client", files)
+    assert upload_engine.upload_product(5, 1, zip_path) == {"listing_file_id": 99}
+    assert files.deleted == [11, 12]
+    assert [f["listing_file_id"] for f in files.files] == [99]
@@ -0,0 +1,106 @@
+import json
+import sys
+import zipfile
+
+import pytest
+
+from dkstudio import shop_storage, upload_engine, upload_pipeline
+from dkstudio.catalog import ProductCatalog
+
+
+def make_product(root, name, listing_id):
+    product = root / f"{name}_FILES"
+    product.mkdir(parents=True)
+    (product / f"FRONT_{name}_11oz.png").write_bytes(b"\x89PNG " + name.encode())
+    shop_storage.write_file_metadata(
+        str(product), {"etsy_listing_id": listing_id, "product_name": name}
+    )
+    return product
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    calls = []
+
+    def upload_product(shop_id, listing_id, zip_path):
+        calls.append((listing_id, zip_path))
+        return {"listing_file_id": 1}
+
+    monkeypatch.setattr(upload_engine, "upload_product", upload_product)
+    return calls
+
+
+def run_batch(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["upload-products-batch", *args])
+    upload_pipeline.main()
+
+
+def test_batch_packages_and_uploads_a_relative_workspace(
+    tmp_path, monkeypatch, uploads
+):
+    make_product(tmp_path / "ws" / "cat", "Cat_Mug", "1")
+    dog = make_product(tmp_path / "ws" / "dog", "Dog_Mug", "2")
+    # a zip made before manifests existed is stale and gets repackaged
+    with zipfile.ZipFile(dog.parent / "Dog_Mug.zip", "w") as zf:
+        zf.writestr("old.txt", "old")
+    monkeypatch.chdir(tmp_path)
+
+    run_batch(monkeypatch, "ws", "--shop-id", "5", "--report", "report.json")
+    assert sorted(uploads) == [
+        ("1", str(tmp_path / "ws" / "cat" / "Cat_Mug.zip")),
+        ("2", str(tmp_path / "ws" / "dog" / "Dog_Mug.zip")),
+    ]
+    with zipfile.ZipFile(tmp_path / "ws" / "dog" / "Dog_Mug.zip") as zf:
+        assert "Dog_Mug_FILES/FRONT_Dog_Mug_11oz.png" in zf.namelist()
+        assert "old.txt" not in zf.namelist()
+    report = json.load(open(tmp_path / "report.json"))
+    assert report["counts"] == {"uploaded": 2}
+
+    # nothing changed, so the second run uploads nothing
+    run_batch(monkeypatch, "ws", "--shop-id", "5", "--report", "report.json")
+    assert len(uploads) == 2
+    assert json.load(open(tmp_path / "report.json"))["counts"] == {"skipped": 2}
+
+
+def test_unmapped_products_are_skipped_or_fail_the_run(tmp_path, monkeypatch, uploads):
+    product = tmp_path / "ws" / "owl" / "Owl_Mug_FILES"
+    product.mkdir(parents=True)
+    (product / "design.svg").write_text("<svg/>")
+    monkeypatch.chdir(tmp_path)
+    run_batch(monkeypatch, "ws", "--shop-id", "5")
+    with pytest.raises(SystemExit) as exit:
+        run_batch(monkeypatch, "ws", "--shop-id", "5", "--unmapped", "fail")
+    assert exit.value.code == 2
+    assert uploads == []
+
+
+def test_pipeline_keeps_an_empty_shared_catalog(tmp_path):
+    catalog = ProductCatalog()
+    pipeline = upload_pipeline.UploadPipeline(
+        5, upload_pipeline.UploadPolicy(), catalog
+    )
+    assert pipeline.catalog is catalog
+    # listings synced into the app's catalog later map folders automatically
+    catalog.add({"listing_id": 7, "title": "Cat Mug", "skus": [], "tags": []})
+    product = tmp_path / "ws" / "cat" / "Cat_Mug_FILES"
+    product.mkdir(parents=True)
+    metadata = pipeline.lookup_listing(str(product))
+    assert metadata["etsy_listing_id"] == "7"
+    assert catalog.is_mapped("7")
+
+
+def test_a_changed_zip_is_hashed_once(tmp_path, monkeypatch, uploads):
+    make_product(tmp_path / "ws" / "cat", "Cat_Mug", "1")
+    monkeypatch.chdir(tmp_path)
+    run_batch(monkeypatch, "ws", "--shop-id", "5")
+    hashed = []
+    hash_file = upload_engine.hash_file
+    monkeypatch.setattr(
+        upload_engine, "hash_file", lambda path: hashed.append(path) or hash_file(path)
+    )
+    # same size, different bytes, so only a hash tells it apart
+    png = tmp_path / "ws" / "cat" / "Cat_Mug_FILES" / "FRONT_Cat_Mug_11oz.png"
+    png.write_bytes(png.read_bytes().upper())
+    run_batch(monkeypatch, "ws", "--shop-id", "5")
+    assert len(uploads) == 2
+    assert hashed == [str(tmp_path / "ws" / "cat" / "Cat_Mug.zip")]
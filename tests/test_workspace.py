@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from dkstudio import workspace
+from dkstudio.workspace import find_product_dirs, scan_workspace
+
+
+@pytest.fixture
+def ws(tmp_path):
+    for project, product in [("cat", "Cat_Mug"), ("dog", "Dog_Mug")]:
+        (tmp_path / "ws" / project / f"{product}_FILES").mkdir(parents=True)
+    (tmp_path / "ws" / "cat" / "Cat_Mug.zip").write_bytes(b"zip")
+    (tmp_path / "ws" / ".hidden" / "Owl_FILES").mkdir(parents=True)
+    return tmp_path / "ws"
+
+
+@pytest.fixture
+def listings(monkeypatch):
+    """
+    Count directory listings done by the scanner
+    """
+    listed = []
+    scan_dir = workspace.scan_dir
+    monkeypatch.setattr(
+        workspace, "scan_dir", lambda path: listed.append(path) or scan_dir(path)
+    )
+    return listed
+
+
+def test_finds_products_with_their_zips(ws):
+    entries = {os.path.basename(e.product_dir): e for e in scan_workspace(str(ws))}
+    assert sorted(entries) == ["Cat_Mug_FILES", "Dog_Mug_FILES"]
+    assert entries["Cat_Mug_FILES"].has_zip
+    assert entries["Cat_Mug_FILES"].zip_size == 3
+    assert not entries["Dog_Mug_FILES"].has_zip
+    assert entries["Dog_Mug_FILES"].project_dir == str(ws / "dog")
+
+
+def test_product_folder_is_its_own_workspace(ws):
+    assert find_product_dirs(str(ws / "cat" / "Cat_Mug_FILES")) == [
+        str(ws / "cat" / "Cat_Mug_FILES")
+    ]
+
+
+def test_unchanged_workspace_is_not_listed_again(ws, listings):
+    first = scan_workspace(str(ws))
+    count = len(listings)
+    assert scan_workspace(str(ws)) == first
+    assert len(listings) == count
+
+
+def test_added_product_and_rewritten_zip_are_seen(ws, listings):
+    scan_workspace(str(ws))
+    (ws / "cat" / "Cat_Mug.zip").write_bytes(b"bigger zip")
+    entries = {e.product_dir: e for e in scan_workspace(str(ws))}
+    assert entries[str(ws / "cat" / "Cat_Mug_FILES")].zip_size == 10
+
+    (ws / "owl" / "Owl_FILES").mkdir(parents=True)
+    count = len(listings)
+    assert str(ws / "owl" / "Owl_FILES") in find_product_dirs(str(ws))
+    assert len(listings) > count
+
+
+def test_paths_are_absolute_however_the_workspace_is_spelled(ws, monkeypatch):
+    monkeypatch.chdir(ws.parent)
+    relative = find_product_dirs("ws")
+    assert find_product_dirs(str(ws)) == relative
+    assert find_product_dirs("./ws/") == relative
+    assert relative == [
+        str(ws / "cat" / "Cat_Mug_FILES"),
+        str(ws / "dog" / "Dog_Mug_FILES"),
+    ]